@@ -17,8 +17,14 @@ from shiny import App, render, render_plot, ui, reactive
 from shinywidgets import output_widget, render_plotly
 
 
-from helpers import get_db_connection, load_sql_files, run_sql
-from db import ENGINE
+from helpers import load_sql_files, run_sql
+import metrics
+from storage import get_storage
+from query_cache import QUERY_CACHE
+from live_range import LiveHourlyRange, AUTO_REFRESH_SEC
+from downsample import downsample, plot_width, WEBGL_MIN_POINTS
+from sketches import range_quantiles, SKETCH_METRICS
+from sla import SLA_PROMISED_DOWNLOAD_MBPS
 
 #from helpers import db_connection
 from rich.console import Console
@@ -40,31 +46,36 @@ load_dotenv(env_file)
 # Connect to the data source 
 # Load database credentials from .env variable
 #===================================================================
-DRIVER = os.getenv("SQLSERVER_DRIVER", "ODBC Driver 18 for SQL Server")
-HOST = os.getenv("SQLSERVER_HOST", "127.0.0.1")
-PORT = os.getenv("SQLSERVER_PORT", "1433")
-DB = os.getenv("SQLSERVER_DB", "InternetSpeed_DB")
-UID = os.getenv("SQLSERVER_USER", "sa")
+# the rest of the connection settings are read by db.py
 PWD = os.getenv("SQLSERVER_PWD")
 
 
-if not PWD:
+# SQL Server by default; STORAGE_BACKEND=sqlite reads an embedded database
+STORAGE = get_storage()
+
+if STORAGE.name == "sqlserver" and not PWD:
     raise RuntimeError("Missing Database password in .env")
 
 
-conn = get_db_connection()
-conn.close()
+# opens the first pooled connection(s) now rather than on the first request
+STORAGE.warmup()
 console.print("Ok")
 
+# query timings as OpenMetrics on DASHBOARD_METRICS_PORT (0, the default, is off)
+metrics.serve(int(os.getenv("DASHBOARD_METRICS_PORT", "0")))
+
 
 #==========================================================
 # SQL queries to get data from the database
 #==========================================================
 
-SQL_LATEST = load_sql_files("01_latest.sql")
-SQL_RAW_RANGE = load_sql_files("02_raw_range.sql")
-SQL_HOURLY_MEDIANS = load_sql_files("03_median_speeds.sql")
-SQL_TIME_BOUNDS = load_sql_files("04_time_bounds.sql")
+SQL_LATEST = load_sql_files("01_latest.sql", STORAGE.dialect)
+SQL_RAW_RANGE = load_sql_files("02_raw_range.sql", STORAGE.dialect)
+SQL_HOURLY_MEDIANS = load_sql_files("07_hourly_speeds_range.sql", STORAGE.dialect)
+SQL_TIME_BOUNDS = load_sql_files("04_time_bounds.sql", STORAGE.dialect)
+
+# ranks shown in the Percentiles table
+PERCENTILES = (0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
 
 
 
@@ -95,6 +106,7 @@ app_ui = ui.page_sidebar(
             value = datetime.today().date()
             ),
         ui.input_action_button("refresh", "Refresh"),
+        ui.output_text("cache_stats"),
     ),
     ui.h2("Internet Speed Dashboard"),
     ui.layout_column_wrap(
@@ -112,6 +124,11 @@ app_ui = ui.page_sidebar(
     
     ui.hr(),
     
+    ui.h4("Percentiles"),
+    ui.output_ui("percentiles"),
+    
+    ui.hr(),
+    
     ui.h4("Raw Data"),
     ui.output_ui("table"),
     ui.include_css(RESOURCES_DIR / 'styles.css' )
@@ -132,6 +149,9 @@ def server(input, output, session):
     }
 
     refresh_tick = reactive.Value(0)
+
+    # this session's hourly frame, topped up with new facts on each refresh
+    live = LiveHourlyRange(STORAGE)
     
     @reactive.effect
     @reactive.event(input.refresh)
@@ -154,17 +174,29 @@ def server(input, output, session):
     def hourly_medians():
         # Reactive dependencies
         refresh_tick.get() 
+        if AUTO_REFRESH_SEC > 0:
+            reactive.invalidate_later(AUTO_REFRESH_SEC)
         params = range_params()
         
         if params is None:
             return pd.DataFrame()
         
-        # Use ENGINE directly to handle connection pooling automatically
-        df = run_sql(ENGINE, "03_median_speeds.sql", params=params)
+        # Reads the hourly rollup maintained on ingest rather than re-running
+        # PERCENTILE_CONT over every raw row (03_median_speeds.sql). A range
+        # is read once; refreshes fetch only facts past the last watermark
+        # and re-read the hours they fall in
+        return live.refresh(params)
+
+    @reactive.calc
+    def range_percentiles():
+        refresh_tick.get()
+        params = range_params()
+        if params is None:
+            return pd.DataFrame()
         
-        if not df.empty and "hour_bucket" in df.columns:
-            df["hour_bucket"] = pd.to_datetime(df["hour_bucket"], errors="coerce")
-        return df
+        # merged from the hourly t-digests (sketches.py), so any percentile
+        # over any range without reading the raw rows
+        return range_quantiles(STORAGE, params["start_dt"], params["end_dt"], quantiles=PERCENTILES)
 
     @reactive.calc
     def kpi_data():
@@ -251,6 +283,23 @@ def server(input, output, session):
             subtitles = "Relative to previous hour"
         )
     
+    @render.text
+    def cache_stats():
+        hourly_medians()  # re-render after every lookup
+        s = QUERY_CACHE.stats()
+        r = live.stats()
+        text = (
+            f"Query cache: {s['hits']} hits / {s['misses']} misses ({s['bytes'] / 1024:.0f} KB). "
+            f"Refreshes: {r['full']} full, {r['delta']} delta, {r['unchanged']} unchanged"
+        )
+        p = STORAGE.pool_stats()
+        if p:
+            text += (
+                f". Pool: {p['active']} active / {p['idle']} idle, "
+                f"wait {p['wait_ms_avg']:.1f} ms avg, connect {p['connect_ms_avg']:.0f} ms avg"
+            )
+        return text
+
     @render.ui
     def kpi_actual():
         
@@ -276,32 +325,30 @@ def server(input, output, session):
     def trend_plot():
         df = hourly_medians()
         
-        # DEBUG: CHECK types in terminal
-        print(df[['hour_bucket', METRIC_MAP[input.metric()]]].dtypes)
-        print(df.head())
-        
         if df.empty:
             return go.Figure().update_layout(title="No data for selected range")
         
         # Sort values to ensure line connects 
         
         df = df.sort_values("hour_bucket")
-        min_date = df["hour_bucket"].min()
-        max_date = df["hour_bucket"].max()
         
         metric_key = input.metric()
         col = METRIC_MAP[metric_key]
         unit = "ms" if metric_key == "latency_ms" else "Mbps"
         
-        x_data = df["hour_bucket"].tolist()
-        y_data = df[col].tolist()
+        # about one point per pixel however long the range; LTTB keeps the
+        # peaks and dips that plain striding would drop
+        shown = downsample(df, "hour_bucket", col, plot_width(session, "trend_plot"))
+        
+        # WebGL once the series is long enough for SVG to get slow
+        trace = go.Scattergl if len(shown) >= WEBGL_MIN_POINTS else go.Scatter
         
         fig = go.Figure()
         fig.add_trace(
-            go.Scatter(
-                x=x_data,
-                y=y_data,
-                mode="lines+markers",
+            trace(
+                x=shown["hour_bucket"].to_numpy(),
+                y=shown[col].to_numpy(),
+                mode="lines+markers" if len(shown) < 200 else "lines",
                 line=dict(width=3, color="#007bff"),
                 marker=dict(size=6),
                 connectgaps = True,
@@ -311,11 +358,11 @@ def server(input, output, session):
         
         if "mbps" in col:
             fig.add_hline(
-                y =35,
+                y = SLA_PROMISED_DOWNLOAD_MBPS,
                 line_dash = "dash",
                 line_color = "red",
                 line_width = 3,
-                annotation_text = "ISP Promise (35 Mbps)",
+                annotation_text = f"ISP Promise ({SLA_PROMISED_DOWNLOAD_MBPS:g} Mbps)",
                 annotation_position ="bottom right"
             )
         
@@ -342,6 +389,36 @@ def server(input, output, session):
         )
         return fig
 
+    @render.ui
+    def percentiles():
+        df = range_percentiles()
+        
+        if df.empty:
+            return ui.div("No sketches for the selected range yet (python sketches.py rebuild)")
+        
+        labels = {
+            "download_mbps": "Download (Mbps)",
+            "upload_mbps": "Upload (Mbps)",
+            "latency_ms": "Latency (ms)",
+        }
+        ranks = [f"p{q * 100:g}" for q in PERCENTILES]
+        row = df.iloc[0]
+        wide = pd.DataFrame([
+            {"metric": labels[m], **{r: row[f"{m}_{r}"] for r in ranks}}
+            for m in SKETCH_METRICS
+        ])
+        return (
+            GT(wide)
+            .tab_header(
+                title = "Percentiles over the selected range",
+                subtitle = f"{int(row['samples'])} speed tests, merged from hourly sketches"
+            )
+            .fmt_number(columns = ranks, decimals = 1)
+            .cols_label(metric = "")
+            .opt_table_outline()
+            .tab_options(table_width="80%")
+        )
+
     @render.ui
     def table():
         df = hourly_medians()
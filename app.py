@@ -7,7 +7,6 @@ import plotly.graph_objects as go
 from faicons import icon_svg
 
 import os
-import pyodbc
 
 
 from dotenv import load_dotenv
@@ -15,6 +14,10 @@ from sqlalchemy import create_engine, text
 from shiny import App, render, render_plot, ui, reactive
 
 #from helpers import db_connection
+import metrics
+from storage import get_storage
+from live_range import LiveRawRange, AUTO_REFRESH_SEC
+from downsample import downsample, plot_width
 from rich.console import Console
 
 console = Console()
@@ -30,32 +33,19 @@ load_dotenv(env_file)
 
 
 # Load database credentials from .env variable
-DRIVER = os.getenv("SQLSERVER_DRIVER", "ODBC Driver 18 for SQL Server")
-HOST = os.getenv("SQLSERVER_HOST", "127.0.0.1")
-PORT = os.getenv("SQLSERVER_PORT", "1433")
-DB = os.getenv("SQLSERVER_DB", "InternetSpeed_DB")
-UID = os.getenv("SQLSERVER_USER", "sa")
+# the rest of the connection settings are read by db.py
 PWD = os.getenv("SQLSERVER_PWD")
 
 
-if not PWD:
+# SQL Server by default; STORAGE_BACKEND=sqlite reads an embedded database
+STORAGE = get_storage()
+
+if STORAGE.name == "sqlserver" and not PWD:
     raise RuntimeError("Missing Database password in .env")
 
-def db_connection():
-    connection_string = (
-        f"DRIVER={{{DRIVER}}};"
-        f"SERVER={HOST},{PORT};"
-        f"DATABASE={DB};"
-        f"UID={UID};"
-        f"PWD={PWD};"
-        "TrustServerCertificate=yes;"
-        "Encrypt=yes;"
-        "Login Timeout=30;"
-        "Connect Timeout=30;"
-    )
-    
-    return pyodbc.connect(connection_string)
 
+# query timings as OpenMetrics on DASHBOARD_METRICS_PORT (0, the default, is off)
+metrics.serve(int(os.getenv("DASHBOARD_METRICS_PORT", "0")))
 
 # -----------------------------  UI --------------
 
@@ -84,39 +74,19 @@ app_ui = ui.page_fluid(
 
 # ------------------------------------------- Server ---------------------------
 def server(input, output, session):
-    
+
+    # this session's raw frame, topped up with new facts on each refresh
+    live = LiveRawRange(STORAGE)
+
     @reactive.calc
     def df():
         input.refresh() # manual refresh trigger
+        if AUTO_REFRESH_SEC > 0:
+            reactive.invalidate_later(AUTO_REFRESH_SEC)
         start = pd.to_datetime(input.start_date())
         end = pd.to_datetime(input.end_date()) + pd.Timedelta(days=1)
-        
-        query = """
-                SELECT
-                    t.local_tz,
-                    i.download_mbps,
-                    i.upload_mbps,
-                    i.latency_ms,
-                    i.jitter_ms
-                FROM dbo.internet_speeds i
-                JOIN dbo.time_metadata t ON i.measured_at_utc = t.time_id
-                WHERE t.local_tz >= ? AND t.local_tz < ?;             
-        """
-        
-        connection = None
-        
-        try: 
-            connection = db_connection()
-            data = pd.read_sql(query, connection, params=[start, end])
-  
-        
-            if not data.empty:
-                data["local_tz"] = pd.to_datetime(data["local_tz"])
-        
-            return data
-        finally:
-            if connection is not None:
-                connection.close()
+
+        return live.refresh({"start_dt": start.to_pydatetime(), "end_dt": end.to_pydatetime()})
                 
     @output
     @render.text
@@ -148,8 +118,13 @@ def server(input, output, session):
         
         fig, ax = plt.subplots()
         if not d.empty:
-            ax.plot(d["local_tz"], d["download_mbps"], label="Download")
-            ax.plot(d["local_tz"], d["upload_mbps"], label="Upload")
+            # min/max per pixel column: every spike stays visible without
+            # drawing points the figure has no room for
+            width = plot_width(session, "trend_plot")
+            down = downsample(d, "local_tz", "download_mbps", width, method="minmax")
+            up = downsample(d, "local_tz", "upload_mbps", width, method="minmax")
+            ax.plot(down["local_tz"], down["download_mbps"], label="Download")
+            ax.plot(up["local_tz"], up["upload_mbps"], label="Upload")
             ax.set_ylabel("Mbps")
             ax.set_xlabel("Time")
             ax.legend()
@@ -159,6 +134,6 @@ def server(input, output, session):
     @render.data_frame
 
     def table():
-        return df()
+        return df().drop(columns="id")
     
 app = App(app_ui, server)    
\ No newline at end of file
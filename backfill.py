@@ -0,0 +1,295 @@
+"""
+Backfill historical speedtest CLI output into the storage backend.
+
+    python backfill.py path/to/results/ --workers 8
+    python backfill.py old-results.zip --checkpoint backfill.json
+
+Accepts a directory (searched recursively), a .zip or a .tar(.gz) archive.
+A file may hold one `speedtest --format=json` result, a JSON list of results,
+or `--format=jsonl` output (only the "result" lines are used).
+"""
+import argparse
+import json
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+from rich.console import Console
+
+from enrichment import lookup_server
+from speedtest import transform_batch, batch_rows
+from storage import get_storage
+
+console = Console()
+load_dotenv()
+
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", str(os.cpu_count() or 2)))
+
+# files parsed per round: their rows are loaded in one transaction and the
+# checkpoint moves forward only once it has committed
+BACKFILL_FILES_PER_BATCH = int(os.getenv("BACKFILL_FILES_PER_BATCH", "2000"))
+
+RESULT_SUFFIXES = (".json", ".jsonl", ".txt")
+
+
+#==========================================================================
+#               discover result files in a directory or archive
+#==========================================================================
+def list_sources(source: Path) -> list[str]:
+    """_summary_
+    Every candidate file in a directory or zip, as references: a plain path,
+    or "archive::member" for a file inside a zip. A tar is not listed here;
+    iter_sources streams it in one pass instead.
+
+    Returns:
+        list[str]: references in a stable (sorted) order, so a checkpoint
+        from an earlier run lines up with this one
+    """
+    if source.is_dir():
+        return sorted(str(p) for p in source.rglob("*") if p.is_file() and p.suffix.lower() in RESULT_SUFFIXES)
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            names = [n for n in zf.namelist() if n.lower().endswith(RESULT_SUFFIXES)]
+        return sorted(f"{source}::{name}" for name in names)
+    return [str(source)]
+
+
+def iter_sources(source: Path, done: set[str]):
+    """_summary_
+    (ref, text) for every file not in done. Plain files are left for the
+    worker to read (text is None); archive members are read here, once each:
+    a zip through its central directory, a tar streamed front to back
+    (finding a member in a compressed tar means decompressing everything
+    before it, so opening it per member would be quadratic).
+
+    Yields:
+        tuple[str, str | None]: the reference and, for archive members, the contents
+    """
+    if not source.is_dir() and not zipfile.is_zipfile(source) and tarfile.is_tarfile(source):
+        with tarfile.open(source, mode="r|*") as tf:
+            for member in tf:
+                ref = f"{source}::{member.name}"
+                if member.isfile() and member.name.lower().endswith(RESULT_SUFFIXES) and ref not in done:
+                    yield ref, tf.extractfile(member).read().decode("utf-8", errors="replace")
+        return
+
+    refs = [ref for ref in list_sources(source) if ref not in done]
+    if source.is_dir() or not zipfile.is_zipfile(source):
+        yield from ((ref, None) for ref in refs)
+        return
+    with zipfile.ZipFile(source) as zf:
+        for ref in refs:
+            yield ref, zf.read(ref.split("::", 1)[1]).decode("utf-8", errors="replace")
+
+
+def _chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _raw_results(text: str) -> list[dict]:
+    """ the CLI result objects in one file, whichever output format it is """
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        doc = json.loads(text)
+        docs = doc if isinstance(doc, list) else [doc]
+    except json.JSONDecodeError:
+        docs = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith("{"):
+                try:
+                    docs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return [d for d in docs if isinstance(d, dict) and d.get("type", "result") == "result" and "result" in d]
+
+
+def parse_file(item: tuple[str, str | None]) -> tuple[str, list[dict], str | None]:
+    """_summary_
+    Transform one file with transform_batch. Runs in a worker process.
+
+    Args:
+        item: (ref, text) from iter_sources; a plain file is read here
+
+    Returns:
+        tuple: (ref, transformed rows, error message or None)
+    """
+    ref, text = item
+    try:
+        raws = _raw_results(text if text is not None else Path(ref).read_text(encoding="utf-8", errors="replace"))
+    except OSError as e:
+        return ref, [], str(e)
+    if not raws:
+        return ref, [], None
+    df, errors = transform_batch(raws)
+    error = "; ".join(f"result {e['index']}: {e['error']}" for e in errors) or None
+    return ref, batch_rows(df), error
+
+
+#==========================================================================
+#               checkpoint: files whose rows have been committed
+#==========================================================================
+def read_checkpoint(path: Path | None) -> set[str]:
+    if path is None or not path.exists():
+        return set()
+    return set(json.loads(path.read_text()).get("done", []))
+
+
+def write_checkpoint(path: Path | None, done: set[str]):
+    if path is None:
+        return
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps({"done": sorted(done)}))
+    os.replace(tmp, path)
+
+
+#==========================================================================
+#               enrichment once per distinct server, then bulk load
+#==========================================================================
+def pre_enrich(rows: list[dict], network: bool = True) -> int:
+    """_summary_
+    Look up each distinct server IP once and copy the coordinates onto every
+    row for that server, instead of one cache lookup per row
+
+    Returns:
+        int: number of distinct IPs looked up
+    """
+    ips = {r["server_ip"] for r in rows if r.get("server_latitude") is None and r.get("server_ip")}
+    info = {ip: lookup_server(ip, network=network) for ip in sorted(ips)}
+    for row in rows:
+        found = info.get(row.get("server_ip"))
+        if found and row.get("server_latitude") is None:
+            row["server_latitude"] = found.get("latitude")
+            row["server_longitude"] = found.get("longitude")
+    return len(ips)
+
+
+def load_rows(storage, conn, rows: list[dict]) -> tuple[int, set[str]]:
+    """_summary_
+    Load a chunk in one transaction; if that fails, row by row (as
+    spool.replay does) so one bad row does not fail the whole chunk. Each
+    retry goes through load_batch rather than load_one, which on SQL Server
+    swallows every error: a lost connection must stop the run, not be
+    counted against the rows.
+
+    Raises:
+        storage.disconnect_errors: the connection went away; nothing after
+        the last committed chunk is checkpointed
+
+    Returns:
+        tuple[int, set[str]]: (rows inserted, result_ids of the rows that failed on their own)
+    """
+    try:
+        return storage.load_batch(rows, conn), set()
+    except storage.disconnect_errors:
+        raise
+    except Exception as e:
+        console.print(f"[bold yellow]Batch of {len(rows)} failed ({e}) - retrying row by row[/]")
+    loaded, failed = 0, set()
+    for row in rows:
+        try:
+            loaded += storage.load_batch([row], conn)
+        except storage.disconnect_errors:
+            raise
+        except Exception as e:
+            failed.add(row["result_id"])
+            console.print(f"[yellow]{row.get('result_id')}: failed to load on its own ({e})[/]")
+    return loaded, failed
+
+
+def backfill(source: Path, workers: int = BACKFILL_WORKERS, files_per_batch: int = BACKFILL_FILES_PER_BATCH,
+             checkpoint: Path | None = None, network: bool = True, storage=None) -> dict:
+    """_summary_
+    Transform every result under source on a process pool and load them in
+    large transactions. Duplicate result_ids (the same test saved twice) are
+    dropped before loading, and the load itself is idempotent on result_id,
+    so re-running over files that were already imported adds nothing.
+
+    Args:
+        source (Path): directory, zip or tar archive
+        workers (int): transform processes
+        files_per_batch (int): files per load transaction
+        checkpoint (Path | None): JSON file of finished files, to resume from
+        network (bool): allow ipapi.co lookups for servers not in the cache
+        storage: backend to load into, storage.get_storage() by default
+
+    Returns:
+        dict: counts and throughput for the run
+    """
+    storage = storage or get_storage()
+    done = read_checkpoint(checkpoint)
+    stats = {"files": 0, "skipped_files": len(done), "rows": 0, "duplicates": 0, "failed_files": 0,
+             "failed_rows": 0, "loaded": 0}
+    seen: set[str] = set()
+    console.print(f"[cyan]Backfilling {source} ({len(done)} files already done)[/]")
+
+    started = time.perf_counter()
+    conn = storage.connect()
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            for chunk in _chunks(iter_sources(source, done), files_per_batch):
+                rows, source_of, incomplete = [], {}, set()
+                for ref, parsed, error in pool.map(parse_file, chunk, chunksize=32):
+                    if error:
+                        stats["failed_files"] += 1
+                        incomplete.add(ref)
+                        console.print(f"[yellow]{ref}: {error}[/]")
+                    for row in parsed:
+                        if row["result_id"] in seen:
+                            stats["duplicates"] += 1
+                            continue
+                        seen.add(row["result_id"])
+                        source_of[row["result_id"]] = ref
+                        rows.append(row)
+
+                pre_enrich(rows, network=network)
+                loaded, failed = load_rows(storage, conn, rows) if rows else (0, set())
+                incomplete.update(source_of[result_id] for result_id in failed)
+                stats["loaded"] += loaded
+                stats["failed_rows"] += len(failed)
+                stats["rows"] += len(rows)
+                stats["files"] += len(chunk)
+
+                # a file with a row that did not commit, or a record that did
+                # not parse, stays unchecked so a resume reads it again
+                done.update(ref for ref, _ in chunk if ref not in incomplete)
+                write_checkpoint(checkpoint, done)
+
+                elapsed = time.perf_counter() - started
+                console.print(
+                    f"[cyan]{stats['files']} files, {stats['rows']} rows, "
+                    f"{stats['files'] / elapsed:.1f} files/sec[/]"
+                )
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 2)
+    stats["files_per_sec"] = round(stats["files"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", type=Path, help="directory, .zip or .tar(.gz) of CLI output")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--files-per-batch", type=int, default=BACKFILL_FILES_PER_BATCH)
+    parser.add_argument("--checkpoint", type=Path, help="resume file, updated after every committed batch")
+    parser.add_argument("--offline", action="store_true", help="use cached server coordinates only")
+    args = parser.parse_args()
+
+    result = backfill(args.source, args.workers, args.files_per_batch, args.checkpoint, network=not args.offline)
+    console.print(result)
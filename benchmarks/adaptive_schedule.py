@@ -0,0 +1,169 @@
+"""
+What the adaptive schedule (scheduler.py) saves in bandwidth and what it
+costs in measurement error, replayed over synthetic history.
+
+    python -m benchmarks.adaptive_schedule --weeks 12 --every-min 5
+    python -m benchmarks.adaptive_schedule --cap-mb 20000 --max-interval-min 240
+
+One synthetic.py probe testing every --every-min minutes is the ground
+truth. The first --train-weeks build the hour-of-week profile; over the rest,
+the fixed cadence (COLLECTOR_INTERVAL_SEC) and the adaptive schedule each
+"measure" the first truth row at or after their next test time. Each
+schedule's samples are held until its next test and compared with every
+truth row:
+
+- mb: bytes the tests would have moved (download + upload at the measured
+  speed for SECONDS_PER_DIRECTION each)
+- mae_pct: mean absolute error of the held download, as % of the true mean
+- daily_mean_err_pct: mean error of each local day's average download
+- p5_err_pct: error of the 5th percentile download over the whole period
+- dips_missed / dip_delay_min: degraded stretches (download below half the
+  median for at least --dip-min minutes) with no test in them, and the mean
+  time from a dip's start to the first test inside it
+"""
+import argparse
+import json
+import statistics
+from datetime import timedelta, timezone
+
+import numpy as np
+
+import scheduler
+import synthetic
+from scheduler import AdaptiveScheduler, MB, profile_from_rows
+
+# Ookla runs each direction for roughly this long at full speed
+SECONDS_PER_DIRECTION = 10
+
+
+def test_bytes(row: dict) -> float:
+    return (row["download_mbps"] + row["upload_mbps"]) * 1_000_000 / 8 * SECONDS_PER_DIRECTION
+
+
+def run(truth: list[dict], next_interval) -> list[int]:
+    """ indices of the truth rows a schedule measures; next_interval(i) is the wait after row i """
+    taken, i = [], 0
+    times = [r["measured_at_utc"] for r in truth]
+    while i < len(truth):
+        taken.append(i)
+        due = times[i] + timedelta(seconds=next_interval(i))
+        while i < len(truth) and times[i] < due:
+            i += 1
+    return taken
+
+
+def dips(truth: list[dict], threshold: float, min_minutes: float) -> list[tuple[int, int]]:
+    """ [first, last] truth indices of stretches below threshold lasting min_minutes """
+    out, start = [], None
+    for i, r in enumerate(truth + [{"download_mbps": float("inf")}]):
+        if r["download_mbps"] < threshold:
+            start = i if start is None else start
+        elif start is not None:
+            span = (truth[i - 1]["measured_at_utc"] - truth[start]["measured_at_utc"]).total_seconds() / 60
+            if span >= min_minutes:
+                out.append((start, i - 1))
+            start = None
+    return out
+
+
+def score(truth: list[dict], taken: list[int], dip_spans: list[tuple[int, int]]) -> dict:
+    true = np.array([r["download_mbps"] for r in truth])
+    held = np.empty_like(true)
+    for k, i in enumerate(taken):
+        end = taken[k + 1] if k + 1 < len(taken) else len(truth)
+        held[i:end] = true[i]
+
+    days: dict = {}
+    for r in truth:
+        day = (r["measured_at_utc"] + timedelta(hours=synthetic.LOCAL_UTC_OFFSET_H)).date()
+        days.setdefault(day, ([], []))[0].append(r["download_mbps"])
+    for i in taken:
+        day = (truth[i]["measured_at_utc"] + timedelta(hours=synthetic.LOCAL_UTC_OFFSET_H)).date()
+        days[day][1].append(truth[i]["download_mbps"])
+    daily = [abs(np.mean(s) - np.mean(t)) / np.mean(t) for t, s in days.values() if s]
+
+    sampled = true[taken]
+    taken_set = np.array(taken)
+    delays, missed = [], 0
+    for first, last in dip_spans:
+        inside = taken_set[(taken_set >= first) & (taken_set <= last)]
+        if len(inside):
+            delays.append((truth[inside[0]]["measured_at_utc"] - truth[first]["measured_at_utc"]).total_seconds() / 60)
+        else:
+            missed += 1
+
+    return {
+        "tests": len(taken),
+        "mb": round(sum(test_bytes(truth[i]) for i in taken) / MB, 1),
+        "mae_pct": round(100 * float(np.mean(np.abs(held - true))) / float(true.mean()), 2),
+        "daily_mean_err_pct": round(100 * float(np.mean(daily)), 2),
+        "p5_err_pct": round(100 * abs(float(np.quantile(sampled, 0.05)) - float(np.quantile(true, 0.05)))
+                            / float(np.quantile(true, 0.05)), 2),
+        "dips": len(dip_spans),
+        "dips_missed": missed,
+        "dip_delay_min": round(statistics.mean(delays), 1) if delays else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--train-weeks", type=int, default=4)
+    parser.add_argument("--every-min", type=int, default=5, help="truth resolution")
+    parser.add_argument("--interval-min", type=float, default=scheduler.BASE_INTERVAL_SEC / 60,
+                        help="the fixed cadence, and the adaptive base")
+    parser.add_argument("--min-interval-min", type=float, default=scheduler.SCHEDULE_MIN_INTERVAL_SEC / 60)
+    parser.add_argument("--max-interval-min", type=float, default=scheduler.SCHEDULE_MAX_INTERVAL_SEC / 60)
+    parser.add_argument("--cap-mb", type=float, default=scheduler.SCHEDULE_DATA_CAP_MB, help="monthly data cap")
+    parser.add_argument("--dip-min", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    synthetic.console.quiet = True
+    scheduler.console.quiet = True
+
+    rows = [r for batch in synthetic.generate(years=args.weeks / 52.18, probes=1, servers_per_probe=4,
+                                              every_min=args.every_min, seed=args.seed) for r in batch]
+    for r in rows:
+        r["measured_at_utc"] = r["measured_at_utc"].astimezone(timezone.utc)
+    split = rows[0]["measured_at_utc"] + timedelta(weeks=args.train_weeks)
+    train = [r for r in rows if r["measured_at_utc"] < split]
+    truth = [r for r in rows if r["measured_at_utc"] >= split]
+
+    base = args.interval_min * 60
+    fixed = run(truth, lambda i: base)
+
+    adaptive = AdaptiveScheduler(base=base, min_interval=args.min_interval_min * 60,
+                                 max_interval=args.max_interval_min * 60, cap_mb=args.cap_mb,
+                                 profile=profile_from_rows(train))
+    reasons: dict = {}
+
+    def adaptive_next(i: int) -> float:
+        at = truth[i]["measured_at_utc"]
+        adaptive.observe([truth[i]], test_bytes(truth[i]), at)
+        interval = adaptive.next_interval(at)
+        reasons[adaptive.last_reason] = reasons.get(adaptive.last_reason, 0) + 1
+        return interval
+
+    chosen = run(truth, adaptive_next)
+
+    threshold = 0.5 * statistics.median(r["download_mbps"] for r in truth)
+    dip_spans = dips(truth, threshold, args.dip_min)
+    report = {
+        "truth_rows": len(truth),
+        "weeks_scored": args.weeks - args.train_weeks,
+        "profile_hours": len(adaptive.profile),
+        "quietest_hour_of_week": min(adaptive.profile, key=adaptive.profile.get) if adaptive.profile else None,
+        "fixed": score(truth, fixed, dip_spans),
+        "adaptive": score(truth, chosen, dip_spans),
+        "adaptive_wait_reasons": reasons,
+    }
+    f, a = report["fixed"], report["adaptive"]
+    report["saved_mb"] = round(f["mb"] - a["mb"], 1)
+    report["saved_pct"] = round(100 * (f["mb"] - a["mb"]) / f["mb"], 1) if f["mb"] else None
+    report["extra_mae_pct"] = round(a["mae_pct"] - f["mae_pct"], 2)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
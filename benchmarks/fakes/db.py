@@ -0,0 +1,53 @@
+"""
+DB-API stand-in that records statements instead of sending them anywhere.
+Used to count the statements (round trips) ingest issues per row and to time
+the Python side of ingest without a SQL Server.
+"""
+
+
+class RecordingCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+        self.fast_executemany = False
+
+    def execute(self, sql, params=()):
+        self.connection.statements.append((sql, 1))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        # one parameter array is one round trip with fast_executemany
+        rows = len(list(seq_of_params))
+        self.connection.statements.append((sql, rows))
+        return self
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.statements: list[tuple[str, int]] = []
+        self.autocommit = False
+        self.commits = 0
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,50 @@
+"""
+Local stand-in for ipapi.co, served from a background thread.
+
+    server, base_url = start_fake_ipapi()
+    ...  # point speedtest.IPAPI_BASE_URL (or IPAPI_BASE_URL) at base_url
+    server.shutdown()
+
+Set server.status to 429 (or anything else) to make every request fail with
+that status; server.requests counts the calls that reached it.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        ip = self.path.strip("/").split("/")[0]
+
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            if self.server.status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+
+        body = json.dumps({
+            "ip": ip,
+            "city": "Maseru",
+            "country_name": "Lesotho",
+            "latitude": -29.3167,
+            "longitude": 27.4833,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_ipapi(status: int = 200) -> tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.status = status
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,118 @@
+"""
+Dashboard query latency: PERCENTILE_CONT over raw rows (03_median_speeds.sql)
+against the hourly rollup (07_hourly_speeds_range.sql) at 1, 12 and 36 months
+of history.
+
+    python -m benchmarks.hourly_rollup --every-min 15 --repeat 3
+
+Synthetic rows are inserted into the database in .env far in the past (1990)
+so they cannot overlap real measurements. Everything is written in one
+transaction that is rolled back at the end.
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from helpers import load_sql_files, time_dim_frame, time_dim_rows, TIME_DIM_COLUMNS
+from db import get_db_connection
+
+BENCH_START = datetime(1990, 1, 1, tzinfo=timezone.utc)
+BENCH_SERVERS = (990_001, 990_002, 990_003)
+HORIZONS_MONTHS = (1, 12, 36)
+
+
+def seed(cursor, months: int, every_min: int) -> int:
+    """ insert months of measurements every every_min minutes, rotating servers """
+    n = int(months * 30.4 * 24 * 60 / every_min)
+    stamps = [BENCH_START + timedelta(minutes=every_min * i) for i in range(n)]
+    rng = np.random.default_rng(42)
+    run = uuid.uuid4().hex[:8]
+
+    cursor.fast_executemany = True
+    cursor.executemany(
+        "INSERT INTO dbo.servers (server_id, server_name, server_host) VALUES (?, ?, ?)",
+        [(s, f"bench-{s}", "bench.invalid") for s in BENCH_SERVERS],
+    )
+    cursor.executemany(
+        f"INSERT INTO dbo.time_metadata ({', '.join(TIME_DIM_COLUMNS)}) VALUES ({', '.join(['?'] * len(TIME_DIM_COLUMNS))})",
+        time_dim_rows(time_dim_frame(stamps)),
+    )
+    result_ids = [f"bench-{run}-{i}" for i in range(n)]
+    cursor.executemany(
+        "INSERT INTO dbo.result_metadata (result_id, measured_at_utc) VALUES (?, ?)",
+        list(zip(result_ids, stamps)),
+    )
+    down = rng.normal(40, 8, n).clip(1)
+    up = rng.normal(12, 3, n).clip(0.5)
+    lat = rng.gamma(4, 5, n)
+    cursor.executemany(
+        """INSERT INTO dbo.internet_speeds
+           (result_id, server_id, measured_at_utc, download_mbps, upload_mbps, latency_ms)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        [
+            (result_ids[i], BENCH_SERVERS[i % len(BENCH_SERVERS)], stamps[i],
+             round(float(down[i]), 3), round(float(up[i]), 3), round(float(lat[i]), 3))
+            for i in range(n)
+        ],
+    )
+    cursor.fast_executemany = False
+    return n
+
+
+def time_query(cursor, sql: str, params: tuple, repeat: int) -> tuple[float, int]:
+    """ median milliseconds over repeat runs, and the number of rows returned """
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(cursor.execute(sql, params).fetchall())
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--every-min", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # both files use named binds for SQLAlchemy; pyodbc wants ?
+    raw_sql = load_sql_files("03_median_speeds.sql").replace(":start_dt", "?").replace(":end_dt", "?")
+    rollup_sql = load_sql_files("07_hourly_speeds_range.sql").replace(":start_dt", "?").replace(":end_dt", "?")
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    results = []
+    try:
+        rows = seed(cursor, max(HORIZONS_MONTHS), args.every_min)
+
+        started = time.perf_counter()
+        cursor.execute("EXEC dbo.usp_refresh_hourly_speeds ?, ?", (datetime(1989, 12, 31), datetime(1994, 1, 1)))
+        build_ms = (time.perf_counter() - started) * 1000
+
+        local_start = datetime(1990, 1, 1, 2)  # Africa/Maseru is UTC+2
+        for months in HORIZONS_MONTHS:
+            params = (local_start, local_start + timedelta(days=round(months * 30.4)))
+            raw_ms, raw_rows = time_query(cursor, raw_sql, params, args.repeat)
+            rollup_ms, rollup_rows = time_query(cursor, rollup_sql, params, args.repeat)
+            results.append({
+                "months": months,
+                "raw_percentile_ms": round(raw_ms, 2),
+                "rollup_ms": round(rollup_ms, 2),
+                "raw_hours": raw_rows,
+                "rollup_hours": rollup_rows,
+            })
+    finally:
+        conn.rollback()
+        conn.close()
+
+    print(json.dumps({"seeded_rows": rows, "rollup_build_ms": round(build_ms, 2), "queries": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Load test for ingest_service.py: hundreds of simulated probes posting
+batches at once to a local instance.
+
+    python -m benchmarks.ingest_fleet --probes 300 --batches 5 --rows 20
+    python -m benchmarks.ingest_fleet --probes 300 --slow-db-ms 400 --queue-max-rows 2000
+
+The service runs in-process on a free port and commits to a throwaway SQLite
+database (or to the STORAGE_BACKEND backend with --backend). --slow-db-ms
+adds a delay to every commit, standing in for a slow database, to show
+the backpressure: probes that get a 503 wait for the Retry-After (capped
+by --max-backoff) and send the same batch again, as the spool replay would.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+import ingest_service
+import speedtest
+import storage
+from spool import encode_row
+
+BENCH_DIR = Path(__file__).resolve().parent
+FIXTURE = BENCH_DIR / "fixtures" / "speedtest_result.json"
+
+
+class SlowStorage:
+    """ delegates to a backend, sleeping before every load """
+    def __init__(self, inner, delay_sec: float):
+        self.inner = inner
+        self.delay_sec = delay_sec
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def load_batch(self, rows, conn):
+        time.sleep(self.delay_sec)
+        return self.inner.load_batch(rows, conn)
+
+
+def probe_batches(probe: int, batches: int, rows: int, template: dict, start: datetime) -> list[bytes]:
+    """ request bodies for one probe, each row with its own result_id and timestamp """
+    out = []
+    for b in range(batches):
+        body = []
+        for r in range(rows):
+            i = (probe * batches + b) * rows + r
+            body.append(encode_row(dict(
+                template, result_id=f"fleet-{probe}-{b}-{r}",
+                measured_at_utc=start + timedelta(milliseconds=i),
+                download_mbps=round(random.uniform(5, 60), 3),
+            )))
+        out.append(('{"rows": [' + ", ".join(body) + "]}").encode())
+    return out
+
+
+async def run_probe(session, url: str, probe_id: str, token: str, bodies: list[bytes], max_backoff: float,
+                    latencies: list, counts: dict):
+    headers = {"X-Probe-Id": probe_id, "Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    await asyncio.sleep(random.uniform(0, 0.5))
+    for body in bodies:
+        while True:
+            started = time.perf_counter()
+            async with session.post(f"{url}/v1/results", data=body, headers=headers) as resp:
+                await resp.read()
+                if resp.status == 200:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    counts["ok"] += 1
+                    break
+                if resp.status == 503:
+                    counts["busy"] += 1
+                    await asyncio.sleep(min(float(resp.headers.get("Retry-After", "1")), max_backoff))
+                    continue
+                counts["failed"] += 1
+                break
+
+
+async def main_async(args) -> dict:
+    if args.backend:
+        backend = storage.get_storage(args.backend)
+    else:
+        backend = storage.SqliteStorage(Path(tempfile.mkdtemp()) / "fleet.db")
+    if args.slow_db_ms:
+        backend = SlowStorage(backend, args.slow_db_ms / 1000)
+
+    tokens = {f"probe-{p:04d}": f"token-{p}" for p in range(args.probes)}
+    probes = {probe_id: ingest_service._digest(token) for probe_id, token in tokens.items()}
+    app = ingest_service.make_app(backend, probes, max_rows=args.group_max_rows,
+                                  max_wait_ms=args.group_max_wait_ms, queue_max_rows=args.queue_max_rows)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+    template = speedtest.transform(json.loads(FIXTURE.read_text()))
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    latencies: list[float] = []
+    counts = {"ok": 0, "busy": 0, "failed": 0}
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.probes)) as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                run_probe(session, url, probe_id, tokens[probe_id],
+                          probe_batches(p, args.batches, args.rows, template, start),
+                          args.max_backoff, latencies, counts)
+                for p, probe_id in enumerate(tokens)
+            ))
+            elapsed = time.perf_counter() - started
+        committer = app[ingest_service.COMMITTER].stats()
+    finally:
+        await runner.cleanup()
+
+    rows = counts["ok"] * args.rows
+    latencies.sort()
+
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 1) if latencies else None
+
+    return {
+        "probes": args.probes,
+        "batches_ok": counts["ok"],
+        "batches_503": counts["busy"],
+        "batches_failed": counts["failed"],
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(rows / elapsed, 1),
+        "request_ms_p50": round(statistics.median(latencies), 1) if latencies else None,
+        "request_ms_p95": pct(0.95),
+        "request_ms_p99": pct(0.99),
+        "group_commits": committer["groups"],
+        "avg_group_rows": committer["avg_group_rows"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--probes", type=int, default=300)
+    parser.add_argument("--batches", type=int, default=5, help="batches each probe sends")
+    parser.add_argument("--rows", type=int, default=20, help="rows per batch")
+    parser.add_argument("--backend", help="commit to this STORAGE_BACKEND instead of a temporary SQLite file")
+    parser.add_argument("--slow-db-ms", type=float, default=0, help="extra delay per commit")
+    parser.add_argument("--group-max-rows", type=int, default=ingest_service.INGEST_GROUP_MAX_ROWS)
+    parser.add_argument("--group-max-wait-ms", type=float, default=ingest_service.INGEST_GROUP_MAX_WAIT_MS)
+    parser.add_argument("--queue-max-rows", type=int, default=ingest_service.INGEST_QUEUE_MAX_ROWS)
+    parser.add_argument("--max-backoff", type=float, default=2.0, help="cap on a probe's Retry-After wait")
+    args = parser.parse_args()
+
+    for module in (ingest_service, storage, speedtest):
+        module.console.quiet = True
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
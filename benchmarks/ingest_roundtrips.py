@@ -0,0 +1,132 @@
+"""
+Statements and milliseconds per ingested row, before and after the single
+round-trip ingest procedure.
+
+    python -m benchmarks.ingest_roundtrips --rows 200
+
+Runs against the database in .env. Everything is written inside one
+transaction that is rolled back at the end, so no benchmark rows are kept.
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import helpers
+import ingest
+from db import get_db_connection
+from ingest import insert_result, insert_result_statements, ingest_params, enrich_server
+
+
+class CountingCursor:
+    """ wraps a pyodbc cursor and counts the calls that go to the server """
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.statements = 0
+
+    def execute(self, *args, **kwargs):
+        self.statements += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        # with fast_executemany the whole parameter array is one round trip
+        self.statements += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name in ("_cursor", "statements"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+
+def make_rows(n: int, servers: int = 3) -> list[dict]:
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=3650)
+    run = uuid.uuid4().hex[:8]
+    return [
+        {
+            "measured_at_utc": start + timedelta(seconds=i),
+            "download_mbps": 40.0 + i % 7,
+            "upload_mbps": 10.0 + i % 3,
+            "latency_ms": 12.5,
+            "jitter_ms": 1.2,
+            "packet_loss_pct": 0.0,
+            "isp": "Bench ISP",
+            "server_id": 990_000 + i % servers,
+            "server_name": "bench",
+            "server_location": "Maseru",
+            "server_host": "bench.invalid",
+            "server_country": "Lesotho",
+            "server_ip": "",
+            "server_port": 8080,
+            "result_id": f"bench-{run}-{i}",
+            "result_url": "",
+            "result_persisted": False,
+            "server_latitude": None,
+            "server_longitude": None,
+        }
+        for i in range(n)
+    ]
+
+
+def _reset_caches():
+    ingest.KNOWN_SERVERS.clear()
+    ingest._servers_primed = False
+    helpers.KNOWN_TIME_IDS.clear()
+
+
+def run_mode(conn, mode: str, rows: list[dict]) -> dict:
+    _reset_caches()
+    cursor = CountingCursor(conn.cursor())
+    started = time.perf_counter()
+
+    if mode == "statements":
+        for row in rows:
+            insert_result_statements(cursor, dict(row))
+    elif mode == "procedure":
+        for row in rows:
+            insert_result(cursor, dict(row))
+    elif mode == "procedure_batch":
+        ingest.prime_known_servers(cursor)
+        enriched = [enrich_server(cursor=cursor, data=dict(row)) for row in rows]
+        frame = helpers.time_dim_frame(row["measured_at_utc"] for row in enriched)
+        times = {helpers.time_key(r[0]): r for r in helpers.time_dim_rows(frame)}
+        cursor.fast_executemany = True
+        cursor.executemany(
+            ingest.INGEST_PROC,
+            [ingest_params(row, times[helpers.time_key(row["measured_at_utc"])]) for row in enriched],
+        )
+
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "rows": len(rows),
+        "statements": cursor.statements,
+        "statements_per_row": round(cursor.statements / len(rows), 3),
+        "ms_per_row": round(elapsed * 1000 / len(rows), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    results = []
+    try:
+        for mode in ("statements", "procedure", "procedure_batch"):
+            results.append(run_mode(conn, mode, make_rows(args.rows)))
+    finally:
+        conn.rollback()
+        conn.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
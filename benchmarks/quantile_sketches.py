@@ -0,0 +1,100 @@
+"""
+Range percentiles from the hourly t-digests (sketches.py) against exact
+percentiles over the raw rows, on synthetic history.
+
+    python -m benchmarks.quantile_sketches --years 1 --probes 10
+
+Loads synthetic.py history into a throwaway SQLite database through the
+normal batch ingest, so the sketches are the ones ingest maintains. For
+windows of a week up to the whole history it times both ways and reports
+the error of each sketch percentile, in value and in rank.
+"""
+import argparse
+import bisect
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+import sketches
+import storage
+import synthetic
+
+QUANTILES = (0.05, 0.5, 0.95, 0.99)
+WINDOWS_DAYS = (7, 30, 91, 365)
+
+EXACT = """
+    SELECT i.download_mbps, i.upload_mbps, i.latency_ms
+    FROM internet_speeds i JOIN time_metadata t ON i.measured_at_utc = t.time_id
+    WHERE t.local_tz >= ? AND t.local_tz < ?
+"""
+
+
+def exact(conn, start_dt: datetime, end_dt: datetime) -> dict:
+    rows = conn.execute(EXACT, (start_dt, end_dt)).fetchall()
+    columns = np.array(rows, dtype=float).T if rows else np.empty((3, 0))
+    return {metric: np.sort(col[~np.isnan(col)]) for metric, col in zip(sketches.SKETCH_METRICS, columns)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--probes", type=int, default=10)
+    parser.add_argument("--every-min", type=int, default=15)
+    args = parser.parse_args()
+
+    for module in (storage, synthetic, sketches):
+        module.console.quiet = True
+
+    backend = storage.SqliteStorage(Path(tempfile.mkdtemp()) / "sketches.db")
+    end = datetime(2020, 1, 1)
+    loaded = synthetic.load(backend, years=args.years, probes=args.probes, every_min=args.every_min,
+                            start=(end - timedelta(days=365 * args.years)).replace(tzinfo=timezone.utc))
+
+    report = {"rows": loaded["rows"], "load_seconds": loaded["seconds"], "windows": []}
+    conn = backend.connect()
+    try:
+        for days in WINDOWS_DAYS:
+            if days > 365 * args.years:
+                break
+            start_dt = end - timedelta(days=days)
+
+            started = time.perf_counter()
+            truth = exact(conn, start_dt, end)
+            exact_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            approx = sketches.range_quantiles(backend, start_dt, end, QUANTILES)
+            sketch_ms = (time.perf_counter() - started) * 1000
+
+            errors = {}
+            for metric, values in truth.items():
+                for q in QUANTILES:
+                    if not len(values):
+                        continue
+                    estimate = approx.iloc[0][f"{metric}_p{q * 100:g}"]
+                    true = float(np.quantile(values, q))
+                    rank = bisect.bisect_left(values.tolist(), estimate) / len(values)
+                    errors[f"{metric}_p{q * 100:g}"] = {
+                        "exact": round(true, 3), "sketch": round(float(estimate), 3),
+                        "rel_error": round(abs(estimate - true) / true, 4) if true else None,
+                        "rank_error": round(abs(rank - q), 4),
+                    }
+            report["windows"].append({
+                "days": days,
+                "rows": int(approx.iloc[0]["samples"]) if not approx.empty else 0,
+                "exact_ms": round(exact_ms, 1),
+                "sketch_ms": round(sketch_ms, 1),
+                "percentiles": errors,
+            })
+    finally:
+        conn.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Dashboard range-query latency with and without the fact indexes from
+sql/12_fact_indexes.sql, at a realistic history size.
+
+    python -m benchmarks.range_queries --months 36 --every-min 15 --repeat 5
+
+15-minute tests for three years is about 105k facts per probe; lower
+--every-min to stand in for a fleet (1 minute ~ 1.6M rows). Each query is
+timed with the indexes in place, then again with them disabled, both inside
+the one transaction that holds the synthetic rows, and everything (the
+rows and the disabling) is rolled back at the end. Synthetic rows are
+placed in 1990, as in benchmarks/hourly_rollup.py.
+"""
+import argparse
+import json
+import re
+from datetime import timedelta
+
+from helpers import load_sql_files
+from db import get_db_connection
+from benchmarks.hourly_rollup import BENCH_START, seed, time_query
+
+# created by 12_fact_indexes.sql (and 00_DDL.sql on new installs)
+FACT_INDEXES = (
+    ("dbo.time_metadata", "IX_time_metadata_local_tz"),
+    ("dbo.internet_speeds", "IX_internet_speeds_measured_at_utc"),
+    ("dbo.internet_speeds", "UX_internet_speeds_result_id"),
+    # stands in for the unique index while old duplicate result_ids remain
+    ("dbo.internet_speeds", "IX_internet_speeds_result_id"),
+)
+
+# local-time windows ending at the newest synthetic fact
+WINDOWS_DAYS = (1, 7, 30, 365)
+
+
+def positional(sql: str, params: dict) -> tuple[str, tuple]:
+    """ rewrite :name binds (SQLAlchemy style) to pyodbc's ? with the values in order """
+    sql = re.sub(r"--[^\n]*", "", sql)
+    names = re.findall(r"(?<![:\w]):(\w+)", sql)
+    return re.sub(r"(?<![:\w]):(\w+)", "?", sql), tuple(params[n] for n in names)
+
+
+def present_indexes(cursor) -> list[str]:
+    names = [name for _, name in FACT_INDEXES]
+    rows = cursor.execute(
+        f"SELECT name FROM sys.indexes WHERE is_disabled = 0 AND name IN ({', '.join('?' * len(names))})", names
+    ).fetchall()
+    return sorted(r[0] for r in rows)
+
+
+def disable_indexes(cursor, names: list[str]):
+    """ disable the given fact indexes; the caller's rollback brings them back """
+    for table, name in FACT_INDEXES:
+        if name in names:
+            cursor.execute(f"ALTER INDEX {name} ON {table} DISABLE")
+
+
+def run_queries(cursor, end_local, watermark: int, repeat: int) -> dict:
+    """ median ms and rows for each dashboard query over each window """
+    out = {}
+    raw_range = load_sql_files("02_raw_range.sql")
+    medians = load_sql_files("03_median_speeds.sql")
+    since = load_sql_files("11_raw_since.sql")
+
+    for days in WINDOWS_DAYS:
+        window = {"start_dt": end_local - timedelta(days=days), "end_dt": end_local}
+        ms, rows = time_query(cursor, raw_range, (window["start_dt"], window["end_dt"]), repeat)
+        out[f"raw_range_{days}d"] = {"ms": round(ms, 2), "rows": rows}
+        if days <= 30:
+            sql, params = positional(medians, window)
+            ms, rows = time_query(cursor, sql, params, repeat)
+            out[f"median_speeds_{days}d"] = {"ms": round(ms, 2), "rows": rows}
+
+    # a dashboard refresh after the last hour's facts landed
+    sql, params = positional(since, {
+        "after_id": watermark - 4, "upto_id": watermark,
+        "start_dt": end_local - timedelta(days=7), "end_dt": end_local,
+    })
+    ms, rows = time_query(cursor, sql, params, repeat)
+    out["raw_since_delta"] = {"ms": round(ms, 2), "rows": rows}
+
+    # the idempotency check usp_ingest_result runs for every result
+    result_id = cursor.execute("SELECT result_id FROM dbo.internet_speeds WHERE id = ?", watermark).fetchone()[0]
+    ms, rows = time_query(cursor, "SELECT 1 FROM dbo.internet_speeds WHERE result_id = ?", (result_id,), repeat)
+    out["result_id_lookup"] = {"ms": round(ms, 3), "rows": rows}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--every-min", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        indexes = present_indexes(cursor)
+        rows = seed(cursor, args.months, args.every_min)
+        watermark = cursor.execute("SELECT MAX(id) FROM dbo.internet_speeds").fetchone()[0]
+        end_local = BENCH_START.replace(tzinfo=None) + timedelta(hours=2) + timedelta(minutes=args.every_min * rows)
+        cursor.execute("UPDATE STATISTICS dbo.internet_speeds; UPDATE STATISTICS dbo.time_metadata;")
+
+        indexed = run_queries(cursor, end_local, watermark, args.repeat)
+        disable_indexes(cursor, indexes)
+        scanned = run_queries(cursor, end_local, watermark, args.repeat)
+    finally:
+        conn.rollback()
+        conn.close()
+
+    report = {
+        "seeded_rows": rows,
+        "indexes_present": indexes,
+        "indexes_missing": sorted({name for _, name in FACT_INDEXES} - set(indexes)),
+        "queries": {
+            name: {
+                "indexed_ms": indexed[name]["ms"],
+                "without_indexes_ms": scanned[name]["ms"],
+                "speedup": round(scanned[name]["ms"] / indexed[name]["ms"], 1) if indexed[name]["ms"] else None,
+                "rows": indexed[name]["rows"],
+            }
+            for name in indexed
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
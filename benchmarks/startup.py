@@ -0,0 +1,109 @@
+"""
+Import-time budget for the collector entry point.
+
+The collector runs as a short cron job, so everything push.py imports
+before the speedtest starts is paid on every cycle. This check imports it
+in fresh interpreters and fails when the cold start goes over budget or
+when a heavy module that only replay/dashboards need creeps onto the path.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget-ms 150 --runs 7 --top 20
+
+Exits 1 on a violation, so it can gate CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "250"))
+
+# loaded later by replay() or only by the dashboards - never before the measurement
+FORBIDDEN = ("pandas", "numpy", "sqlalchemy", "holidays", "pyodbc", "requests", "pyarrow", "plotly")
+
+
+def _interpreter(code: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    return subprocess.run(cmd + ["-c", code], cwd=PROJECT_DIR, capture_output=True, text=True)
+
+
+def import_profile(module: str) -> list[dict]:
+    """_summary_
+    Per-module import cost of `import module` in a fresh interpreter,
+    parsed from the -X importtime report on stderr
+
+    Returns:
+        list[dict]: {"module", "self_us", "cumulative_us"} for every module imported
+    """
+    proc = _interpreter(f"import {module}", importtime=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip()}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return rows
+
+
+def cold_start_ms(module: str, runs: int) -> list[float]:
+    """ wall-clock of a fresh interpreter importing module, minus one importing nothing """
+    def timed(code):
+        started = time.perf_counter()
+        _interpreter(code)
+        return (time.perf_counter() - started) * 1000
+
+    baseline = statistics.median(timed("pass") for _ in range(runs))
+    return [timed(f"import {module}") - baseline for _ in range(runs)]
+
+
+def check(module: str = "push", budget_ms: float = STARTUP_BUDGET_MS, runs: int = 5, top: int = 15) -> dict:
+    profile = import_profile(module)
+    loaded = {row["module"].split(".")[0] for row in profile}
+    wall = cold_start_ms(module, runs)
+
+    report = {
+        "module": module,
+        "budget_ms": budget_ms,
+        "cold_start_ms_median": round(statistics.median(wall), 1),
+        "cold_start_ms_max": round(max(wall), 1),
+        "modules_imported": len(profile),
+        "forbidden_imported": sorted(loaded.intersection(FORBIDDEN)),
+        "slowest": [
+            {"module": r["module"], "cumulative_ms": round(r["cumulative_us"] / 1000, 2)}
+            for r in sorted(profile, key=lambda r: r["cumulative_us"], reverse=True)[:top]
+        ],
+    }
+    report["ok"] = report["cold_start_ms_median"] <= budget_ms and not report["forbidden_imported"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="push", help="entry point to import")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="median cold start allowed")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args()
+
+    report = check(args.module, args.budget_ms, args.runs, args.top)
+    print(json.dumps(report, indent=2))
+    if report["forbidden_imported"]:
+        print(f"FAIL: {args.module} imports {', '.join(report['forbidden_imported'])}", file=sys.stderr)
+    if report["cold_start_ms_median"] > args.budget_ms:
+        print(f"FAIL: cold start {report['cold_start_ms_median']} ms over the {args.budget_ms} ms budget", file=sys.stderr)
+    raise SystemExit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
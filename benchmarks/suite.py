@@ -0,0 +1,276 @@
+"""
+Benchmark suite for the collection and ingest hot path, run entirely
+against local stand-ins:
+
+    - benchmarks/fakes/speedtest   replays a recorded CLI result
+    - benchmarks/fakes/ipapi.py    local HTTP server standing in for ipapi.co
+    - benchmarks/fakes/db.py       records ingest statements instead of sending them
+    - storage.SqliteStorage        embedded backend for the dashboard range queries
+
+    python -m benchmarks.suite --out bench.json
+
+Results are JSON, so runs can be diffed between releases.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+FIXTURE = BENCH_DIR / "fixtures" / "speedtest_result.json"
+
+# must be set before speedtest and enrichment are imported
+os.environ.setdefault("SPEEDTEST_BIN", str(BENCH_DIR / "fakes" / "speedtest"))
+os.environ.setdefault("ENRICHMENT_CACHE_PATH", str(Path(tempfile.gettempdir()) / "speedtest-bench-enrichment.db"))
+
+import numpy as np
+import pandas as pd
+
+import enrichment
+import helpers
+import ingest
+import downsample
+import speedtest
+import storage
+from benchmarks.fakes.db import RecordingConnection
+from benchmarks.fakes.ipapi import start_fake_ipapi
+
+
+def _quiet():
+    """ silence the rich consoles so only the JSON report is printed """
+    for module in (speedtest, ingest, helpers, enrichment, storage):
+        module.console.quiet = True
+
+
+def _timed(fn, repeat: int = 5) -> float:
+    """ median seconds of fn() over repeat runs """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def _raw_results(n: int) -> list[dict]:
+    base = json.loads(FIXTURE.read_text())
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    out = []
+    for i in range(n):
+        raw = deepcopy(base)
+        raw["timestamp"] = (start + timedelta(minutes=15 * i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        raw["result"]["id"] = f"bench-{i}"
+        raw["server"]["id"] = 38312 + i % 5
+        out.append(raw)
+    return out
+
+
+#==========================================================================
+#               sections
+#==========================================================================
+def bench_transform(n: int) -> dict:
+    raws = _raw_results(n)
+    seconds = _timed(lambda: [speedtest.transform(r) for r in raws])
+    batch = _timed(lambda: speedtest.transform_batch(raws))
+    df, _ = speedtest.transform_batch(raws)
+    return {
+        "records": n,
+        "records_per_sec": round(n / seconds, 1),
+        "us_per_record": round(seconds * 1e6 / n, 2),
+        "batch_records_per_sec": round(n / batch, 1),
+        "batch_us_per_record": round(batch * 1e6 / n, 2),
+        "batch_frame_bytes_per_record": round(df.memory_usage(deep=True).sum() / n, 1),
+    }
+
+
+def bench_time_dim(n: int) -> dict:
+    stamps = [datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=15 * i) for i in range(n)]
+    per_row = _timed(lambda: [helpers.time_dim_values(ts) for ts in stamps])
+    vectorised = _timed(lambda: helpers.time_dim_rows(helpers.time_dim_frame(stamps)))
+    return {
+        "rows": n,
+        "per_row_us": round(per_row * 1e6 / n, 2),
+        "vectorised_us": round(vectorised * 1e6 / n, 2),
+    }
+
+
+def bench_load(n: int) -> dict:
+    rows = [speedtest.transform(r) for r in _raw_results(n)]
+    out = {}
+
+    def _reset():
+        ingest.KNOWN_SERVERS.clear()
+        ingest._servers_primed = False
+        helpers.KNOWN_TIME_IDS.clear()
+
+    modes = {
+        "statements": lambda conn: [ingest.insert_result_statements(conn.cursor(), dict(r)) for r in rows],
+        "load_to_sql": lambda conn: [ingest.load_to_sql(dict(r), conn=conn) for r in rows],
+        "load_batch_to_sql": lambda conn: ingest.load_batch_to_sql([dict(r) for r in rows], conn),
+    }
+    for mode, run in modes.items():
+        _reset()
+        conn = RecordingConnection()
+        started = time.perf_counter()
+        run(conn)
+        seconds = time.perf_counter() - started
+        out[mode] = {
+            "rows": n,
+            "rows_per_sec": round(n / seconds, 1),
+            "statements_per_row": round(len(conn.statements) / n, 3),
+        }
+    return out
+
+
+def bench_enrichment(ips: int) -> dict:
+    server, base_url = start_fake_ipapi()
+    speedtest.IPAPI_BASE_URL = base_url
+    out = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = Path(tmp) / "enrichment.db"
+            addresses = [f"10.0.0.{i}" for i in range(ips)]
+
+            started = time.perf_counter()
+            for ip in addresses:
+                enrichment.lookup_server(ip, path=cache)
+            cold = time.perf_counter() - started
+            requests_cold = server.requests
+
+            started = time.perf_counter()
+            for ip in addresses:
+                enrichment.lookup_server(ip, path=cache)
+            warm = time.perf_counter() - started
+
+            out["cold_ms_per_lookup"] = round(cold * 1000 / ips, 3)
+            out["warm_ms_per_lookup"] = round(warm * 1000 / ips, 3)
+            out["http_requests_cold"] = requests_cold
+            out["http_requests_warm"] = server.requests - requests_cold
+
+            # rate limited: after the first 429 the rest should not reach the API
+            server.status = 429
+            before = server.requests
+            for i in range(ips):
+                enrichment.lookup_server(f"10.1.0.{i}", path=cache)
+            out["http_requests_while_rate_limited"] = server.requests - before
+    finally:
+        server.shutdown()
+    return out
+
+
+def bench_collect(runs: int) -> dict:
+    plain = _timed(lambda: speedtest.run_speedtest(), repeat=runs)
+    streamed = _timed(lambda: speedtest.run_speedtest_stream(), repeat=runs)
+    _, samples = speedtest.run_speedtest_stream()
+    return {
+        "run_speedtest_ms": round(plain * 1000, 2),
+        "run_speedtest_stream_ms": round(streamed * 1000, 2),
+        "samples_per_test": {phase: len(s["value"]) for phase, s in samples.items()},
+    }
+
+
+def _sqlite_with_rows(n: int, path: Path) -> tuple[storage.SqliteStorage, list[datetime]]:
+    """ an embedded backend holding n measurements 15 minutes apart, rollup included """
+    backend = storage.SqliteStorage(path)
+    template = speedtest.transform(json.loads(FIXTURE.read_text()))
+    rng = np.random.default_rng(7)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    stamps = [start + timedelta(minutes=15 * i) for i in range(n)]
+    rows = [
+        dict(template, result_id=f"r{i}", measured_at_utc=ts,
+             download_mbps=float(d), upload_mbps=float(u), latency_ms=float(l))
+        for i, (ts, d, u, l) in enumerate(zip(stamps, rng.normal(40, 8, n), rng.normal(12, 3, n), rng.gamma(4, 5, n)))
+    ]
+    conn = backend.connect()
+    try:
+        backend.load_batch(rows, conn)
+    finally:
+        conn.close()
+    return backend, stamps
+
+
+def bench_dashboard(sizes: list[int]) -> dict:
+    out = {}
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            backend, stamps = _sqlite_with_rows(n, Path(tmp) / "speedtest.db")
+            # the last week in local time (UTC+2), which is what the dashboard opens on
+            end = (stamps[-1] + timedelta(hours=3)).replace(tzinfo=None)
+            params = {"start_dt": end - timedelta(days=7), "end_dt": end}
+
+            def _hourly_from_raw():
+                df = backend.read_sql("02_raw_range.sql", params)
+                df["hour_bucket"] = pd.to_datetime(df["local_tz"]).dt.floor("h")
+                return df.groupby("hour_bucket")[["download_mbps", "upload_mbps", "latency_ms"]].median()
+
+            out[str(n)] = {
+                "raw_range_ms": round(_timed(lambda: backend.read_sql("02_raw_range.sql", params)) * 1000, 3),
+                "hourly_from_raw_ms": round(_timed(_hourly_from_raw) * 1000, 3),
+                "hourly_rollup_ms": round(_timed(lambda: backend.read_sql("07_hourly_speeds_range.sql", params)) * 1000, 3),
+            }
+            backend.engine.dispose()
+    return out
+
+
+def bench_downsample(sizes: list[int], width_px: int = 1200) -> dict:
+    """ cost of downsampling an hourly series and the points left to send """
+    out = {}
+    rng = np.random.default_rng(11)
+    for n in sizes:
+        df = pd.DataFrame({
+            "hour_bucket": pd.date_range("2020-01-01", periods=n, freq="h"),
+            "median_download_mbps": rng.normal(40, 8, n),
+        })
+        out[str(n)] = {
+            method: {
+                "ms": round(_timed(lambda: downsample.downsample(df, "hour_bucket", "median_download_mbps", width_px, method)) * 1000, 3),
+                "points": len(downsample.downsample(df, "hour_bucket", "median_download_mbps", width_px, method)),
+            }
+            for method in ("lttb", "minmax")
+        }
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000, help="records for transform/time_dim/ingest")
+    parser.add_argument("--ips", type=int, default=50, help="distinct IPs for the enrichment cache")
+    parser.add_argument("--runs", type=int, default=3, help="fake CLI runs per collect mode")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="fact rows for dashboard queries")
+    parser.add_argument("--out", help="also write the report to this file")
+    args = parser.parse_args()
+
+    _quiet()
+    git_rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    report = {
+        "timestamp_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_rev": git_rev or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {
+            "transform": bench_transform(args.rows),
+            "time_dim": bench_time_dim(args.rows),
+            "load_to_sql": bench_load(args.rows),
+            "enrichment": bench_enrichment(args.ips),
+            "collect": bench_collect(args.runs),
+            "dashboard": bench_dashboard([int(s) for s in args.sizes.split(",")]),
+            # hourly points in 1, 12 and 36 months
+            "downsample": bench_downsample([744, 8760, 26280]),
+        },
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import time
+
+# taken before the heavy imports below so the first cycle can report them
+PROCESS_STARTED = time.perf_counter()
+
+import os
+import random
+import signal
+import threading
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from rich.console import Console
+
+import metrics
+import sla
+from speedtest import measure, transform
+from storage import get_storage
+from spool import spool_row, replay, pending_count
+from enrichment import enrich_row
+from orchestrator import run_sweep, SWEEP_SERVERS
+from scheduler import AdaptiveScheduler, COLLECTOR_SCHEDULE, collector_wait
+
+console = Console()
+load_dotenv()
+
+# seconds between the start of two cycles, and the +/- random spread applied
+# to each wait so several probes do not saturate the same server in lockstep
+INTERVAL_SEC = float(os.getenv("COLLECTOR_INTERVAL_SEC", "900"))
+JITTER_SEC = float(os.getenv("COLLECTOR_JITTER_SEC", "60"))
+
+
+#==========================================================================
+#               keep one warm connection between cycles
+#==========================================================================
+class WarmConnection:
+    """
+    Holds a single open connection for the lifetime of the collector.
+    The collector runs one cycle at a time, so one connection is the whole
+    pool; it is health checked before each use and reopened if it has died.
+    """
+    def __init__(self, storage=None):
+        self.storage = storage or get_storage()
+        self.conn = None
+        self.connects = 0
+
+    def get(self):
+        """_summary_
+        Return an open connection, reconnecting when the cached one is dead
+
+        Returns:
+            the backend connection, and the seconds spent connecting (0 when reused)
+        """
+        if self.conn is not None:
+            try:
+                self.storage.ping(self.conn)
+                return self.conn, 0.0
+            except self.storage.errors:
+                console.print("[bold yellow]Warm connection went stale - reconnecting[/]")
+                self.close()
+
+        started = time.perf_counter()
+        with metrics.timed("db_connect", backend=self.storage.name):
+            self.conn = self.storage.connect()
+        self.connects += 1
+        return self.conn, time.perf_counter() - started
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except self.storage.errors:
+                pass
+            self.conn = None
+
+
+def next_wait(interval: float, jitter: float, elapsed: float) -> float:
+    """_summary_
+    Seconds to sleep before the next cycle
+
+    Args:
+        interval (float): target seconds between cycle starts
+        jitter (float): maximum random offset either way
+        elapsed (float): seconds the last cycle took
+
+    Returns:
+        float: the wait, never negative
+    """
+    return max(0.0, interval - elapsed + random.uniform(-jitter, jitter))
+
+
+def run_cycle(warm: WarmConnection, scheduler: AdaptiveScheduler | None = None) -> dict:
+    """_summary_
+    Run one speedtest -> transform -> spool -> replay cycle on the warm
+    connection, or a multi-server sweep when SPEEDTEST_SERVERS is set. Rows
+    are spooled before touching the database, so a cycle with the database
+    down still keeps its measurements.
+
+    Args:
+        warm (WarmConnection): the collector's connection
+        scheduler (AdaptiveScheduler | None): when given, it sees the cycle's
+            results and picks the next wait
+
+    Returns:
+        dict: timings in seconds for each stage plus the overhead, i.e.
+        everything except the speedtest itself; "next_wait" is the adaptive
+        schedule's wait when a scheduler was given
+    """
+    timings = {"connect": 0.0, "speedtest": 0.0, "spool": 0.0, "load": 0.0, "loaded": 0}
+    bytes_used = None
+    cycle_started = time.perf_counter()
+
+    started = time.perf_counter()
+    if SWEEP_SERVERS:
+        rows = run_sweep(load=False)["rows"]
+    else:
+        raw, samples = measure()
+        rows = []
+        if raw is None:
+            console.print("[bold red]Speedtest returned no data. Skipping this cycle.[/]")
+        else:
+            bytes_used = (raw.get("download", {}).get("bytes") or 0) + (raw.get("upload", {}).get("bytes") or 0)
+            row = transform(raw)
+            if row is None:
+                console.print("[bold red]Transform failed. Skipping this cycle.[/]")
+            else:
+                if samples:
+                    row["samples"] = samples
+                rows.append(row)
+    timings["speedtest"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for row in rows:
+        spool_row(enrich_row(row))
+        metrics.record_result(row)
+    timings["spool"] = time.perf_counter() - started
+
+    # drain whatever is spooled, including rows left over from outages
+    if pending_count():
+        try:
+            conn, timings["connect"] = warm.get()
+            started = time.perf_counter()
+            timings["loaded"] = replay(conn=conn, storage=warm.storage)
+            timings["load"] = time.perf_counter() - started
+        except warm.storage.errors as e:
+            console.print(f"[bold red]Database unavailable this cycle, results stay spooled: {e}[/]")
+            warm.close()
+
+    # after the replay, so a breach these rows opened in sla.py counts
+    if scheduler is not None:
+        timings["next_wait"] = collector_wait(scheduler, warm.storage, rows, bytes_used)
+
+    timings["total"] = time.perf_counter() - cycle_started
+    timings["overhead"] = timings["total"] - timings["speedtest"]
+    metrics.observe("cycle_overhead", timings["overhead"])
+    metrics.write_textfile()
+    return timings
+
+
+def report_cycle(n: int, timings: dict, startup: float | None = None):
+    msg = (
+        f"[cyan]cycle {n}[/] speedtest={timings['speedtest']:.1f}s "
+        f"overhead={timings['overhead'] * 1000:.0f}ms "
+        f"(connect={timings['connect'] * 1000:.0f}ms "
+        f"spool={timings['spool'] * 1000:.1f}ms "
+        f"load={timings['load'] * 1000:.0f}ms)"
+    )
+    if startup is not None:
+        msg += f" startup={startup * 1000:.0f}ms"
+    console.print(msg)
+
+
+def run_collector(interval: float = INTERVAL_SEC, jitter: float = JITTER_SEC, max_cycles: int | None = None,
+                  schedule: str = COLLECTOR_SCHEDULE):
+    """_summary_
+    Resident replacement for launching push.py from cron. Imports, .env and
+    the database connection are paid for once; each cycle only pays for the
+    speedtest and the inserts. SIGTERM/SIGINT stop the loop after the current
+    cycle finishes.
+
+    Args:
+        interval (float): target seconds between cycle starts
+        jitter (float): maximum random offset applied to each wait
+        max_cycles (int | None): stop after this many cycles (None runs forever)
+        schedule (str): "fixed" waits interval between cycles; "adaptive"
+            lets scheduler.py choose each wait (interval is its base)
+    """
+    stop = threading.Event()
+
+    def _request_stop(signum, frame):
+        console.print(f"[bold yellow]Received signal {signum} - stopping after this cycle[/]")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    sla.enable()
+    warm = WarmConnection()
+    scheduler = AdaptiveScheduler.load(base=interval) if schedule == "adaptive" else None
+    startup = time.perf_counter() - PROCESS_STARTED
+    metrics.set_gauge("collector_startup_seconds", startup, "Time from process start to the first cycle.")
+    if metrics.serve():
+        console.print(f"[dim]Serving /metrics on port {metrics.METRICS_PORT}[/]")
+    n = 0
+
+    console.print(f"[bold green]Collector started at {datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} UTC "
+                  f"(schedule={schedule} interval={interval:.0f}s jitter=±{jitter:.0f}s)[/]")
+    try:
+        while not stop.is_set():
+            n += 1
+            timings = run_cycle(warm, scheduler)
+            report_cycle(n, timings, startup if n == 1 else None)
+
+            if max_cycles is not None and n >= max_cycles:
+                break
+            stop.wait(next_wait(timings.get("next_wait", interval), jitter, timings["total"]))
+    finally:
+        warm.close()
+        console.print(f"[bold green]Collector stopped after {n} cycles ({warm.connects} connects)[/]")
+
+
+if __name__ == "__main__":
+    run_collector()
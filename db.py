@@ -1,51 +1,214 @@
-from json import load
 import os
-import urllib.parse
+import sys
+import threading
+import time
 from pathlib import Path
-from sqlalchemy import create_engine, text
+
 from dotenv import load_dotenv
-import pandas as pd
+from rich.console import Console
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool
 
 PROJECT_DIR = Path.cwd()
 
 load_dotenv(PROJECT_DIR / ".env")
 
+console = Console()
+
+# the one place the SQL Server connection settings are read
+DRIVER = os.getenv("SQLSERVER_DRIVER", "ODBC Driver 18 for SQL Server").strip("{}")
+HOST = os.getenv("SQLSERVER_HOST", "127.0.0.1")
+PORT = os.getenv("SQLSERVER_PORT", "1433")
+DB = os.getenv("SQLSERVER_DB", "InternetSpeed_DB")
+UID = os.getenv("SQLSERVER_USER", "sa")
+PWD = os.getenv("SQLSERVER_PWD")
+LOGIN_TIMEOUT_SEC = int(os.getenv("SQLSERVER_LOGIN_TIMEOUT_SEC", "30"))
+
+# pool sizing; a dashboard worker needs a few connections, the collector one
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT_SEC = float(os.getenv("DB_POOL_TIMEOUT_SEC", "30"))
+POOL_RECYCLE_SEC = int(os.getenv("DB_POOL_RECYCLE_SEC", "1800"))
+
+# connections opened ahead of the first request by warmup()
+POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "1"))
+
+
+def connection_string() -> str:
+    return (
+        f"DRIVER={{{DRIVER}}};"
+        f"SERVER={HOST},{PORT};"
+        f"DATABASE={DB};"
+        f"UID={UID};"
+        f"PWD={PWD};"
+        "TrustServerCertificate=yes;"
+        "Encrypt=yes;"
+        f"Login Timeout={LOGIN_TIMEOUT_SEC};"
+    )
+
+
+#==========================================================================
+#               pool statistics
+#==========================================================================
+class PoolStats:
+    """
+    Counters fed by the pool: how long opening a connection takes, how long
+    callers wait to check one out (including any connect that wait caused),
+    and how many are checked out right now.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.connect_failures = 0
+        self.connect_ms_total = 0.0
+        self.connect_ms_max = 0.0
+        self.checkouts = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.active = 0
+
+    def connected(self, seconds: float):
+        with self._lock:
+            self.connects += 1
+            self.connect_ms_total += seconds * 1000
+            self.connect_ms_max = max(self.connect_ms_max, seconds * 1000)
+
+    def connect_failed(self):
+        with self._lock:
+            self.connect_failures += 1
+
+    def waited(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_ms_total += seconds * 1000
+            self.wait_ms_max = max(self.wait_ms_max, seconds * 1000)
+
+    def checked_out(self, *_):
+        with self._lock:
+            self.active += 1
+
+    def checked_in(self, *_):
+        with self._lock:
+            self.active -= 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            return {
+                "active": self.active,
+                "idle": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "size": pool.size(),
+                "connects": self.connects,
+                "connect_failures": self.connect_failures,
+                "connect_ms_avg": round(self.connect_ms_total / self.connects, 2) if self.connects else 0.0,
+                "connect_ms_max": round(self.connect_ms_max, 2),
+                "checkouts": self.checkouts,
+                "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_ms_max, 3),
+            }
+
+
+STATS = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool that records how long each checkout waited """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            STATS.waited(time.perf_counter() - started)
+
+
+def _connect():
+    import pyodbc
+
+    started = time.perf_counter()
+    try:
+        # every pooled connection is transactional: callers commit or roll
+        # back explicitly (the pool's proxy does not forward autocommit)
+        conn = pyodbc.connect(connection_string(), autocommit=False, timeout=LOGIN_TIMEOUT_SEC)
+    except pyodbc.Error:
+        STATS.connect_failed()
+        raise
+    STATS.connected(time.perf_counter() - started)
+    return conn
+
+
+#==========================================================================
+#               the shared engine and its pool
+#==========================================================================
 def make_engine():
     """
-    
+    The process-wide SQLAlchemy engine. Every SQL Server connection in the
+    project comes from its pool: dashboard queries through ENGINE, ingest
+    and the benchmarks through get_db_connection(). pool_pre_ping health
+    checks a connection on checkout and replaces it if the server dropped it.
     """
-    
-    # Example
-    server = os.getenv("SQLSERVER_HOST")
-    database = os.getenv("SQLSERVER_DB")
-    username = os.getenv("SQLSERVER_USER")
-    password = os.getenv("SQLSERVER_PWD")
-    driver = os.getenv("SQLSERVER_DRIVER")
-    
-    # ODBC connection string
-    
-    odbc_str = (
-        f"DRIVER={driver};"
-        f"SERVER={server};"
-        f"DATABASE={database};"
-        f"UID={username};"
-        f"PWD={password};"
-        "Encrypt=yes;"
-        "TrustServerCertificate=yes;"
-        "Connection Timeout=30;"
-    )
-    
-    connection_url = "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(odbc_str)
-    
     engine = create_engine(
-        connection_url,
+        "mssql+pyodbc://",
+        creator=_connect,
+        poolclass=TimedQueuePool,
         pool_pre_ping=True,
-        pool_recycle=1800,
-        pool_size=5,
-        max_overflow=10,
+        pool_recycle=POOL_RECYCLE_SEC,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT_SEC,
         future=True
     )
-    
+    event.listen(engine, "checkout", STATS.checked_out)
+    event.listen(engine, "checkin", STATS.checked_in)
     return engine
 
 ENGINE = make_engine()
+
+
+def get_db_connection(exit_on_failure: bool = True):
+    """
+    Check a raw pyodbc connection out of the shared pool. Closing it returns
+    it to the pool (rolled back) rather than disconnecting.
+
+    Args:
+        exit_on_failure (bool): exit the process when no connection can be
+            made (the behaviour a one-shot cron run wants). Long-running
+            callers pass False and get the pyodbc.Error raised instead.
+    """
+    try:
+        return ENGINE.raw_connection()
+    except DBAPIError as e:
+        console.print(f"[bold red]Database connection failed: {e.orig}[/]")
+        if exit_on_failure:
+            sys.exit(1)
+        raise e.orig from e
+
+
+def warmup(n: int = POOL_WARMUP) -> int:
+    """_summary_
+    Open n pooled connections ahead of the first request, so its latency
+    does not include the login
+
+    Returns:
+        int: connections opened
+    """
+    conns = []
+    try:
+        for _ in range(max(0, n)):
+            conns.append(get_db_connection(exit_on_failure=False))
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+
+def health_check() -> float:
+    """ round trip of SELECT 1 over a pooled connection, in milliseconds """
+    started = time.perf_counter()
+    with ENGINE.connect() as conn:
+        conn.execute(text("SELECT 1")).scalar()
+    return (time.perf_counter() - started) * 1000
+
+
+def pool_stats() -> dict:
+    return STATS.snapshot(ENGINE.pool)
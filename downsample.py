@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+# width assumed when the browser has not reported the plot's size yet
+DEFAULT_PLOT_WIDTH_PX = 1200
+
+# above this many points a trend is drawn with WebGL (Scattergl) instead of SVG
+WEBGL_MIN_POINTS = 1000
+
+
+#==========================================================================
+#       shape-preserving downsampling for long trend series
+#==========================================================================
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """_summary_
+    Largest-Triangle-Three-Buckets: keep the first and last points, and from
+    each of n_out - 2 equal buckets in between the point forming the largest
+    triangle with the point kept before it and the mean of the next bucket.
+    Peaks and dips survive, unlike plain striding.
+
+    Args:
+        x (np.ndarray): increasing x values as numbers
+        y (np.ndarray): y values, no NaN
+        n_out (int): points to keep
+
+    Returns:
+        np.ndarray: indices of the kept points, increasing
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nxt_lo, nxt_hi = hi, edges[b + 2] if b + 2 < len(edges) else n
+        cx, cy = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[b + 1] = a
+    return keep
+
+
+def minmax(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """_summary_
+    Indices of the minimum and maximum of each of n_buckets equal buckets,
+    so every spike is still visible at one bucket per pixel
+
+    Returns:
+        np.ndarray: increasing indices, at most 2 * n_buckets of them
+    """
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    keep = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi > lo:
+            keep.extend((lo + int(np.argmin(y[lo:hi])), lo + int(np.argmax(y[lo:hi]))))
+    return np.unique(keep)
+
+
+def downsample(df: pd.DataFrame, x: str, y: str, width_px: int | None = None, method: str = "lttb") -> pd.DataFrame:
+    """_summary_
+    At most about one point per horizontal pixel of the plot, chosen so the
+    shape of the series is kept. Rows where y is missing are dropped first.
+
+    Args:
+        df (pd.DataFrame): the series, sorted by x
+        x (str): datetime or numeric column
+        y (str): value column
+        width_px (int | None): plot width, DEFAULT_PLOT_WIDTH_PX when unknown
+        method (str): "lttb" or "minmax"
+
+    Returns:
+        pd.DataFrame: the kept rows of df
+    """
+    df = df[df[y].notna()]
+    width_px = int(width_px or DEFAULT_PLOT_WIDTH_PX)
+    if len(df) <= width_px:
+        return df
+
+    xs = df[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype("datetime64[ns]").astype(np.int64)
+    xs = xs.astype(np.float64)
+    ys = df[y].to_numpy(dtype=np.float64)
+
+    if method == "minmax":
+        keep = minmax(ys, max(1, width_px // 2))
+    else:
+        keep = lttb(xs, ys, width_px)
+    return df.iloc[keep]
+
+
+def plot_width(session, output_id: str) -> int:
+    """ the rendered width of a Shiny output in pixels, once the browser has reported it """
+    try:
+        width = session.clientdata.output_width(output_id)
+    except Exception:
+        width = None
+    return int(width) if width else DEFAULT_PLOT_WIDTH_PX
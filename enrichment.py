@@ -0,0 +1,156 @@
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from rich.console import Console
+
+import metrics
+from speedtest import fetch_server_info
+
+console = Console()
+
+PROJECT_DIR = Path.cwd()
+
+load_dotenv(PROJECT_DIR / ".env")
+
+CACHE_PATH = Path(os.getenv("ENRICHMENT_CACHE_PATH", PROJECT_DIR / "cache" / "enrichment.db"))
+
+# server coordinates practically never change; failures are retried sooner
+POSITIVE_TTL_SEC = float(os.getenv("ENRICHMENT_TTL_SEC", 30 * 24 * 3600))
+NEGATIVE_TTL_SEC = float(os.getenv("ENRICHMENT_NEGATIVE_TTL_SEC", 6 * 3600))
+
+# exponential backoff after a 429 or a network failure: 1 min, 2, 4 ... capped at 6 h
+BACKOFF_BASE_SEC = 60.0
+BACKOFF_MAX_SEC = 6 * 3600.0
+
+# the lookup happens outside any database transaction, but a probe still
+# should not stall a cycle for long on a slow API
+LOOKUP_TIMEOUT_SEC = 4.0
+
+
+#==========================================================================
+#               disk-backed cache of ipapi.co lookups
+#==========================================================================
+def open_cache(path: Path = CACHE_PATH) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cache = sqlite3.connect(path)
+    cache.execute("""
+        CREATE TABLE IF NOT EXISTS server_info (
+            ip              TEXT    PRIMARY KEY,
+            payload         TEXT,               -- NULL marks a negative entry
+            status          INTEGER,
+            fetched_at      REAL    NOT NULL,
+            expires_at      REAL    NOT NULL
+        )
+    """)
+    cache.execute("""
+        CREATE TABLE IF NOT EXISTS backoff (
+            api             TEXT    PRIMARY KEY,
+            failures        INTEGER NOT NULL,
+            retry_at        REAL    NOT NULL
+        )
+    """)
+    cache.commit()
+    return cache
+
+
+def _cached(cache: sqlite3.Connection, ip: str, now: float) -> tuple[bool, dict | None]:
+    """ (hit, payload). A hit with payload None is a live negative entry """
+    row = cache.execute(
+        "SELECT payload FROM server_info WHERE ip = ? AND expires_at > ?", (ip, now)
+    ).fetchone()
+    if row is None:
+        return False, None
+    return True, (json.loads(row[0]) if row[0] is not None else None)
+
+
+def _store(cache: sqlite3.Connection, ip: str, payload: dict | None, status: int | None, now: float):
+    ttl = POSITIVE_TTL_SEC if payload is not None else NEGATIVE_TTL_SEC
+    cache.execute(
+        "INSERT OR REPLACE INTO server_info (ip, payload, status, fetched_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+        (ip, json.dumps(payload) if payload is not None else None, status, now, now + ttl),
+    )
+
+
+def backing_off(cache: sqlite3.Connection, now: float) -> bool:
+    row = cache.execute("SELECT retry_at FROM backoff WHERE api = 'ipapi'").fetchone()
+    return row is not None and row[0] > now
+
+
+def _record_failure(cache: sqlite3.Connection, now: float, retry_after: float | None):
+    row = cache.execute("SELECT failures FROM backoff WHERE api = 'ipapi'").fetchone()
+    failures = (row[0] if row else 0) + 1
+    wait = min(BACKOFF_BASE_SEC * 2 ** (failures - 1), BACKOFF_MAX_SEC)
+    if retry_after is not None:
+        wait = max(wait, retry_after)
+    cache.execute(
+        "INSERT OR REPLACE INTO backoff (api, failures, retry_at) VALUES ('ipapi', ?, ?)",
+        (failures, now + wait),
+    )
+    console.print(f"[bold yellow]ipapi.co backing off for {wait:.0f}s after {failures} failure(s)[/]")
+
+
+def lookup_server(ip: str, network: bool = True, path: Path = CACHE_PATH) -> dict | None:
+    """_summary_
+    Server metadata for an IP, from the cache when fresh and from ipapi.co
+    otherwise. Failures are cached as negative entries so a bad IP is not
+    asked about again until NEGATIVE_TTL_SEC has passed; rate limits and
+    network errors put the whole API into exponential backoff, during which
+    lookups return None straight away.
+
+    Args:
+        ip (str): server IP
+        network (bool): False answers from the cache only
+        path (Path): cache location
+
+    Returns:
+        dict | None: the ipapi.co payload, or None when unknown
+    """
+    if not ip:
+        return None
+    ip = ip.strip()
+    now = time.time()
+    started = time.perf_counter()
+    outcome, failed = "hit", False
+
+    cache = open_cache(path)
+    try:
+        hit, payload = _cached(cache, ip, now)
+        if hit or not network or backing_off(cache, now):
+            outcome = "hit" if hit else "offline" if not network else "backoff"
+            return payload
+
+        outcome = "fetched"
+        status, payload, retry_after = fetch_server_info(ip, timeout=LOOKUP_TIMEOUT_SEC)
+
+        if status is None or status == 429 or status >= 500:
+            # the API, not this IP, is the problem - back off and keep no entry
+            failed = True
+            _record_failure(cache, now, retry_after)
+        else:
+            cache.execute("DELETE FROM backoff WHERE api = 'ipapi'")
+            _store(cache, ip, payload, status, now)
+        cache.commit()
+        return payload
+    finally:
+        cache.close()
+        metrics.observe("enrichment", time.perf_counter() - started, error=failed, outcome=outcome)
+
+
+def enrich_row(data: dict, network: bool = True) -> dict:
+    """_summary_
+    Fill in server_latitude/server_longitude from the cache (or the API).
+    Called before a row is spooled, so no database transaction ever waits on
+    the HTTP lookup.
+    """
+    if data.get("server_latitude") is not None and data.get("server_longitude") is not None:
+        return data
+
+    info = lookup_server(data.get("server_ip"), network=network)
+    if info:
+        data["server_latitude"] = info.get("latitude")
+        data["server_longitude"] = info.get("longitude")
+    return data
@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+from dotenv import load_dotenv
+from rich.console import Console
+
+from query_cache import WATERMARK_OVERLAP_IDS
+from storage import get_storage
+
+console = Console()
+
+PROJECT_DIR = Path.cwd()
+
+load_dotenv(PROJECT_DIR / ".env")
+
+# root of the archive: one date=YYYY-MM-DD directory per local day, read
+# back with pd.read_parquet(EXPORT_DIR) or pyarrow.dataset
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", PROJECT_DIR / "export" / "internet_speeds"))
+
+# facts fetched per round trip; each batch becomes one file per day it covers
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "50000"))
+
+STATE_FILE = "_export_state.json"
+
+# low-cardinality text columns, stored dictionary encoded
+CATEGORY_COLUMNS = ("server_name", "server_location", "server_country", "isp")
+
+
+def _pyarrow():
+    """ pyarrow is only needed by the export, so it is imported on first use """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("The Parquet export needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+#==========================================================================
+#               export state: the last fact id written to the archive, and
+#               the ids written in the overlap window below it
+#==========================================================================
+def read_state(out_dir: Path = EXPORT_DIR) -> dict:
+    path = out_dir / STATE_FILE
+    if not path.exists():
+        return {"last_id": 0, "rows": 0, "files": 0, "recent_ids": []}
+    return json.loads(path.read_text())
+
+
+def write_state(state: dict, out_dir: Path = EXPORT_DIR):
+    """ replace the state file atomically so a crash never leaves it half written """
+    path = out_dir / STATE_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    os.replace(tmp, path)
+
+
+#==========================================================================
+#               write one batch of facts as per-day Parquet files
+#==========================================================================
+def _frame(df: pd.DataFrame) -> pd.DataFrame:
+    """ compact column types for the archive """
+    df = df.copy()
+    df["measured_at_utc"] = pd.to_datetime(df["measured_at_utc"], utc=True)
+    df["local_tz"] = pd.to_datetime(df["local_tz"])
+    for col in ("download_mbps", "upload_mbps", "latency_ms", "jitter_ms", "packet_loss_pct"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+    for col in ("is_weekend", "is_holiday"):
+        df[col] = df[col].astype(bool)
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype("category")
+    return df
+
+
+def write_partitions(df: pd.DataFrame, out_dir: Path = EXPORT_DIR) -> list[Path]:
+    """_summary_
+    Write a batch of facts under out_dir/date=YYYY-MM-DD/, one file per local
+    day. Files are named after the first and last fact id they hold, so a
+    batch that is exported again after a crash overwrites its own files
+    instead of duplicating rows.
+
+    Returns:
+        list[Path]: the files written
+    """
+    pa = _pyarrow()
+    df = _frame(df)
+    written = []
+    for day, part in df.groupby(df["local_tz"].dt.strftime("%Y-%m-%d"), sort=True):
+        part_dir = out_dir / f"date={day}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        path = part_dir / f"part-{int(part['id'].iloc[0]):012d}-{int(part['id'].iloc[-1]):012d}.parquet"
+        # underscore-prefixed files are skipped by readers of the dataset
+        tmp = part_dir / f"_{path.name}.tmp"
+        table = pa.Table.from_pandas(part.reset_index(drop=True), preserve_index=False)
+        pa.parquet.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+        written.append(path)
+    return written
+
+
+def export_parquet(out_dir: Path = EXPORT_DIR, batch_size: int = EXPORT_BATCH_SIZE, storage=None) -> dict:
+    """_summary_
+    Append every fact added since the last export to the archive. Facts are
+    read in id order, and the state file moves forward only after a batch's
+    files are on disk. Late rows for a day that was already exported land in
+    an extra file in that day's directory.
+
+    IDENTITY ids are assigned before commit, so a slow writer can commit an
+    id below last_id after it was exported past. Each run starts reading
+    WATERMARK_OVERLAP_IDS below last_id and drops the ids the state records
+    as written in that window.
+
+    Args:
+        out_dir (Path): archive root
+        batch_size (int): facts per query
+        storage: backend to read from, storage.get_storage() by default
+
+    Returns:
+        dict: rows and files written by this run, and the new last_id
+    """
+    _pyarrow()
+    storage = storage or get_storage()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state = read_state(out_dir)
+    rows = files = 0
+
+    # a state written before the window was kept: take every id in it up to
+    # last_id as written, as that export did
+    after_id = max(0, state["last_id"] - WATERMARK_OVERLAP_IDS)
+    recent = set(state["recent_ids"]) if "recent_ids" in state else set(range(after_id + 1, state["last_id"] + 1))
+    while True:
+        df = storage.read_sql("10_export_facts.sql", {"after_id": after_id, "batch_size": batch_size})
+        if df.empty:
+            break
+        after_id = int(df["id"].max())
+        fetched = len(df)
+        df = df[~df["id"].isin(recent)]
+
+        written = len(write_partitions(df, out_dir)) if not df.empty else 0
+        files += written
+        rows += len(df)
+        last_id = max(state["last_id"], after_id)
+        recent = {i for i in recent | set(int(i) for i in df["id"]) if i > last_id - WATERMARK_OVERLAP_IDS}
+        state.update(
+            last_id=last_id,
+            recent_ids=sorted(recent),
+            rows=state["rows"] + len(df),
+            files=state["files"] + written,
+            exported_at_utc=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        )
+        write_state(state, out_dir)
+        if fetched < batch_size:
+            break
+
+    console.print(f"[cyan]Exported {rows} rows in {files} files, archive is at id {state['last_id']}[/]")
+    return {"rows": rows, "files": files, "last_id": state["last_id"]}
+
+
+def read_archive(out_dir: Path = EXPORT_DIR, start: str | None = None, end: str | None = None,
+                 columns: list[str] | None = None) -> pd.DataFrame:
+    """_summary_
+    Load the archive for analysis, reading only the day directories in
+    [start, end] ("YYYY-MM-DD", inclusive) and only the requested columns
+
+    Returns:
+        pd.DataFrame: facts ordered by id
+    """
+    _pyarrow()
+    filters = []
+    if start:
+        filters.append(("date", ">=", start))
+    if end:
+        filters.append(("date", "<=", end))
+    df = pd.read_parquet(out_dir, engine="pyarrow", columns=columns, filters=filters or None)
+    return df.sort_values("id").reset_index(drop=True) if "id" in df.columns else df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental Parquet export of the speed test facts")
+    parser.add_argument("--out", type=Path, default=EXPORT_DIR, help="archive root")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    export_parquet(args.out, args.batch_size)
@@ -1,22 +1,20 @@
-from multiprocessing import connection
+from __future__ import annotations
+
 import os
-import sys
 import re
-import json
-import pandas as pd
-import pyodbc
-import datetime
-import holidays
-from datetime import datetime, date, timezone, timedelta, tzinfo
-import pytz
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 
-from sqlalchemy import text, create_engine
-from sqlalchemy.engine import Engine
+import pytz
 from dotenv import load_dotenv
-from datetime import datetime
 from rich.console import Console
 
+import metrics
+
+# pandas, holidays and sqlalchemy are imported inside the functions that
+# use them: a single collection run loads none of them
+
 # project directory or path
 PROJECT_DIR = Path.cwd()
 
@@ -29,14 +27,20 @@ console = Console()
 
 MaseruTimeZone = pytz.timezone('Africa/Maseru')
 
-ls_holidays = holidays.country_holidays("LS")
 
-DRIVER = os.getenv("SQLSERVER_DRIVER", "ODBC Driver 18 for SQL Server")
-HOST = os.getenv("SQLSERVER_HOST", "127.0.0.1")
-PORT = os.getenv("SQLSERVER_PORT", "1433")
-DB = os.getenv("SQLSERVER_DB", "InternetSpeed_DB")
-UID = os.getenv("SQLSERVER_USER", "sa")
-PWD = os.getenv("SQLSERVER_PWD")
+@lru_cache(maxsize=None)
+def ls_holidays(years: tuple[int, ...] | None = None):
+    """ Lesotho public holidays, built on first use (the holidays package is slow to import) """
+    import holidays
+    return holidays.country_holidays("LS", years=years)
+
+# time_metadata keys (epoch milliseconds) known to be committed already.
+# Ingest skips the dimension insert for these; bounded so a long-running
+# collector or a big backfill does not grow it forever
+KNOWN_TIME_IDS: dict[int, None] = {}
+KNOWN_TIME_IDS_MAX = 100_000
+
+# SQL Server connections come from the shared pool in db.py
 
 
 
@@ -53,7 +57,18 @@ def extract_int(value):
         raise ValueError(f"Cannot extract integer from text: {text!r}")
     
     
-def time_dim(cursor, measured_at_utc: datetime):
+def time_dim_values(measured_at_utc: datetime) -> tuple:
+    """_summary_
+    Calendar attributes of one measurement, in dbo.time_metadata column order
+
+    Args:
+        measured_at_utc (datetime): measurement time; naive values are taken as UTC
+
+    Returns:
+        tuple: (time_id, local_tz, date_key, year, month, month_name, day,
+        day_of_week, day_of_week_name, week_of_year, quarter, hour,
+        is_weekend, is_holiday)
+    """
     if measured_at_utc.tzinfo is None:
         measured_at_utc = measured_at_utc.replace(tzinfo=timezone.utc)
         
@@ -73,10 +88,67 @@ def time_dim(cursor, measured_at_utc: datetime):
     quarter = (month - 1) // 3 + 1
     hour = dt.hour
     is_weekend = 1 if day_of_week >= 6 else 0
-    is_holiday = 1 if dt.date() in ls_holidays else 0
+    is_holiday = 1 if dt.date() in ls_holidays() else 0
     
+    return (
+        utc_dt,
+        dt,
+        date_key,
+        year,
+        month,
+        month_name,
+        day,
+        day_of_week,
+        day_of_week_name,
+        week_of_year,
+        quarter,
+        hour,
+        is_weekend,
+        is_holiday
+    )
+
+
+#=================================================================================
+#               in-process cache of time keys already inserted
+#==================================================================================
+def time_key(measured_at_utc: datetime) -> int:
+    """ epoch milliseconds, the precision of the DATETIME2(3) time_id """
+    if measured_at_utc.tzinfo is None:
+        measured_at_utc = measured_at_utc.replace(tzinfo=timezone.utc)
+    return round(measured_at_utc.timestamp() * 1000)
+
+
+def time_id_known(measured_at_utc: datetime) -> bool:
+    return time_key(measured_at_utc) in KNOWN_TIME_IDS
+
+
+def remember_time_ids(measured_at_utc) -> None:
+    """_summary_
+    Record time keys as present in dbo.time_metadata. Only call this after the
+    transaction that inserted them has committed.
+
+    Args:
+        measured_at_utc: iterable of measurement datetimes
+    """
+    for ts in measured_at_utc:
+        KNOWN_TIME_IDS[time_key(ts)] = None
     
-    cursor.execute("""
+    overflow = len(KNOWN_TIME_IDS) - KNOWN_TIME_IDS_MAX
+    if overflow > 0:
+        for key in list(KNOWN_TIME_IDS)[:overflow]:
+            del KNOWN_TIME_IDS[key]
+
+
+#=================================================================================
+#               vectorised time dimension for many measurements
+#==================================================================================
+TIME_DIM_COLUMNS = [
+    "time_id", "local_tz", "date_key", "year", "month", "month_name", "day",
+    "day_of_week", "day_of_week_name", "week_of_year", "quarter", "hour",
+    "is_weekend", "is_holiday",
+]
+
+TIME_DIM_INSERT = """
                    IF NOT EXISTS (SELECT 1 FROM dbo.time_metadata WHERE time_id = ?)
                    INSERT INTO dbo.time_metadata (
                        time_id,
@@ -94,59 +166,97 @@ def time_dim(cursor, measured_at_utc: datetime):
                        is_weekend,
                        is_holiday
                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                   """, (
-                       utc_dt,
-                       utc_dt,
-                       dt,
-                       date_key,
-                       year,
-                       month,
-                       month_name,
-                       day,
-                       day_of_week,
-                       day_of_week_name,
-                       week_of_year,
-                       quarter,
-                       hour,
-                       is_weekend,
-                       is_holiday
-                   ) )
+                   """
 
 
-   
-def db_connection():
+def time_dim_frame(measured_at_utc) -> pd.DataFrame:
     """_summary_
+    Vectorised time_dim_values: the Africa/Maseru conversion, calendar parts and
+    Lesotho holiday flags for a whole batch of measurements at once. Holidays
+    are resolved once per year in the range instead of once per row.
+
+    Args:
+        measured_at_utc: iterable of measurement datetimes; naive values are taken as UTC
 
     Returns:
-        _type_: _description_
-    """    
-    connection_string = (
-        f"DRIVER={DRIVER};"
-        f"SERVER=127.0.0.1,{PORT};"
-        f"UID={UID};"
-        f"PWD={PWD};"
-        "TrustServerCertificate=yes;"
-        "Encrypt=yes;"
-        "Login Timeout=90;"
-        "Connect Timeout=90;"   
-    )
-    try:
-        conn = pyodbc.connect(connection_string, timeout=10)
-        conn.autocommit=False        
-        return conn
-    except pyodbc.Error as e:
-        console.print(f"[bold red]Database connection failed: {e}[/]")
-        sys.exit(1)
+        pd.DataFrame: one row per distinct timestamp, dbo.time_metadata columns in order
+    """
+    import pandas as pd
+
+    utc = pd.Series(pd.to_datetime(list(measured_at_utc), utc=True)).drop_duplicates().reset_index(drop=True)
+    if utc.empty:
+        return pd.DataFrame(columns=TIME_DIM_COLUMNS)
+    
+    local = utc.dt.tz_convert(MaseruTimeZone)
+    years = range(int(local.dt.year.min()), int(local.dt.year.max()) + 1)
+    holiday_dates = pd.to_datetime(list(ls_holidays(tuple(years)).keys()))
+    day_of_week = local.dt.dayofweek + 1
+    
+    frame = pd.DataFrame({
+        "time_id": utc,
+        "local_tz": local,
+        "date_key": local.dt.year * 10000 + local.dt.month * 100 + local.dt.day,
+        "year": local.dt.year,
+        "month": local.dt.month,
+        "month_name": local.dt.month_name(),
+        "day": local.dt.day,
+        "day_of_week": day_of_week,
+        "day_of_week_name": local.dt.day_name(),
+        "week_of_year": local.dt.isocalendar().week.astype(int),
+        "quarter": local.dt.quarter,
+        "hour": local.dt.hour,
+        "is_weekend": (day_of_week >= 6).astype(int),
+        "is_holiday": local.dt.tz_localize(None).dt.normalize().isin(holiday_dates).astype(int),
+    })
+    return frame[TIME_DIM_COLUMNS]
+
+
+def time_dim_rows(frame: pd.DataFrame) -> list[tuple]:
+    """ frame rows as plain Python tuples, the form pyodbc accepts as parameters """
+    return list(frame.astype(object).itertuples(index=False, name=None))
+
+
+# below this many timestamps the per-row path is cheaper than loading pandas
+VECTORISE_MIN_ROWS = 64
+
+
+def time_dim_batch(measured_at_utc) -> dict[int, tuple]:
+    """_summary_
+    time_dim_values for a batch keyed by time_key: row by row for the one or
+    two results of a collection run, vectorised (time_dim_frame) for replays
+    and backfills of VECTORISE_MIN_ROWS or more
+
+    Returns:
+        dict[int, tuple]: time_key -> dbo.time_metadata values
+    """
+    stamps = list(measured_at_utc)
+    if len(stamps) < VECTORISE_MIN_ROWS:
+        with metrics.timed("time_dim", mode="rows"):
+            return {time_key(ts): time_dim_values(ts) for ts in stamps}
+    with metrics.timed("time_dim", mode="frame"):
+        return {time_key(r[0]): r for r in time_dim_rows(time_dim_frame(stamps))}
+
+
+def time_dim(cursor, measured_at_utc: datetime):
+    if time_id_known(measured_at_utc):
+        return
+    
+    with metrics.timed("time_dim", mode="statement"):
+        values = time_dim_values(measured_at_utc)
+        cursor.execute(TIME_DIM_INSERT, (values[0], *values))
+
 
 
 #======================================================================
 #               load the queries into the python sql wrapper
 #======================================================================
-def load_sql_files(filename: str) -> str:
+def load_sql_files(filename: str, dialect: str | None = None) -> str:
     """_summary_
 
     Args:
         filename (str): the sql script to read
+        dialect (str | None): subfolder of sql/ holding a port of the script
+            for another backend (e.g. "sqlite"); None for the SQL Server original
 
     Raises:
         FileNotFoundError: if the sql script being referenced does not exist then the Error rises
@@ -154,9 +264,9 @@ def load_sql_files(filename: str) -> str:
     Returns:
         str: _description_
     """
-    path =  Path.cwd() / "sql" / filename
+    path =  Path.cwd() / "sql" / (dialect or "") / filename
     if not path.exists():
-        raise FileNotFoundError(f"SQL file could not be found")
+        raise FileNotFoundError(f"SQL file could not be found: {path}")
     
     return path.read_text()
 
@@ -167,6 +277,8 @@ def load_sql_files(filename: str) -> str:
 #=====================================================
 
 def time_bounds(df: pd.DataFrame, date_col: str):
+    import pandas as pd
+
     if date_col in df.columns:
         s = pd.to_datetime(df[date_col], errors="coerce")
     else:
@@ -175,36 +287,20 @@ def time_bounds(df: pd.DataFrame, date_col: str):
     return s.min(), s.max()
 
 
-#===========================================================
-#           A function to create and get sql connection
-#============================================================
-def get_db_connection():
-    connection_string = (
-        f"DRIVER={{{DRIVER}}};"
-        f"SERVER={HOST},{PORT};"
-        f"DATABASE={DB};"
-        f"UID={UID};"
-        f"PWD={PWD};"
-        "TrustServerCertificate=yes;"
-        "Encrypt=yes;"
-        "Login Timeout=30;"
-        "Connect Timeout=30;"
-    )
-    
-    return pyodbc.connect(connection_string)
-
-
 def fetch_time_bounds(conn, sql_time_bounds: str):
+    import pandas as pd
+
     b = pd.read_sql(sql_time_bounds, conn).iloc[0]
     return pd.to_datetime(b["min_dt"]), pd.to_datetime(b["max_dt"])
 
 
-from sqlalchemy import text
+def run_sql(engine, filename: str, params: dict | None = None, dialect: str | None = None) -> pd.DataFrame:
+    import pandas as pd
+    from sqlalchemy import text
 
-def run_sql(engine, filename: str, params: dict | None = None) -> pd.DataFrame:
-    sql = load_sql_files(filename)
+    sql = load_sql_files(filename, dialect)
 
-    with engine.connect() as conn:
+    with metrics.timed("dashboard_query", query=filename), engine.connect() as conn:
         # If query uses positional params (?), pass a tuple in the correct order
         if params and ("?" in sql):
             return pd.read_sql(
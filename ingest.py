@@ -1,164 +1,342 @@
-import pyodbc
-from datetime import datetime, time
-import os
-import sys
 from dotenv import load_dotenv
 
-from pytz import utc
 from rich.console import Console
-from sqlalchemy import exists
-from helpers import time_dim
-from speedtest import get_server_info
+
+import metrics
+from helpers import time_dim, time_dim_values, time_dim_batch, time_key, time_id_known, remember_time_ids
+from enrichment import lookup_server
+from samples import sample_rows, SAMPLES_INSERT
+from sketches import merge_sketches
+import sla
 
 console = Console()
 
 
 load_dotenv()
-DRIVER = os.getenv("SQLSERVER_DRIVER")
-SERVER = os.getenv("SQLSERVER_HOST")
-PORT = os.getenv("SQLSERVER_PORT")
-USER = os.getenv("SQLSERVER_USER")
-PWD = os.getenv("SQLSERVER_PWD")
-DB = os.getenv("SQLSERVER_DB")
-UID = os.getenv("SQLSERVER_USER")
+
+# servers already known to be in dbo.servers. A long-running collector keeps
+# this between cycles so repeat servers skip the lookup query entirely
+KNOWN_SERVERS: set[int] = set()
+_servers_primed = False
+
+# one call writes the time, server, result and fact rows (sql/05_ingest_result.sql)
+INGEST_PROC = "EXEC dbo.usp_ingest_result " + ", ".join(["?"] * 33)
+
+# recompute the hourly rollup for the hours the ingest marked dirty (sql/06_hourly_rollup.sql)
+REFRESH_ROLLUP = "EXEC dbo.usp_refresh_hourly_speeds"
+
+# which of a batch's results are stored already. The key-range locks keep
+# another writer from inserting them before this transaction commits
+STORED_RESULTS = "SELECT result_id FROM dbo.internet_speeds WITH (UPDLOCK, HOLDLOCK) WHERE result_id IN ({})"
+
+# under SQL Server's limit of 2100 parameters per statement
+STORED_RESULTS_CHUNK = 1000
+
+
+def prime_known_servers(cursor):
+    """
+    Load every server id once per process, so enrich_server only has to ask
+    the database about servers that are genuinely new.
+    """
+    global _servers_primed
+    if _servers_primed:
+        return
+    with metrics.timed("server_prime"):
+        cursor.execute("SELECT server_id FROM dbo.servers")
+        KNOWN_SERVERS.update(r[0] for r in cursor.fetchall())
+    _servers_primed = True
 
 
 def enrich_server(cursor, data: dict) -> dict:
-    cursor.execute(
-        "SELECT 1 FROM dbo.servers WHERE server_id = ?", 
-        (data["server_id"],)
-    )
-    exists = cursor.fetchone() is not None
+    """ fill in coordinates for servers the database does not have yet.
+    Only the local enrichment cache is consulted here: the ipapi.co lookup
+    itself happens before the row is spooled (enrichment.enrich_row), so an
+    open transaction never waits on HTTP.
+    """
+    if data.get("server_latitude") is not None or data["server_id"] in KNOWN_SERVERS:
+        return data
+    
+    with metrics.timed("server_lookup"):
+        cursor.execute(
+            "SELECT 1 FROM dbo.servers WHERE server_id = ?", 
+            (data["server_id"],)
+        )
+        exists = cursor.fetchone() is not None
     
     if exists:
+        KNOWN_SERVERS.add(data["server_id"])
         return data
     
-    ip_data = get_server_info(data["server_ip"])
+    ip_data = lookup_server(data["server_ip"], network=False)
     
     if ip_data:
         data["server_latitude"] = ip_data.get("latitude")
         data["server_longitude"] = ip_data.get("longitude")
     return data
 
-def get_db_connection():
+def new_results(cursor, rows: list[dict]) -> list[dict]:
+    """ the rows the ingest procedure will insert: those whose result_id is
+    not stored yet, first occurrence only. Call in the ingest transaction,
+    before the procedure runs.
+
+    Args:
+        cursor: cursor of a connection with autocommit off
+        rows (list[dict]): rows produced by speedtest.transform
     """
-    create and return a connection to the SQL Server database
+    ids = list(dict.fromkeys(d["result_id"] for d in rows))
+    stored = set()
+    for i in range(0, len(ids), STORED_RESULTS_CHUNK):
+        chunk = ids[i:i + STORED_RESULTS_CHUNK]
+        stored.update(r[0] for r in cursor.execute(STORED_RESULTS.format(", ".join(["?"] * len(chunk))), chunk).fetchall())
+    new, seen = [], set()
+    for d in rows:
+        if d["result_id"] not in stored and d["result_id"] not in seen:
+            seen.add(d["result_id"])
+            new.append(d)
+    return new
+
+
+def sketch_facts(rows: list[dict], times: dict) -> list[tuple]:
+    """ (local_tz, server_id, download, upload, latency) for sketches.merge_sketches;
+    index 1 of the time dimension values is local_tz """
+    return [(times[time_key(d["measured_at_utc"])][1], d["server_id"], d["download_mbps"], d["upload_mbps"],
+             d["latency_ms"]) for d in rows]
+
+
+def ingest_params(data: dict, time_values: tuple | None = None) -> tuple:
+    """ arguments for dbo.usp_ingest_result, in parameter order
+
+    Args:
+        data (dict): a row produced by speedtest.transform
+        time_values (tuple | None): the row's time dimension if already computed
+            (see helpers.time_dim_frame); computed here otherwise
     """
-    conn_str = (
-        f"DRIVER={DRIVER};"
-        f"SERVER=127.0.0.1,{PORT};"
-        f"UID={UID};"
-        f"PWD={PWD};"
-        "TrustServerCertificate=yes;"
-        "Encrypt=yes;"
-        "Login Timeout=90;"
-        "Connect Timeout=90;"   
+    if time_values is None:
+        time_values = time_dim_values(data["measured_at_utc"])
+    return (
+        data["result_id"], data["result_url"], data["result_persisted"], data["measured_at_utc"],
+        data["download_mbps"], data["upload_mbps"], data["latency_ms"], data["jitter_ms"],
+        data["packet_loss_pct"],
+        data["server_id"], data["server_name"], data["server_host"], data["server_location"],
+        data["server_country"], data["server_ip"], data["server_port"],
+        data["server_latitude"], data["server_longitude"], data["isp"],
+        *time_values[1:],
+        1 if time_id_known(data["measured_at_utc"]) else 0,
     )
-    try:
-        conn = pyodbc.connect(conn_str, timeout=10)
-        conn.autocommit=False
-        cursor = conn.execute("USE InternetSpeed_DB")
-        cursor.close()
-        
-        return conn
-    except pyodbc.Error as e:
-        console.print(f"[bold red]Database connection failed: {e}[/]")
-        sys.exit(1)
-        
-        
-def load_to_sql(data: dict):
-    if not data:
-        return
+
+
+def insert_result(cursor, data: dict) -> dict:
+    """ write one result with a single call to dbo.usp_ingest_result.
+    Committing is left to the caller so several results can share one
+    transaction.
+
+    Args:
+        cursor: cursor of a connection with autocommit off
+        data (dict): a row produced by speedtest.transform
+
+    Returns:
+        dict: the row after server enrichment
+    """
+    prime_known_servers(cursor)
+    data = enrich_server(cursor=cursor, data=data)
+    with metrics.timed("ingest_proc", mode="row"):
+        cursor.execute(INGEST_PROC, ingest_params(data))
     
-    conn = None
+    rows = sample_rows(data["result_id"], data.get("samples"))
+    if rows:
+        with metrics.timed("samples_insert", mode="row"):
+            for row in rows:
+                cursor.execute(SAMPLES_INSERT, row)
+    return data
+
+
+def insert_result_statements(cursor, data: dict) -> dict:
+    """ the original statement-by-statement ingest (five or more round trips
+    per result). Kept for databases that do not have dbo.usp_ingest_result
+    yet and as the baseline in benchmarks/ingest_roundtrips.py.
+
+    Args:
+        cursor: cursor of a connection with autocommit off
+        data (dict): a row produced by speedtest.transform
+
+    Returns:
+        dict: the row after server enrichment
+    """
+    # 1. update time_metadata table 
+    time_dim(cursor=cursor, measured_at_utc=data["measured_at_utc"])
+    data = enrich_server(cursor=cursor, data=data)
     
-    try:
-        conn = get_db_connection()
-        conn.autocommit = False
-        cursor = conn.cursor()
-        
-        # 1. update time_metadata table 
-        time_dim(cursor=cursor, measured_at_utc=data["measured_at_utc"])
-        data = enrich_server(cursor=cursor, data=data)
-        
-        # 2. upsert to servers table
-        cursor.execute("""
-        UPDATE dbo.servers
-        SET 
-            server_name = ?,
-            server_host = ?,
-            server_location = ?,
-            server_country = ?,
-            server_ip = ?,
-            server_port = ?,
-            server_latitude = ?,
-            server_longitude = ?,
-            isp = ?,
-            last_seen_utc = GETUTCDATE()
-        WHERE server_id = ?
-        """, (
-                data["server_name"], data["server_host"], data["server_location"],
-                data["server_country"], data["server_ip"], data["server_port"],
-                data["server_latitude"], data["server_longitude"], data["isp"],
-                data["server_id"]
-            ))
-
-        if cursor.rowcount == 0:
-            cursor.execute("""
-                           INSERT INTO dbo.servers (
-                               server_id, server_name, server_host, server_location, server_country,
-                               server_ip, server_port, server_latitude, server_longitude,
-                               isp, first_seen_utc, last_seen_utc
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, GETUTCDATE(), GETUTCDATE())
-                        """, (
-                            data["server_id"], data["server_name"], data["server_host"],
-                            data["server_location"], data["server_country"],
-                            data["server_ip"], data["server_port"],
-                            data["server_latitude"], data["server_longitude"],
-                            data["isp"]
-                        ))
-        
+    # 2. upsert to servers table
+    cursor.execute("""
+    UPDATE dbo.servers
+    SET 
+        server_name = ?,
+        server_host = ?,
+        server_location = ?,
+        server_country = ?,
+        server_ip = ?,
+        server_port = ?,
+        server_latitude = ?,
+        server_longitude = ?,
+        isp = ?,
+        last_seen_utc = GETUTCDATE()
+    WHERE server_id = ?
+    """, (
+            data["server_name"], data["server_host"], data["server_location"],
+            data["server_country"], data["server_ip"], data["server_port"],
+            data["server_latitude"], data["server_longitude"], data["isp"],
+            data["server_id"]
+        ))
 
-        # 3. Insert result metadata (ignore if already exists)
+    if cursor.rowcount == 0:
         cursor.execute("""
-                        IF NOT EXISTS (SELECT 1 FROM result_metadata WHERE result_id = ?)
-                        INSERT INTO result_metadata (
-                        result_id, result_url, result_persisted, measured_at_utc
-                        ) VALUES (?, ?, ?, ?)
+                       INSERT INTO dbo.servers (
+                           server_id, server_name, server_host, server_location, server_country,
+                           server_ip, server_port, server_latitude, server_longitude,
+                           isp, first_seen_utc, last_seen_utc
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, GETUTCDATE(), GETUTCDATE())
                     """, (
-                        data["result_id"],
-                        data["result_id"],
-                        data["result_url"], 
-                        data["result_persisted"],
-                        data["measured_at_utc"]
-        ))
+                        data["server_id"], data["server_name"], data["server_host"],
+                        data["server_location"], data["server_country"],
+                        data["server_ip"], data["server_port"],
+                        data["server_latitude"], data["server_longitude"],
+                        data["isp"]
+                    ))
+    
+
+    # 3. Insert result metadata (ignore if already exists)
+    cursor.execute("""
+                    IF NOT EXISTS (SELECT 1 FROM result_metadata WHERE result_id = ?)
+                    INSERT INTO result_metadata (
+                    result_id, result_url, result_persisted, measured_at_utc
+                    ) VALUES (?, ?, ?, ?)
+                """, (
+                    data["result_id"],
+                    data["result_id"],
+                    data["result_url"], 
+                    data["result_persisted"],
+                    data["measured_at_utc"]
+    ))
+    
+    # 4. Insert Speed fact (ignore if a replay already loaded this result)
+    cursor.execute("""
+        IF NOT EXISTS (SELECT 1 FROM internet_speeds WHERE result_id = ?)
+        INSERT INTO internet_speeds (
+            result_id, server_id, measured_at_utc,
+            download_mbps, upload_mbps, latency_ms, jitter_ms, packet_loss_pct
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        data["result_id"],
+        data["result_id"],
+        data["server_id"],
+        data["measured_at_utc"],
+        data["download_mbps"],
+        data["upload_mbps"],
+        data["latency_ms"],
+        data["jitter_ms"],
+        data["packet_loss_pct"]
+    ))
+    return data
+
+
+def load_to_sql(data: dict, conn=None) -> bool:
+    """ insert one transformed speedtest result and its dimensions
+
+    Args:
+        data (dict): a row produced by speedtest.transform
+        conn: an open connection to reuse. When given, the caller owns it and it
+            is left open afterwards; otherwise a fresh connection is opened and
+            closed (returned to the pool) for this call.
+
+    Returns:
+        bool: True when the result was committed
+    """
+    if not data:
+        return False
+    
+    owns_conn = conn is None
+    
+    try:
+        if owns_conn:
+            from db import get_db_connection
+            conn = get_db_connection()
+        cursor = conn.cursor()
         
-        # 4. Insert Speed fact
-        cursor.execute("""
-            INSERT INTO internet_speeds (
-                result_id, server_id, measured_at_utc,
-                download_mbps, upload_mbps, latency_ms, jitter_ms, packet_loss_pct
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data["result_id"],
-            data["server_id"],
-            data["measured_at_utc"],
-            data["download_mbps"],
-            data["upload_mbps"],
-            data["latency_ms"],
-            data["jitter_ms"],
-            data["packet_loss_pct"]
-        ))
+        new = new_results(cursor, [data])
+        data = insert_result(cursor, data)
+        with metrics.timed("rollup_refresh"):
+            cursor.execute(REFRESH_ROLLUP)
+        with metrics.timed("sketch_refresh"):
+            times = {time_key(data["measured_at_utc"]): time_dim_values(data["measured_at_utc"])}
+            merge_sketches(cursor, sketch_facts(new, times))
         
-        conn.commit()
+        with metrics.timed("commit"):
+            conn.commit()
+        KNOWN_SERVERS.add(data["server_id"])
+        remember_time_ids([data["measured_at_utc"]])
         console.print(f"[green bold]Successfully saved the speed test results to SQL Server[/]")
+        sla.observe(new)
+        return True
         
     except Exception as e:
         console.print(f"[bold red]Database Error: {e}[/]")
         if conn:
             conn.rollback()
+        return False
     finally:
-        if conn:
+        if owns_conn and conn:
             conn.close()
+
+
+def load_batch_to_sql(rows: list[dict], conn) -> int:
+    """ insert many transformed results in a single transaction
+
+    Args:
+        rows (list[dict]): rows produced by speedtest.transform
+        conn: an open connection owned by the caller
+
+    Raises:
+        Exception: whatever the driver raised; the transaction is rolled back
+            first so the caller can retry or fall back to row-by-row loading
+
+    Returns:
+        int: number of results inserted; result_ids already stored are not counted
+    """
+    if not rows:
+        return 0
+    
+    cursor = conn.cursor()
+    try:
+        # enrich first so the whole batch goes out as one parameter array
+        prime_known_servers(cursor)
+        rows = [enrich_server(cursor=cursor, data=data) for data in rows]
+        new = new_results(cursor, rows)
         
+        # the calendar attributes for the whole batch in one pass
+        times = time_dim_batch(d["measured_at_utc"] for d in rows)
+        params = [ingest_params(d, times[time_key(d["measured_at_utc"])]) for d in rows]
         
+        cursor.fast_executemany = True
+        with metrics.timed("ingest_proc", mode="batch"):
+            cursor.executemany(INGEST_PROC, params)
+        
+        sample_params = [r for d in rows for r in sample_rows(d["result_id"], d.get("samples"))]
+        if sample_params:
+            with metrics.timed("samples_insert", mode="batch"):
+                cursor.executemany(SAMPLES_INSERT, sample_params)
+        with metrics.timed("rollup_refresh"):
+            cursor.execute(REFRESH_ROLLUP)
+        # a plain cursor, as fast_executemany does not stream VARBINARY(MAX) parameters
+        with metrics.timed("sketch_refresh"):
+            merge_sketches(conn.cursor(), sketch_facts(new, times))
+        with metrics.timed("commit"):
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    KNOWN_SERVERS.update(data["server_id"] for data in rows)
+    remember_time_ids(data["measured_at_utc"] for data in rows)
+    console.print(f"[green bold]Saved {len(new)} new of a batch of {len(rows)} speed test results to SQL Server[/]")
+    sla.observe(new)
+    return len(new)
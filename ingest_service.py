@@ -0,0 +1,365 @@
+"""
+HTTP ingest for a fleet of probes.
+
+Probes post batches of transformed results; the service folds the batches
+of many probes into group commits against the configured storage backend
+(STORAGE_BACKEND), so the database sees a few large transactions instead
+of a connection and a commit per row per probe. Only this service holds
+database credentials; each probe has its own token.
+
+    python ingest_service.py add-probe lab-07        # prints the new probe's token once
+    python ingest_service.py serve                   # INGEST_HOST:INGEST_PORT
+
+    POST /v1/results    {"rows": [row, ...]}         200 {"accepted": n} once committed
+    GET  /healthz
+    GET  /metrics       OpenMetrics, see metrics.py
+
+A probe points its collector at the service with STORAGE_BACKEND=http,
+INGEST_URL, INGEST_PROBE_ID and INGEST_TOKEN (storage.HttpStorage); rows
+stay in its spool until the service has acknowledged the commit.
+
+Backpressure: when more than INGEST_QUEUE_MAX_ROWS rows are waiting for
+the database, new batches get 503 with a Retry-After estimated from the
+recent commit rate, and the probes keep them spooled.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from aiohttp import web
+from dotenv import load_dotenv
+from rich.console import Console
+
+import metrics
+import sla
+from spool import decode_row
+
+console = Console()
+
+PROJECT_DIR = Path.cwd()
+
+load_dotenv(PROJECT_DIR / ".env")
+
+INGEST_HOST = os.getenv("INGEST_HOST", "127.0.0.1")
+INGEST_PORT = int(os.getenv("INGEST_PORT", "8470"))
+
+# probe id -> sha256 of its token; written by `add-probe`
+INGEST_PROBES_PATH = Path(os.getenv("INGEST_PROBES_PATH", PROJECT_DIR / "config" / "probes.json"))
+
+# a group commit closes at this many rows, or this long after its first batch arrived
+INGEST_GROUP_MAX_ROWS = int(os.getenv("INGEST_GROUP_MAX_ROWS", "2000"))
+INGEST_GROUP_MAX_WAIT_MS = float(os.getenv("INGEST_GROUP_MAX_WAIT_MS", "200"))
+
+# rows accepted but not yet committed before new batches are turned away
+INGEST_QUEUE_MAX_ROWS = int(os.getenv("INGEST_QUEUE_MAX_ROWS", "20000"))
+
+# largest batch one request may carry (a replay sends at most spool's batch_size)
+INGEST_MAX_BATCH_ROWS = int(os.getenv("INGEST_MAX_BATCH_ROWS", "1000"))
+
+# fields of a speedtest.transform row; optional ones default to None
+REQUIRED_FIELDS = ("result_id", "measured_at_utc", "server_id", "download_mbps", "upload_mbps")
+OPTIONAL_FIELDS = (
+    "latency_ms", "jitter_ms", "packet_loss_pct", "isp", "server_name", "server_location", "server_host",
+    "server_country", "server_ip", "server_port", "result_url", "result_persisted",
+    "server_latitude", "server_longitude", "samples",
+)
+
+
+#==========================================================================
+#               per-probe credentials
+#==========================================================================
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def read_probes(path: Path = INGEST_PROBES_PATH) -> dict[str, str]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def add_probe(probe_id: str, path: Path = INGEST_PROBES_PATH) -> str:
+    """_summary_
+    Register (or re-key) a probe. Only the token's hash is stored.
+
+    Returns:
+        str: the new token, to be put in the probe's INGEST_TOKEN
+    """
+    probes = read_probes(path)
+    token = secrets.token_urlsafe(32)
+    probes[probe_id] = _digest(token)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(probes, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+    return token
+
+
+def authenticate(request: web.Request, probes: dict[str, str]) -> str:
+    """ the probe id of a request whose bearer token matches, else 401 """
+    probe_id = request.headers.get("X-Probe-Id", "")
+    auth = request.headers.get("Authorization", "")
+    token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+    expected = probes.get(probe_id)
+    if not expected or not hmac.compare_digest(_digest(token), expected):
+        raise web.HTTPUnauthorized(text="unknown probe or bad token")
+    return probe_id
+
+
+def parse_rows(payload: dict) -> list[dict]:
+    """ validate a request body into transform-shaped rows, else 400 """
+    rows = payload.get("rows") if isinstance(payload, dict) else None
+    if not isinstance(rows, list) or not rows:
+        raise web.HTTPBadRequest(text='expected {"rows": [...]} with at least one row')
+    if len(rows) > INGEST_MAX_BATCH_ROWS:
+        raise web.HTTPRequestEntityTooLarge(max_size=INGEST_MAX_BATCH_ROWS, actual_size=len(rows),
+                                            text=f"at most {INGEST_MAX_BATCH_ROWS} rows per request")
+    out = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            raise web.HTTPBadRequest(text=f"row {i} is not an object")
+        missing = [f for f in REQUIRED_FIELDS if row.get(f) is None]
+        if missing:
+            raise web.HTTPBadRequest(text=f"row {i} is missing {', '.join(missing)}")
+        try:
+            # the spool's encoding: measured_at_utc is an ISO string on the wire
+            row = decode_row(json.dumps(row))
+        except (TypeError, ValueError) as e:
+            raise web.HTTPBadRequest(text=f"row {i}: {e}")
+        out.append({**{f: None for f in OPTIONAL_FIELDS}, **row})
+    return out
+
+
+#==========================================================================
+#               group commit with a bounded queue
+#==========================================================================
+class Overloaded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"queue full, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class GroupCommitter:
+    """
+    One writer task and one database connection. Requests put their rows
+    on a queue and wait on a future; the writer takes everything queued
+    (up to max_rows, waiting at most max_wait_ms after the first batch),
+    loads it in one transaction and resolves every waiting request. A
+    failed group is retried request by request, so one probe's bad row
+    fails only that probe's request.
+    """
+    def __init__(self, storage, max_rows: int = INGEST_GROUP_MAX_ROWS, max_wait_ms: float = INGEST_GROUP_MAX_WAIT_MS,
+                 queue_max_rows: int = INGEST_QUEUE_MAX_ROWS):
+        self.storage = storage
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue_max_rows = queue_max_rows
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.queued_rows = 0
+        # load_batch blocks and the connection must stay on one thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="group-commit")
+        self.conn = None
+        self.rows_per_sec = 0.0
+        self.groups = 0
+        self.rows = 0
+        self.rejected = 0
+
+    async def submit(self, rows: list[dict]) -> int:
+        """ queue rows and wait until they are committed; Overloaded when the queue is full
+
+        Returns:
+            int: rows accepted, i.e. len(rows): new and already stored rows
+            alike, whether the group or the per-request fallback committed them
+        """
+        if self.queued_rows + len(rows) > self.queue_max_rows:
+            self.rejected += 1
+            raise Overloaded(self.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        self.queued_rows += len(rows)
+        metrics.set_gauge("ingest_queued_rows", self.queued_rows, "Rows accepted and waiting for a group commit.")
+        await self.queue.put((rows, future))
+        return await future
+
+    def retry_after(self) -> float:
+        """ seconds for the current backlog to drain at the recent commit rate """
+        rate = self.rows_per_sec or 100.0
+        return max(1.0, min(300.0, self.queued_rows / rate))
+
+    def _load(self, rows: list[dict]) -> int:
+        if self.conn is None:
+            with metrics.timed("db_connect", backend=self.storage.name):
+                self.conn = self.storage.connect()
+        try:
+            return self.storage.load_batch(rows, self.conn)
+        except self.storage.disconnect_errors:
+            self.conn.close()
+            self.conn = None
+            raise
+
+    async def _next_group(self) -> list[tuple[list[dict], asyncio.Future]]:
+        group = [await self.queue.get()]
+        size = len(group[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            group.append(item)
+            size += len(item[0])
+        return group
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            group = await self._next_group()
+            rows = []
+            seen = set()
+            for batch, _ in group:
+                for row in batch:
+                    if row["result_id"] not in seen:
+                        seen.add(row["result_id"])
+                        rows.append(row)
+
+            started = time.perf_counter()
+            try:
+                with metrics.timed("group_commit", backend=self.storage.name):
+                    await loop.run_in_executor(self.executor, self._load, rows)
+                for batch, future in group:
+                    if not future.done():
+                        future.set_result(len(batch))
+            except Exception as e:
+                console.print(f"[bold yellow]Group of {len(rows)} rows failed ({e}) - committing per request[/]")
+                for batch, future in group:
+                    try:
+                        await loop.run_in_executor(self.executor, self._load, batch)
+                        if not future.done():
+                            future.set_result(len(batch))
+                    except Exception as batch_error:
+                        if not future.done():
+                            future.set_exception(batch_error)
+            finally:
+                elapsed = time.perf_counter() - started
+                n = sum(len(batch) for batch, _ in group)
+                self.queued_rows -= n
+                self.groups += 1
+                self.rows += len(rows)
+                # smoothed, so one slow commit does not swing Retry-After
+                if elapsed > 0:
+                    rate = len(rows) / elapsed
+                    self.rows_per_sec = rate if not self.rows_per_sec else 0.8 * self.rows_per_sec + 0.2 * rate
+                metrics.set_gauge("ingest_queued_rows", self.queued_rows, "Rows accepted and waiting for a group commit.")
+                metrics.set_gauge("ingest_group_rows", len(rows), "Rows in the last group commit.")
+
+    def stats(self) -> dict:
+        return {
+            "groups": self.groups, "rows": self.rows, "queued_rows": self.queued_rows,
+            "rejected_batches": self.rejected, "rows_per_sec": round(self.rows_per_sec, 1),
+            "avg_group_rows": round(self.rows / self.groups, 1) if self.groups else 0.0,
+        }
+
+    def close(self):
+        if self.conn is not None:
+            self.executor.submit(self.conn.close).result()
+        self.executor.shutdown()
+
+
+#==========================================================================
+#               the aiohttp application
+#==========================================================================
+COMMITTER = web.AppKey("committer", GroupCommitter)
+PROBES = web.AppKey("probes", dict)
+
+
+async def post_results(request: web.Request) -> web.Response:
+    probe_id = authenticate(request, request.app[PROBES])
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="body is not JSON")
+    rows = parse_rows(payload)
+
+    committer = request.app[COMMITTER]
+    started = time.perf_counter()
+    try:
+        accepted = await committer.submit(rows)
+    except Overloaded as e:
+        metrics.observe("ingest_request", time.perf_counter() - started, error=True, probe=probe_id)
+        raise web.HTTPServiceUnavailable(text=str(e), headers={"Retry-After": f"{e.retry_after:.0f}"})
+    except committer.storage.disconnect_errors as e:
+        metrics.observe("ingest_request", time.perf_counter() - started, error=True, probe=probe_id)
+        raise web.HTTPServiceUnavailable(text=f"database unavailable: {e}", headers={"Retry-After": "30"})
+    except Exception as e:
+        metrics.observe("ingest_request", time.perf_counter() - started, error=True, probe=probe_id)
+        raise web.HTTPUnprocessableEntity(text=f"rows could not be loaded: {e}")
+    metrics.observe("ingest_request", time.perf_counter() - started, probe=probe_id)
+    return web.json_response({"accepted": accepted})
+
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True, **request.app[COMMITTER].stats()})
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.METRICS.render().encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+def make_app(storage=None, probes: dict[str, str] | None = None, **committer_options) -> web.Application:
+    """_summary_
+    The ingest application. The group-commit writer starts and stops with it.
+
+    Args:
+        storage: backend the groups are committed to, storage.get_storage() by default
+        probes (dict | None): probe id -> token sha256, read from INGEST_PROBES_PATH by default
+        **committer_options: max_rows, max_wait_ms, queue_max_rows for GroupCommitter
+    """
+    from storage import get_storage
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app[PROBES] = read_probes() if probes is None else probes
+    storage = storage or get_storage()
+
+    async def lifecycle(app):
+        app[COMMITTER] = GroupCommitter(storage, **committer_options)
+        writer = asyncio.create_task(app[COMMITTER].run())
+        yield
+        writer.cancel()
+        app[COMMITTER].close()
+
+    app.cleanup_ctx.append(lifecycle)
+    app.router.add_post("/v1/results", post_results)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics_endpoint)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve")
+    serve.add_argument("--host", default=INGEST_HOST)
+    serve.add_argument("--port", type=int, default=INGEST_PORT)
+    add = sub.add_parser("add-probe")
+    add.add_argument("probe_id")
+    args = parser.parse_args()
+
+    if args.command == "add-probe":
+        token = add_probe(args.probe_id)
+        console.print(f"[bold green]Probe {args.probe_id} registered.[/] Set on the probe:\n"
+                      f"  STORAGE_BACKEND=http\n  INGEST_PROBE_ID={args.probe_id}\n  INGEST_TOKEN={token}")
+    else:
+        probes = read_probes()
+        if not probes:
+            console.print(f"[bold yellow]No probes in {INGEST_PROBES_PATH} - register one with add-probe[/]")
+        sla.enable()
+        web.run_app(make_app(probes=probes), host=args.host, port=args.port)
@@ -0,0 +1,132 @@
+import os
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from query_cache import WATERMARK_OVERLAP_IDS, cached_run_sql, data_watermark
+
+load_dotenv()
+
+# seconds between automatic dashboard refreshes; 0 leaves only the button
+AUTO_REFRESH_SEC = float(os.getenv("DASHBOARD_AUTO_REFRESH_SEC", "0"))
+
+
+#==========================================================================
+#       a dashboard range kept current with only the facts that are new
+#==========================================================================
+class LiveRange(ABC):
+    """
+    Holds the frame for one date range between refreshes. The first load
+    (and any change of range) reads the whole range; after that a refresh
+    costs one watermark query, plus a delta query when some have landed.
+    The delta starts WATERMARK_OVERLAP_IDS below the last watermark, so a
+    fact that committed after a higher id is still picked up; ids already
+    seen in that window are dropped. One instance per dashboard session.
+    """
+    def __init__(self, storage):
+        self.storage = storage
+        self.params = None
+        self.df = None
+        self.watermark = (0, 0)
+        self.recent: set[int] = set()
+        self.full_loads = 0
+        self.delta_loads = 0
+        self.unchanged = 0
+
+    def refresh(self, params: dict) -> pd.DataFrame:
+        """_summary_
+        The frame for params ({"start_dt", "end_dt"} in local time), fetching
+        only what changed since the last call
+
+        Returns:
+            pd.DataFrame: a copy the caller is free to modify
+        """
+        watermark = data_watermark(self.storage)
+        top = watermark[0]
+        if self.df is None or params != self.params:
+            # read before the frame: a fact that commits in between is then
+            # picked up by the next delta rather than taken as seen
+            self.recent = self._recent_ids(top)
+            self.df = self._full(params, top)
+            self.params = params
+            self.full_loads += 1
+        elif watermark != self.watermark:
+            new = self.storage.read_sql(
+                "11_raw_since.sql",
+                {**params, "after_id": max(0, self.watermark[0] - WATERMARK_OVERLAP_IDS), "upto_id": top},
+            )
+            seen = new["id"].isin(self.recent)
+            self.recent = {i for i in self.recent | set(new["id"]) if i > top - WATERMARK_OVERLAP_IDS}
+            new = new[~seen]
+            if not new.empty:
+                new["local_tz"] = pd.to_datetime(new["local_tz"])
+                self.df = self._merge(new, params)
+            self.delta_loads += 1
+        else:
+            self.unchanged += 1
+        self.watermark = watermark
+        return self.df.copy()
+
+    def stats(self) -> dict:
+        return {"full": self.full_loads, "delta": self.delta_loads, "unchanged": self.unchanged}
+
+    def _recent_ids(self, top: int) -> set[int]:
+        """ fact ids in the overlap window, which a full load covers """
+        ids = self.storage.read_sql("18_recent_ids.sql",
+                                    {"after_id": max(0, top - WATERMARK_OVERLAP_IDS), "upto_id": top})
+        return set(int(i) for i in ids["id"])
+
+    @abstractmethod
+    def _full(self, params: dict, watermark: int) -> pd.DataFrame:
+        """ the whole range, facts up to the watermark id """
+
+    @abstractmethod
+    def _merge(self, new: pd.DataFrame, params: dict) -> pd.DataFrame:
+        """ the frame with the delta's new facts folded in """
+
+
+class LiveRawRange(LiveRange):
+    """ raw facts in the range, as app.py shows them """
+
+    def _full(self, params: dict, watermark: int) -> pd.DataFrame:
+        df = self.storage.read_sql("11_raw_since.sql", {**params, "after_id": 0, "upto_id": watermark})
+        df["local_tz"] = pd.to_datetime(df["local_tz"])
+        return df
+
+    def _merge(self, new: pd.DataFrame, params: dict) -> pd.DataFrame:
+        df = pd.concat([self.df, new], ignore_index=True)
+        df = df.drop_duplicates("id", keep="last")
+        return df.sort_values("local_tz", kind="stable").reset_index(drop=True)
+
+
+class LiveHourlyRange(LiveRange):
+    """
+    Hourly medians in the range, as app-speedtest.py shows them. New facts
+    only mark their hours as changed; those hours (normally just the trailing
+    one) are read again from the rollup, which ingest already refreshed.
+    """
+
+    def _hourly(self, params: dict, cached: bool) -> pd.DataFrame:
+        if cached:
+            df = cached_run_sql(self.storage, "07_hourly_speeds_range.sql", params=params)
+        else:
+            df = self.storage.read_sql("07_hourly_speeds_range.sql", params)
+        if "hour_bucket" in df.columns:
+            df["hour_bucket"] = pd.to_datetime(df["hour_bucket"], errors="coerce")
+        return df
+
+    def _full(self, params: dict, watermark: int) -> pd.DataFrame:
+        # a revisited range can come straight from the query cache
+        return self._hourly(params, cached=True)
+
+    def _merge(self, new: pd.DataFrame, params: dict) -> pd.DataFrame:
+        hours = new["local_tz"].dt.floor("h")
+        lo = max(hours.min(), pd.Timestamp(params["start_dt"]))
+        hi = min(hours.max() + timedelta(hours=1), pd.Timestamp(params["end_dt"]))
+        fresh = self._hourly({"start_dt": lo.to_pydatetime(), "end_dt": hi.to_pydatetime()}, cached=False)
+
+        kept = self.df[(self.df["hour_bucket"] < lo) | (self.df["hour_bucket"] >= hi)]
+        df = pd.concat([kept, fresh], ignore_index=True)
+        return df.sort_values("hour_bucket", kind="stable").reset_index(drop=True)
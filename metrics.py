@@ -0,0 +1,224 @@
+"""
+Per-stage instrumentation in the OpenMetrics text format.
+
+Each stage of a cycle (the speedtest, the ipapi.co lookup, time_dim, every
+ingest statement, each dashboard query) records its duration, whether it
+failed and the bytes it moved:
+
+    with metrics.timed("ingest_proc"):
+        cursor.execute(INGEST_PROC, params)
+
+The numbers are exposed two ways, both off unless configured:
+
+    METRICS_TEXTFILE=/var/lib/node_exporter/textfile/speedtest.prom
+        rewritten after every collector cycle / push.py run, for the
+        node_exporter textfile collector
+    METRICS_PORT=9469
+        GET /metrics served from the resident collector (DASHBOARD_METRICS_PORT
+        does the same for a dashboard process)
+
+Only the standard library is used, so the collector start-up stays lean.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+PREFIX = "speedtest"
+
+# seconds; spans a cached lookup (sub-ms) up to a full speedtest (tens of s)
+DURATION_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+#==========================================================================
+#               the in-process registry
+#==========================================================================
+class Metrics:
+    """
+    Stage durations (a histogram, whose _count is the number of calls),
+    stage errors and bytes as counters, and a handful of gauges such as the
+    last measured speeds. Thread safe; one shared instance, METRICS.
+    """
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.durations: dict[tuple, list] = {}
+        self.errors: dict[tuple, int] = {}
+        self.bytes: dict[tuple, int] = {}
+        self.gauges: dict[str, tuple[str, dict[tuple, float]]] = {}
+        self.created = time.time()
+
+    def observe(self, stage: str, seconds: float, error: bool = False, **labels):
+        key = _labels({"stage": stage, **labels})
+        with self._lock:
+            # [per-bucket counts..., sum, count]
+            series = self.durations.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + 1
+            else:
+                self.errors.setdefault(key, 0)
+
+    def add_bytes(self, stage: str, direction: str, n: int | None, **labels):
+        if not n:
+            return
+        key = _labels({"stage": stage, "direction": direction, **labels})
+        with self._lock:
+            self.bytes[key] = self.bytes.get(key, 0) + int(n)
+
+    def set_gauge(self, name: str, value: float | None, help: str = "", **labels):
+        if value is None:
+            return
+        with self._lock:
+            _, series = self.gauges.setdefault(name, (help, {}))
+            series[_labels(labels)] = float(value)
+
+    @contextmanager
+    def timed(self, stage: str, **labels):
+        """ time the block as one call of stage; an exception counts as an error and is re-raised """
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - started, error=True, **labels)
+            raise
+        self.observe(stage, time.perf_counter() - started, **labels)
+
+    def render(self) -> str:
+        """ every series in the OpenMetrics text exposition format """
+        lines = []
+        with self._lock:
+            name = f"{PREFIX}_stage_duration_seconds"
+            lines += [f"# TYPE {name} histogram", f"# UNIT {name} seconds",
+                      f"# HELP {name} Wall-clock time of each call of a stage."]
+            for key, series in sorted(self.durations.items()):
+                for bound, n in zip(self.buckets, series):
+                    lines.append(f"{name}_bucket{_fmt_labels(key, (('le', repr(bound)),))} {n}")
+                lines.append(f"{name}_bucket{_fmt_labels(key, (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{name}_sum{_fmt_labels(key)} {series[-2]!r}")
+                lines.append(f"{name}_count{_fmt_labels(key)} {series[-1]}")
+                lines.append(f"{name}_created{_fmt_labels(key)} {self.created!r}")
+
+            name = f"{PREFIX}_stage_errors"
+            lines += [f"# TYPE {name} counter", f"# HELP {name} Calls of a stage that failed."]
+            for key, n in sorted(self.errors.items()):
+                lines.append(f"{name}_total{_fmt_labels(key)} {n}")
+
+            name = f"{PREFIX}_stage_transferred_bytes"
+            lines += [f"# TYPE {name} counter", f"# UNIT {name} bytes",
+                      f"# HELP {name} Bytes moved by a stage, by direction."]
+            for key, n in sorted(self.bytes.items()):
+                lines.append(f"{name}_total{_fmt_labels(key)} {n}")
+
+            for gauge, (help, series) in sorted(self.gauges.items()):
+                name = f"{PREFIX}_{gauge}"
+                lines.append(f"# TYPE {name} gauge")
+                if help:
+                    lines.append(f"# HELP {name} {help}")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_fmt_labels(key)} {_fmt_value(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+timed = METRICS.timed
+observe = METRICS.observe
+add_bytes = METRICS.add_bytes
+set_gauge = METRICS.set_gauge
+
+
+def record_result(row: dict):
+    """ the measured speeds as gauges, so they chart next to the stage timings """
+    labels = {"server_id": row.get("server_id")}
+    set_gauge("download_mbps", row.get("download_mbps"), "Download speed of the last result.", **labels)
+    set_gauge("upload_mbps", row.get("upload_mbps"), "Upload speed of the last result.", **labels)
+    set_gauge("latency_ms", row.get("latency_ms"), "Idle latency of the last result.", **labels)
+    set_gauge("last_result_timestamp_seconds", time.time(), "When the last result was measured.", **labels)
+
+
+#==========================================================================
+#               exposition: textfile and /metrics
+#==========================================================================
+def write_textfile(path: str | Path | None = None) -> Path | None:
+    """_summary_
+    Write the current metrics for the node_exporter textfile collector.
+    Written to a temporary file and renamed, so a scrape never sees half a file.
+
+    Args:
+        path: destination, METRICS_TEXTFILE by default; nothing is written
+            when neither is set
+
+    Returns:
+        Path | None: the file written
+    """
+    path = path or METRICS_TEXTFILE
+    if not path:
+        return None
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(METRICS.render())
+    os.replace(tmp, path)
+    return path
+
+
+def serve(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """_summary_
+    Serve GET /metrics on a daemon thread. Does nothing for port 0.
+
+    Returns:
+        the HTTPServer, or None when disabled
+    """
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
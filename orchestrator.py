@@ -0,0 +1,168 @@
+import os
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from rich.console import Console
+
+from speedtest import measure, transform_batch, batch_rows, list_servers
+from enrichment import enrich_row
+from spool import spool_row, replay
+
+console = Console()
+load_dotenv()
+
+# comma separated speedtest server ids swept each cycle, e.g. local Econet and
+# Vodacom servers plus a Johannesburg reference
+SWEEP_SERVERS = [s.strip() for s in os.getenv("SPEEDTEST_SERVERS", "").split(",") if s.strip()]
+
+# bandwidth tests saturate the link, so by default only one runs at a time;
+# latency probes are a few small TCP handshakes and run in parallel
+BANDWIDTH_CONCURRENCY = int(os.getenv("SWEEP_BANDWIDTH_CONCURRENCY", "1"))
+LATENCY_CONCURRENCY = int(os.getenv("SWEEP_LATENCY_CONCURRENCY", "8"))
+PER_SERVER_TIMEOUT_SEC = float(os.getenv("SWEEP_SERVER_TIMEOUT_SEC", "60"))
+
+# pause after each bandwidth test so queued traffic drains before the next one
+SETTLE_SEC = float(os.getenv("SWEEP_SETTLE_SEC", "2"))
+
+# skip the bandwidth test of a listed server no TCP probe reached, instead of
+# waiting out its timeout; 0 tests it anyway
+SKIP_UNREACHABLE = os.getenv("SWEEP_SKIP_UNREACHABLE", "1") != "0"
+
+
+#==========================================================================
+#               latency-only phase: TCP connect times, in parallel
+#==========================================================================
+def tcp_latency_ms(host: str, port: int, attempts: int = 3, timeout: float = 3) -> float | None:
+    """_summary_
+    Median TCP connect time to a server, a cheap latency estimate that does
+    not load the link
+
+    Returns:
+        float | None: milliseconds, or None when no attempt connected
+    """
+    timings = []
+    for _ in range(attempts):
+        started = time.perf_counter()
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                timings.append((time.perf_counter() - started) * 1000)
+        except OSError:
+            continue
+    return statistics.median(timings) if timings else None
+
+
+def probe_latency(server_ids: list[str], known: dict[str, dict]) -> dict[str, float | None]:
+    """_summary_
+    Probe every server's latency concurrently
+
+    Args:
+        server_ids (list[str]): servers in the sweep
+        known (dict[str, dict]): server id -> entry from speedtest.list_servers
+
+    Returns:
+        dict[str, float | None]: server id -> median connect ms (None if the
+        server's host is unknown or unreachable)
+    """
+    def _probe(server_id):
+        entry = known.get(server_id)
+        if not entry or not entry.get("host"):
+            return server_id, None
+        host, _, port = entry["host"].partition(":")
+        return server_id, tcp_latency_ms(host, int(port or entry.get("port") or 8080))
+
+    with ThreadPoolExecutor(max_workers=max(1, LATENCY_CONCURRENCY)) as pool:
+        return dict(pool.map(_probe, server_ids))
+
+
+#==========================================================================
+#               bandwidth phase: serialised by default
+#==========================================================================
+def run_sweep(server_ids: list[str] | None = None,
+              bandwidth_concurrency: int = BANDWIDTH_CONCURRENCY,
+              timeout: float = PER_SERVER_TIMEOUT_SEC,
+              load: bool = True) -> dict:
+    """_summary_
+    Test a list of servers in one cycle. A parallel latency phase runs first
+    and decides the bandwidth phase: listed servers it could not reach are
+    skipped (SWEEP_SKIP_UNREACHABLE), the rest are tested nearest first, and
+    servers missing from the CLI's list go last since they could not be
+    probed. At most bandwidth_concurrency tests run at once. Each server has
+    its own timeout, and a failing server does not stop the sweep. The transformed rows are spooled and loaded together as
+    one batch.
+
+    Args:
+        server_ids (list[str] | None): servers to test, SPEEDTEST_SERVERS by default
+        bandwidth_concurrency (int): simultaneous bandwidth tests (1 = serialised)
+        timeout (float): seconds allowed per server test
+        load (bool): spool and replay the rows here; the collector passes
+            False and loads them on its warm connection
+
+    Returns:
+        dict: {"rows": transformed rows, "latency_ms": probe results,
+        "failed": server ids without a result, "loaded": rows written to SQL}
+    """
+    server_ids = server_ids or SWEEP_SERVERS
+    if not server_ids:
+        console.print("[bold yellow]No servers to sweep - set SPEEDTEST_SERVERS[/]")
+        return {"rows": [], "latency_ms": {}, "failed": [], "loaded": 0}
+
+    known = {str(s["id"]): s for s in list_servers()}
+    latency = probe_latency(server_ids, known)
+    for server_id, ms in latency.items():
+        shown = f"{ms:.1f} ms" if ms is not None else "unreachable" if known.get(server_id, {}).get("host") else "not listed"
+        console.print(f"[dim]latency probe {server_id}: {shown}[/]")
+
+    probed = {sid for sid in server_ids if known.get(sid, {}).get("host")}
+    unreachable = [sid for sid in server_ids if sid in probed and latency[sid] is None] if SKIP_UNREACHABLE else []
+    if unreachable:
+        console.print(f"[bold yellow]Skipping bandwidth tests of unreachable servers: {', '.join(unreachable)}[/]")
+    # nearest first; servers that could not be probed after every probed one
+    to_test = sorted((sid for sid in server_ids if sid not in unreachable),
+                     key=lambda sid: (latency[sid] is None, latency[sid] or 0.0))
+
+    gate = threading.Semaphore(max(1, bandwidth_concurrency))
+
+    def _test(server_id):
+        with gate:
+            started = time.perf_counter()
+            raw, samples = measure(server_id, timeout=timeout)
+            console.print(f"[cyan]server {server_id}[/] finished in {time.perf_counter() - started:.1f}s")
+            if SETTLE_SEC > 0:
+                time.sleep(SETTLE_SEC)
+        return server_id, raw, samples
+
+    with ThreadPoolExecutor(max_workers=max(1, bandwidth_concurrency)) as pool:
+        outcomes = list(pool.map(_test, to_test))
+
+    # transform the whole sweep at once; a malformed result drops only its server
+    measured = [(server_id, raw, samples) for server_id, raw, samples in outcomes if raw is not None]
+    rows, ok = [], set()
+    if measured:
+        df, errors = transform_batch([raw for _, raw, _ in measured])
+        for e in errors:
+            console.print(f"[bold red]Error transforming results from server {measured[e['index']][0]}: {e['error']}[/]")
+        for i, row in zip(df.index, batch_rows(df)):
+            server_id, _, samples = measured[i]
+            if samples:
+                row["samples"] = samples
+            rows.append(row)
+            ok.add(server_id)
+    failed = [server_id for server_id in server_ids if server_id not in ok]
+    if failed:
+        console.print(f"[bold yellow]No result from servers: {', '.join(failed)}[/]")
+
+    loaded = 0
+    if load and rows:
+        for row in rows:
+            spool_row(enrich_row(row))
+        loaded = replay()
+
+    return {"rows": rows, "latency_ms": latency, "failed": failed, "loaded": loaded}
+
+
+if __name__ == "__main__":
+    run_sweep()
@@ -1,35 +1,26 @@
-import pyodbc
-from datetime import datetime, time
-import os
-import sys
-from dotenv import load_dotenv
+import time
 
 from rich.console import Console
-from helpers import time_dim
 
-console = Console()
-load_dotenv()
-
-load_dotenv()
-DRIVER = os.getenv("SQLSERVER_DRIVER")
-SERVER = os.getenv("SQLSERVER_HOST")
-PORT = os.getenv("SQLSERVER_PORT")
-USER = os.getenv("SQLSERVER_USER")
-PWD = os.getenv("SQLSERVER_PWD")
-DB = os.getenv("SQLSERVER_DB")
-UID = os.getenv("SQLSERVER_USER")
+# only what measuring and spooling need is imported up front; the storage
+# backend (pyodbc, SQLAlchemy, pandas) is loaded by replay() after the row is
+# safely on disk - benchmarks/startup.py keeps this path lean
+from speedtest import measure, transform
+from spool import spool_row
+from enrichment import enrich_row
+import metrics
 
-
-from speedtest import run_speedtest, get_server_info, transform
-from helpers import time_dim
-from ingest import get_db_connection, load_to_sql
+console = Console()
 
 if __name__ == "__main__":
-    raw = run_speedtest()
+    started = time.perf_counter()
+    raw, samples = measure()
+    speedtest_sec = time.perf_counter() - started
 
     if raw is None:
         console.print("[bold red]Speedtest returned no data. Skipping this run.[/]")
         console.print("===============================================================")
+        metrics.write_textfile()
         raise SystemExit(1)
 
     row = transform(raw)
@@ -37,6 +28,21 @@ if __name__ == "__main__":
     if row is None:
         console.print("[bold red]Transform failed. Skipping this run.[/]")
         console.print("===============================================================")
+        metrics.write_textfile()
         raise SystemExit(1)
 
-    load_to_sql(row)
\ No newline at end of file
+    if samples:
+        row["samples"] = samples
+
+    # spool first so the measurement survives an unreachable database, then
+    # drain the spool (this row plus anything left from earlier outages)
+    spool_row(enrich_row(row))
+    metrics.record_result(row)
+
+    import sla
+    from spool import replay
+    sla.enable()
+    replay()
+
+    metrics.observe("cycle_overhead", time.perf_counter() - started - speedtest_sec)
+    metrics.write_textfile()
@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# upper bound on the memory held by cached result frames
+QUERY_CACHE_MB = float(os.getenv("QUERY_CACHE_MB", "64"))
+
+# ids below the highest one that can still commit late (IDENTITY values are
+# assigned before commit, so a slow writer lands under a faster one's id):
+# the watermark counts them and live ranges re-read them
+WATERMARK_OVERLAP_IDS = int(os.getenv("WATERMARK_OVERLAP_IDS", "10000"))
+
+
+#==========================================================================
+#       LRU cache of dashboard query results, keyed on the data watermark
+#==========================================================================
+class QueryCache:
+    """
+    Least-recently-used cache of query result frames, bounded by their memory
+    footprint rather than by entry count. Keys include the data watermark, so
+    entries for an older state of the table are simply never hit again and
+    age out.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[tuple, tuple[pd.DataFrame, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple) -> pd.DataFrame | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].copy()
+
+    def put(self, key: tuple, df: pd.DataFrame):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (df.copy(), size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+QUERY_CACHE = QueryCache(max_bytes=int(QUERY_CACHE_MB * 1024 * 1024))
+
+
+def data_watermark(storage) -> tuple[int, int]:
+    """_summary_
+    (highest fact id, facts in the WATERMARK_OVERLAP_IDS ids below it).
+    Changes whenever rows land, including a late commit of a lower id that
+    leaves the highest id where it was.
+    """
+    w = storage.read_sql("09_watermark.sql", {"overlap": WATERMARK_OVERLAP_IDS}).iloc[0]
+    if pd.isna(w["watermark"]):
+        return 0, 0
+    return int(w["watermark"]), int(w["recent"])
+
+
+def cached_run_sql(storage, filename: str, params: dict | None = None, cache: QueryCache = QUERY_CACHE) -> pd.DataFrame:
+    """_summary_
+    storage.read_sql behind the LRU cache. Costs one tiny watermark query per call;
+    the real query only runs when this (query, params, watermark) has not
+    been seen.
+
+    Args:
+        storage: backend from storage.get_storage()
+        filename (str): the sql script to run
+        params (dict | None): query parameters
+
+    Returns:
+        pd.DataFrame: a copy the caller is free to modify
+    """
+    key = (storage.name, filename, tuple(sorted((params or {}).items())), data_watermark(storage))
+    df = cache.get(key)
+    if df is None:
+        df = storage.read_sql(filename, params=params)
+        cache.put(key, df)
+    return df
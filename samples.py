@@ -0,0 +1,52 @@
+# little-endian float32: 4 bytes per sample, a 15 s download at the CLI's
+# ~10 updates per second is well under 1 KB per phase. numpy is imported
+# inside pack/unpack so runs without samples never load it
+SAMPLE_DTYPE = "<f4"
+
+
+#==========================================================================
+#       compact storage of per-interval speedtest samples
+#==========================================================================
+def pack(values) -> bytes:
+    """ a sequence of numbers as float32 bytes """
+    import numpy as np
+    return np.asarray(values, dtype=SAMPLE_DTYPE).tobytes()
+
+
+def unpack(blob: bytes) -> "np.ndarray":
+    """ float32 bytes from dbo.result_samples back into an array """
+    import numpy as np
+    return np.frombuffer(blob, dtype=SAMPLE_DTYPE)
+
+
+def sample_rows(result_id: str, samples: dict) -> list[tuple]:
+    """_summary_
+    Parameter tuples for dbo.result_samples, one per phase that has samples
+
+    Args:
+        result_id (str): the speedtest result the samples belong to
+        samples (dict): {phase: {"elapsed_ms": [...], "value": [...]}} as
+            returned by speedtest.run_speedtest_stream
+
+    Returns:
+        list[tuple]: (result_id, phase, result_id, phase, n, elapsed_ms, value)
+        matching SAMPLES_INSERT
+    """
+    rows = []
+    for phase, series in (samples or {}).items():
+        n = len(series.get("value", []))
+        if n == 0:
+            continue
+        rows.append((
+            result_id, phase,
+            result_id, phase, n,
+            pack(series["elapsed_ms"]), pack(series["value"]),
+        ))
+    return rows
+
+
+SAMPLES_INSERT = """
+    IF NOT EXISTS (SELECT 1 FROM dbo.result_samples WHERE result_id = ? AND phase = ?)
+    INSERT INTO dbo.result_samples (result_id, phase, samples, elapsed_ms_f32, value_f32)
+    VALUES (?, ?, ?, ?, ?)
+"""
@@ -0,0 +1,347 @@
+"""
+Adaptive measurement schedule for the resident collector.
+
+A full speedtest moves hundreds of megabytes, and at a fixed cadence most of
+them are spent confirming that 3 a.m. looks like every other 3 a.m. With
+COLLECTOR_SCHEDULE=adaptive the wait before each test is
+
+    COLLECTOR_INTERVAL_SEC x SCHEDULE_TARGET_CV / variability
+
+where variability is the geometric mean of the recent test-to-test change
+in download (an EWMA) and the historical variability of this local hour of
+the week (from time_metadata, sql/17_hour_of_week_profile.sql). Then:
+
+- an anomaly (a test far from the recent level, or a new SLA breach in
+  sla.py) drops to SCHEDULE_MIN_INTERVAL_SEC for the next
+  SCHEDULE_ANOMALY_FOLLOWUPS tests
+- the wait is clamped to [SCHEDULE_MIN_INTERVAL_SEC, SCHEDULE_MAX_INTERVAL_SEC]
+- with SCHEDULE_DATA_CAP_MB set, tests are paced so the calendar month's
+  remaining budget lasts until the month ends; the cap wins over the maximum
+  interval, and an exhausted budget waits for the next month
+
+Bytes used, and saved against the fixed cadence, are tracked in
+SCHEDULE_STATE_PATH and exported as metrics. What the savings cost in
+accuracy is measured offline by benchmarks/adaptive_schedule.py.
+
+    python scheduler.py status
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from rich.console import Console
+
+import metrics
+import sla
+from helpers import MaseruTimeZone
+from storage import ReadUnsupported
+
+console = Console()
+
+PROJECT_DIR = Path.cwd()
+
+load_dotenv(PROJECT_DIR / ".env")
+
+# "fixed" keeps COLLECTOR_INTERVAL_SEC between tests
+COLLECTOR_SCHEDULE = os.getenv("COLLECTOR_SCHEDULE", "fixed")
+BASE_INTERVAL_SEC = float(os.getenv("COLLECTOR_INTERVAL_SEC", "900"))
+SCHEDULE_MIN_INTERVAL_SEC = float(os.getenv("SCHEDULE_MIN_INTERVAL_SEC", "300"))
+SCHEDULE_MAX_INTERVAL_SEC = float(os.getenv("SCHEDULE_MAX_INTERVAL_SEC", str(3 * 3600)))
+
+# relative test-to-test change at which the base interval is kept: at half
+# of it the wait doubles, at twice it the wait halves
+SCHEDULE_TARGET_CV = float(os.getenv("SCHEDULE_TARGET_CV", "0.1"))
+SCHEDULE_EWMA_ALPHA = float(os.getenv("SCHEDULE_EWMA_ALPHA", "0.3"))
+# a test this many deviations from the recent level is an anomaly
+SCHEDULE_ANOMALY_K = float(os.getenv("SCHEDULE_ANOMALY_K", "3"))
+SCHEDULE_ANOMALY_FOLLOWUPS = int(os.getenv("SCHEDULE_ANOMALY_FOLLOWUPS", "3"))
+
+# per calendar month (UTC); 0 = no cap
+SCHEDULE_DATA_CAP_MB = float(os.getenv("SCHEDULE_DATA_CAP_MB", "0"))
+# assumed size of a test until real ones have been seen
+SCHEDULE_TEST_MB = float(os.getenv("SCHEDULE_TEST_MB", "250"))
+
+# weeks of history behind the hour-of-week profile, reloaded daily
+SCHEDULE_PROFILE_WEEKS = int(os.getenv("SCHEDULE_PROFILE_WEEKS", "8"))
+PROFILE_MAX_AGE_SEC = 24 * 3600
+# hours with fewer tests than this fall back to the overall variability
+PROFILE_MIN_TESTS = 4
+
+SCHEDULE_STATE_PATH = Path(os.getenv("SCHEDULE_STATE_PATH", PROJECT_DIR / "cache" / "schedule_state.json"))
+
+MB = 1_000_000
+
+
+def _utc(value) -> datetime:
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _month(at: datetime) -> str:
+    return f"{at:%Y-%m}"
+
+
+def _month_end(at: datetime) -> datetime:
+    first = at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return (first + timedelta(days=32)).replace(day=1)
+
+
+def hour_of_week(at: datetime) -> tuple[int, int]:
+    """ (ISO day of week, hour) in local time, as in time_metadata """
+    local = _utc(at).astimezone(MaseruTimeZone)
+    return local.isoweekday(), local.hour
+
+
+#==========================================================================
+#               time-of-day history
+#==========================================================================
+def profile_from_stats(stats) -> dict:
+    """_summary_
+    Coefficient of variation of download per local hour of the week
+
+    Args:
+        stats: (day_of_week, hour, tests, mean, mean_square) rows, the
+            columns of 17_hour_of_week_profile.sql
+
+    Returns:
+        dict: {(day_of_week, hour): cv}, only for hours with enough tests
+    """
+    profile = {}
+    for dow, hour, tests, mean, mean_sq in stats:
+        if tests is None or tests < PROFILE_MIN_TESTS or not mean:
+            continue
+        var = max(0.0, float(mean_sq) - float(mean) ** 2) * tests / (tests - 1)
+        profile[(int(dow), int(hour))] = math.sqrt(var) / float(mean)
+    return profile
+
+
+def profile_from_rows(rows) -> dict:
+    """ the same profile from rows in memory (the benchmark's training weeks) """
+    acc: dict = {}
+    for r in rows:
+        key = hour_of_week(r["measured_at_utc"])
+        n, s, ss = acc.get(key, (0, 0.0, 0.0))
+        x = float(r["download_mbps"])
+        acc[key] = (n + 1, s + x, ss + x * x)
+    return profile_from_stats((dow, h, n, s / n, ss / n) for (dow, h), (n, s, ss) in acc.items())
+
+
+def load_profile(storage, now: datetime | None = None, weeks: int = SCHEDULE_PROFILE_WEEKS) -> dict:
+    """ the profile from the database; empty when the backend cannot be read (http) """
+    now = now or datetime.now(timezone.utc)
+    since = (now - timedelta(weeks=weeks)).astimezone(MaseruTimeZone).replace(tzinfo=None)
+    try:
+        df = storage.read_sql("17_hour_of_week_profile.sql", {"since_dt": since})
+    except ReadUnsupported:
+        return {}
+    return profile_from_stats(df[["day_of_week", "hour", "tests", "mean_download_mbps",
+                                  "mean_sq_download_mbps"]].itertuples(index=False))
+
+
+#==========================================================================
+#               the scheduler
+#==========================================================================
+class AdaptiveScheduler:
+    """
+    Pure decision logic: observe() each test, next_interval() before each
+    wait. Times are passed in, so benchmarks/adaptive_schedule.py can replay
+    history through the same code the collector runs.
+    """
+    def __init__(self, base: float = BASE_INTERVAL_SEC, min_interval: float = SCHEDULE_MIN_INTERVAL_SEC,
+                 max_interval: float = SCHEDULE_MAX_INTERVAL_SEC, cap_mb: float = SCHEDULE_DATA_CAP_MB,
+                 profile: dict | None = None, state: dict | None = None):
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cap_bytes = cap_mb * MB
+        self.profile = profile or {}
+        self.profile_loaded_at: datetime | None = None
+
+        state = state or {}
+        self.level: float | None = state.get("level")
+        self.change = state.get("change", SCHEDULE_TARGET_CV)
+        self.dev = state.get("dev", 0.0)
+        self.tests = state.get("tests", 0)
+        self.followups = state.get("followups", 0)
+        self.breaches = state.get("breaches", 0)
+        self.test_bytes = state.get("test_bytes", SCHEDULE_TEST_MB * MB)
+        self.month = state.get("month")
+        self.month_bytes = state.get("month_bytes", 0.0)
+        # totals since the state was created, for the savings report
+        self.started_at = _utc(state["started_at"]) if state.get("started_at") else None
+        self.total_bytes = state.get("total_bytes", 0.0)
+        self.last_reason = "warm-up"
+
+    #----------------------------------------------------------------------
+    def observe(self, rows: list[dict], bytes_used: float | None = None, at: datetime | None = None) -> bool:
+        """_summary_
+        Fold one cycle's results in
+
+        Args:
+            rows (list[dict]): transformed rows of the cycle (a sweep has several)
+            bytes_used (float | None): bytes the cycle moved; estimated from
+                earlier tests when unknown
+            at (datetime | None): when the cycle ran, now by default
+
+        Returns:
+            bool: True when the cycle looked anomalous
+        """
+        at = _utc(at or datetime.now(timezone.utc))
+        self.started_at = self.started_at or at
+        if bytes_used:
+            self.test_bytes += SCHEDULE_EWMA_ALPHA * (bytes_used / max(1, len(rows)) - self.test_bytes)
+        used = bytes_used if bytes_used else self.test_bytes * len(rows)
+        if self.month != _month(at):
+            self.month, self.month_bytes = _month(at), 0.0
+        self.month_bytes += used
+        self.total_bytes += used
+
+        downs = [float(r["download_mbps"]) for r in rows if r.get("download_mbps") is not None]
+        if not downs:
+            return False
+        x = sorted(downs)[len(downs) // 2]
+        self.tests += 1
+
+        anomalous = False
+        if self.level is None:
+            self.level = x
+        else:
+            r = x - self.level
+            band = SCHEDULE_ANOMALY_K * max(self.dev, 0.05 * abs(self.level))
+            anomalous = self.tests > SCHEDULE_ANOMALY_FOLLOWUPS + 1 and abs(r) > band
+            self.change += SCHEDULE_EWMA_ALPHA * (abs(r) / max(abs(self.level), 1e-9) - self.change)
+            self.dev += SCHEDULE_EWMA_ALPHA * (min(abs(r), band) - self.dev)
+            self.level += SCHEDULE_EWMA_ALPHA * max(-band, min(band, r))
+
+        # a breach sla.py opened since the last cycle (one that stays open does
+        # not pin the schedule; on the http backend detection runs server-side)
+        breaches = sla.open_breaches()
+        anomalous = anomalous or breaches > self.breaches
+        self.breaches = breaches
+        if anomalous:
+            self.followups = SCHEDULE_ANOMALY_FOLLOWUPS
+        elif self.followups:
+            self.followups -= 1
+        return anomalous
+
+    #----------------------------------------------------------------------
+    def variability(self, at: datetime) -> float:
+        recent = max(self.change, 1e-3)
+        historical = self.profile.get(hour_of_week(at))
+        return math.sqrt(recent * max(historical, 1e-3)) if historical is not None else recent
+
+    def cap_interval(self, at: datetime) -> float:
+        """ shortest wait that keeps the rest of the month inside the data cap """
+        if not self.cap_bytes:
+            return 0.0
+        month_bytes = self.month_bytes if self.month == _month(at) else 0.0
+        left_sec = (_month_end(at) - at).total_seconds()
+        tests_left = (self.cap_bytes - month_bytes) / self.test_bytes
+        if tests_left < 1:
+            return left_sec + 1
+        return left_sec / tests_left
+
+    def next_interval(self, at: datetime | None = None) -> float:
+        """ seconds to wait before the next test """
+        at = _utc(at or datetime.now(timezone.utc))
+        if self.followups:
+            interval, self.last_reason = self.min_interval, "anomaly"
+        elif self.tests < 3:
+            interval, self.last_reason = self.base, "warm-up"
+        else:
+            interval = self.base * SCHEDULE_TARGET_CV / self.variability(at)
+            self.last_reason = "variability"
+        interval = max(self.min_interval, min(self.max_interval, interval))
+
+        cap = self.cap_interval(at)
+        if cap > interval:
+            interval, self.last_reason = cap, "data cap"
+        return interval
+
+    #----------------------------------------------------------------------
+    def savings(self, at: datetime | None = None) -> dict:
+        """ bytes used against what the fixed COLLECTOR_INTERVAL_SEC cadence would have used """
+        at = _utc(at or datetime.now(timezone.utc))
+        if self.started_at is None:
+            return {"tests": 0, "fixed_tests": 0, "mb_used": 0.0, "mb_saved": 0.0, "saved_pct": 0.0}
+        fixed_tests = (at - self.started_at).total_seconds() / self.base + 1
+        fixed_bytes = fixed_tests * self.test_bytes
+        saved = fixed_bytes - self.total_bytes
+        return {
+            "tests": self.tests,
+            "fixed_tests": int(fixed_tests),
+            "mb_used": round(self.total_bytes / MB, 1),
+            "mb_saved": round(saved / MB, 1),
+            "saved_pct": round(100 * saved / fixed_bytes, 1) if fixed_bytes else 0.0,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "level": self.level, "change": self.change, "dev": self.dev, "tests": self.tests,
+            "followups": self.followups, "breaches": self.breaches, "test_bytes": self.test_bytes, "month": self.month,
+            "month_bytes": self.month_bytes, "total_bytes": self.total_bytes,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+        }
+
+    @classmethod
+    def load(cls, path: Path = SCHEDULE_STATE_PATH, **kwargs) -> "AdaptiveScheduler":
+        state = json.loads(path.read_text()) if path.exists() else None
+        return cls(state=state, **kwargs)
+
+    def save(self, path: Path = SCHEDULE_STATE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.to_dict()))
+        os.replace(tmp, path)
+
+
+#==========================================================================
+#               the collector's side
+#==========================================================================
+def collector_wait(scheduler: AdaptiveScheduler, storage, rows: list[dict], bytes_used: float | None) -> float:
+    """_summary_
+    Record a cycle and decide the next wait. The profile is (re)loaded at
+    most daily; a database that cannot be read leaves the previous one.
+
+    Returns:
+        float: seconds until the next test
+    """
+    now = datetime.now(timezone.utc)
+    if scheduler.profile_loaded_at is None or (now - scheduler.profile_loaded_at).total_seconds() > PROFILE_MAX_AGE_SEC:
+        try:
+            scheduler.profile = load_profile(storage, now)
+        except Exception as e:
+            console.print(f"[bold yellow]Hour-of-week profile unavailable, using recent variability only: {e}[/]")
+        scheduler.profile_loaded_at = now
+
+    scheduler.observe(rows, bytes_used, now)
+    interval = scheduler.next_interval(now)
+    scheduler.save()
+
+    saved = scheduler.savings(now)
+    metrics.set_gauge("schedule_interval_seconds", interval, "Wait chosen before the next test.",
+                      reason=scheduler.last_reason)
+    metrics.set_gauge("schedule_bytes_used", scheduler.total_bytes, "Bytes moved by tests since the state was created.")
+    metrics.set_gauge("schedule_bytes_saved", saved["mb_saved"] * MB, "Bytes not moved against the fixed cadence.")
+    metrics.set_gauge("schedule_month_bytes", scheduler.month_bytes, "Bytes moved by tests this calendar month.")
+    console.print(f"[dim]next test in {interval / 60:.1f} min ({scheduler.last_reason}); "
+                  f"saved {saved['mb_saved']:,.0f} MB ({saved['saved_pct']}%) against the fixed cadence[/]")
+    return interval
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("status",))
+    args = parser.parse_args()
+
+    scheduler = AdaptiveScheduler.load()
+    console.print(scheduler.to_dict())
+    console.print(scheduler.savings())
+    console.print(f"next interval: {scheduler.next_interval() / 60:.1f} min ({scheduler.last_reason})")
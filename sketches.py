@@ -0,0 +1,406 @@
+"""
+Mergeable quantile sketches (t-digest) per local hour and server.
+
+Ingest merges the facts it inserts into one digest per metric for every
+hour and server they fall in (server_id 0 = all servers, as in the hourly
+rollup), serialized into hourly_sketches. A percentile over any range merges the digests of the
+hours in it, so p5/p95 over a quarter costs about 2,000 small merges
+instead of a PERCENTILE_CONT over every raw row.
+
+    python sketches.py rebuild --start 2024-01-01 --end 2026-01-01    # existing history
+    python sketches.py query --start 2026-01-01 --end 2026-02-01 -q 0.05 0.5 0.95
+
+Pure Python (math and struct) so ingest does not need numpy for it. A
+digest of an hour with a handful of tests keeps every value and is exact.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import struct
+from datetime import datetime, timedelta
+
+from rich.console import Console
+
+console = Console()
+
+# centroids kept are at most about this many; 100 keeps tail quantiles within
+# a fraction of a percent of rank
+DIGEST_COMPRESSION = 100
+
+SKETCH_METRICS = ("download_mbps", "upload_mbps", "latency_ms")
+
+# version, compression, centroids, min, max
+_HEADER = struct.Struct("<BHIff")
+_VERSION = 1
+
+
+#==========================================================================
+#               t-digest
+#==========================================================================
+class TDigest:
+    """
+    Merging t-digest (Dunning) with the arcsine scale function: centroids
+    near the tails stay small, so extreme percentiles stay accurate while
+    the middle is summarised coarsely. Merging two digests is
+    concatenating their centroids and compressing again.
+    """
+    def __init__(self, compression: int = DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means: list[float] = []
+        self.weights: list[float] = []
+        self.min = math.inf
+        self.max = -math.inf
+
+    @classmethod
+    def of(cls, values, compression: int = DIGEST_COMPRESSION) -> "TDigest":
+        digest = cls(compression)
+        digest.update(values)
+        return digest
+
+    @property
+    def count(self) -> float:
+        return sum(self.weights)
+
+    def update(self, values):
+        values = [float(v) for v in values if v is not None and not math.isnan(float(v))]
+        if not values:
+            return
+        self.min = min(self.min, min(values))
+        self.max = max(self.max, max(values))
+        self._compress(list(zip(self.means, self.weights)) + [(v, 1.0) for v in values])
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        if other.means:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(list(zip(self.means, self.weights)) + list(zip(other.means, other.weights)))
+        return self
+
+    @classmethod
+    def merge_all(cls, digests) -> "TDigest":
+        """ one compression over every centroid, faster and tighter than merging pairwise """
+        out = cls()
+        centroids = []
+        for d in digests:
+            if d.means:
+                out.min = min(out.min, d.min)
+                out.max = max(out.max, d.max)
+                centroids.extend(zip(d.means, d.weights))
+        if centroids:
+            out._compress(centroids)
+        return out
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k: float) -> float:
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self, centroids: list[tuple[float, float]]):
+        centroids.sort()
+        total = sum(w for _, w in centroids)
+        means, weights = [], []
+        done = 0.0
+        mean, weight = centroids[0]
+        limit = self._q(self._k(0.0) + 1) * total
+        for m, w in centroids[1:]:
+            if done + weight + w <= limit:
+                weight += w
+                mean += (m - mean) * w / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                done += weight
+                limit = self._q(self._k(done / total) + 1) * total
+                mean, weight = m, w
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q: float) -> float | None:
+        """ the value at rank q (0..1), interpolating between centroid centres """
+        if not self.means:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+        total = self.count
+        index = q * total
+        if index <= 0:
+            return self.min
+        if index >= total:
+            return self.max
+
+        # between the minimum and the first centroid's centre
+        first = self.weights[0] / 2
+        if index < first:
+            return self.min + (self.means[0] - self.min) * index / first
+
+        centre = first
+        for i in range(len(self.means) - 1):
+            gap = (self.weights[i] + self.weights[i + 1]) / 2
+            if index < centre + gap:
+                t = (index - centre) / gap
+                return self.means[i] + (self.means[i + 1] - self.means[i]) * t
+            centre += gap
+
+        # between the last centroid's centre and the maximum
+        last = self.weights[-1] / 2
+        return self.means[-1] + (self.max - self.means[-1]) * min(1.0, (index - centre) / last)
+
+    def to_bytes(self) -> bytes:
+        """ header, then little-endian float32 means and weights """
+        n = len(self.means)
+        return (_HEADER.pack(_VERSION, self.compression, n, self.min if n else 0.0, self.max if n else 0.0)
+                + struct.pack(f"<{n}f", *self.means) + struct.pack(f"<{n}f", *self.weights))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes | None) -> "TDigest":
+        digest = cls()
+        if not blob:
+            return digest
+        version, compression, n, lo, hi = _HEADER.unpack_from(blob)
+        if version != _VERSION:
+            raise ValueError(f"unknown sketch version {version}")
+        digest.compression = compression
+        offset = _HEADER.size
+        digest.means = list(struct.unpack_from(f"<{n}f", blob, offset))
+        digest.weights = list(struct.unpack_from(f"<{n}f", blob, offset + 4 * n))
+        if n:
+            digest.min, digest.max = lo, hi
+        return digest
+
+
+#==========================================================================
+#               maintained on ingest, per hour and server
+#==========================================================================
+SKETCH_SOURCE = """
+    SELECT t.local_tz, i.server_id, i.download_mbps, i.upload_mbps, i.latency_ms
+    FROM internet_speeds i JOIN time_metadata t ON i.measured_at_utc = t.time_id
+    WHERE t.local_tz >= ? AND t.local_tz < ?
+"""
+
+SKETCH_DELETE = "DELETE FROM hourly_sketches WHERE hour_bucket = ?"
+
+SKETCH_INSERT = """
+    INSERT INTO hourly_sketches (hour_bucket, server_id, samples, download_digest, upload_digest, latency_digest)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+# the stored digests of a run of hours; {hint} is a lock hint on SQL Server
+SKETCH_STORED = """
+    SELECT hour_bucket, server_id, samples, download_digest, upload_digest, latency_digest
+    FROM hourly_sketches{hint}
+    WHERE hour_bucket >= ? AND hour_bucket < ?
+"""
+
+SKETCH_DELETE_KEY = "DELETE FROM hourly_sketches WHERE hour_bucket = ? AND server_id = ?"
+
+
+def _as_datetime(value) -> datetime:
+    # pyodbc returns datetimes, sqlite3 the stored text
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def _hour(value) -> datetime:
+    value = _as_datetime(value)
+    if hasattr(value, "to_pydatetime"):
+        value = value.to_pydatetime()
+    return value.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+
+
+def _runs(hours: list[datetime]) -> list[tuple[datetime, datetime]]:
+    """ consecutive hours collapsed into [start, end) ranges, one query each """
+    runs = []
+    for h in sorted(hours):
+        if runs and runs[-1][1] == h:
+            runs[-1][1] = h + timedelta(hours=1)
+        else:
+            runs.append([h, h + timedelta(hours=1)])
+    return [tuple(r) for r in runs]
+
+
+def merge_sketches(cursor, facts, dialect: str = "sqlserver") -> int:
+    """_summary_
+    Add newly inserted facts to the stored digests of their hours, inside
+    the caller's transaction. Only the digests of those hours are read, never
+    the facts, so the cost follows the batch and not the size of the hour.
+    Pass only facts that were actually inserted: a duplicate result would be
+    counted twice.
+
+    Args:
+        cursor: pyodbc cursor or sqlite3.Connection, in the ingest transaction
+        facts: (local_tz, server_id, download_mbps, upload_mbps, latency_ms)
+            of each new fact, local_tz in Africa/Maseru time
+        dialect (str): "sqlserver" reads the stored digests WITH (UPDLOCK,
+            HOLDLOCK), so concurrent batches for the same hour merge in turn;
+            SQLite has a single writer and no hints
+
+    Returns:
+        int: hourly_sketches rows written
+    """
+    groups: dict[tuple[datetime, int], list[tuple]] = {}
+    for local_tz, server_id, down, up, latency in facts:
+        hour = _hour(local_tz)
+        groups.setdefault((hour, int(server_id)), []).append((down, up, latency))
+        groups.setdefault((hour, 0), []).append((down, up, latency))
+    if not groups:
+        return 0
+
+    query = SKETCH_STORED.format(hint="" if dialect == "sqlite" else " WITH (UPDLOCK, HOLDLOCK)")
+    stored = {}
+    for lo, hi in _runs(list({hour for hour, _ in groups})):
+        for hour, server_id, samples, *blobs in cursor.execute(query, (lo, hi)).fetchall():
+            key = (_hour(hour), int(server_id))
+            if key in groups:
+                stored[key] = (samples, blobs)
+
+    rows = []
+    for (hour, server_id), values in sorted(groups.items()):
+        samples, blobs = stored.get((hour, server_id), (0, (None, None, None)))
+        digests = []
+        for blob, column in zip(blobs, zip(*values)):
+            digest = TDigest.from_bytes(bytes(blob) if blob is not None else None)
+            digest.update(column)
+            digests.append(digest.to_bytes())
+        rows.append((hour, server_id, samples + len(values), *digests))
+
+    if stored:
+        cursor.executemany(SKETCH_DELETE_KEY, sorted(stored))
+    cursor.executemany(SKETCH_INSERT, rows)
+    return len(rows)
+
+
+def refresh_sketches(cursor, local_times) -> int:
+    """_summary_
+    Rebuild the digests of every hour in local_times from the facts, inside
+    the caller's transaction (rebuild, for existing history; ingest merges
+    with merge_sketches instead). Works on a pyodbc cursor or a sqlite3
+    connection: both take ? parameters and the tables have the same names.
+
+    Args:
+        cursor: pyodbc cursor or sqlite3.Connection, in the ingest transaction
+        local_times: local (Africa/Maseru) times of the facts just loaded
+
+    Returns:
+        int: hourly_sketches rows written
+    """
+    hours = {_hour(t) for t in local_times if t is not None}
+    if not hours:
+        return 0
+
+    groups: dict[tuple[datetime, int], list[tuple]] = {}
+    for lo, hi in _runs(list(hours)):
+        for local_tz, server_id, down, up, latency in cursor.execute(SKETCH_SOURCE, (lo, hi)).fetchall():
+            hour = _hour(local_tz)
+            groups.setdefault((hour, int(server_id)), []).append((down, up, latency))
+            groups.setdefault((hour, 0), []).append((down, up, latency))
+
+    rows = []
+    for (hour, server_id), values in sorted(groups.items()):
+        columns = list(zip(*values))
+        rows.append((hour, server_id, len(values), *(TDigest.of(c).to_bytes() for c in columns)))
+
+    cursor.executemany(SKETCH_DELETE, [(h,) for h in sorted(hours)])
+    if rows:
+        cursor.executemany(SKETCH_INSERT, rows)
+    return len(rows)
+
+
+#==========================================================================
+#               percentiles over a range
+#==========================================================================
+def merge_frame(df, quantiles=(0.05, 0.5, 0.95)) -> dict:
+    """_summary_
+    Merge the digests in a frame of 15_hourly_sketches_range.sql rows
+
+    Returns:
+        dict: {"samples": n, "download_mbps": {q: value}, "upload_mbps": {...}, "latency_ms": {...}}
+    """
+    digests = {
+        metric: TDigest.merge_all(TDigest.from_bytes(bytes(blob) if blob is not None else None) for blob in df[column])
+        for column, metric in zip(("download_digest", "upload_digest", "latency_digest"), SKETCH_METRICS)
+    }
+    out = {"samples": int(df["samples"].sum()) if len(df) else 0}
+    for metric, digest in digests.items():
+        out[metric] = {q: digest.quantile(q) for q in quantiles}
+    return out
+
+
+def range_quantiles(storage, start_dt: datetime, end_dt: datetime, quantiles=(0.05, 0.5, 0.95),
+                    server_id: int = 0, freq: str | None = None):
+    """_summary_
+    Percentiles of each metric over [start_dt, end_dt) local time, from the
+    hourly digests
+
+    Args:
+        storage: a storage backend (storage.get_storage())
+        quantiles: ranks to return, 0..1
+        server_id (int): one server, or 0 for all of them
+        freq (str | None): a pandas frequency ("D", "W") for one row per
+            period; None for a single row over the whole range
+
+    Returns:
+        pd.DataFrame: period_start, samples and <metric>_p<rank> columns
+    """
+    import pandas as pd
+
+    df = storage.read_sql("15_hourly_sketches_range.sql",
+                          {"start_dt": start_dt, "end_dt": end_dt, "server_id": server_id})
+    if df.empty:
+        return pd.DataFrame()
+    df["hour_bucket"] = pd.to_datetime(df["hour_bucket"])
+
+    groups = [(pd.Timestamp(start_dt), df)] if freq is None else df.groupby(df["hour_bucket"].dt.to_period(freq).dt.start_time)
+    rows = []
+    for period_start, part in groups:
+        merged = merge_frame(part, quantiles)
+        row = {"period_start": period_start, "samples": merged["samples"]}
+        for metric in SKETCH_METRICS:
+            for q in quantiles:
+                row[f"{metric}_p{q * 100:g}"] = merged[metric][q]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def rebuild(storage, start: datetime, end: datetime, days_per_chunk: int = 7) -> int:
+    """ build the digests for existing history, a chunk of days per transaction """
+    total = 0
+    conn = storage.connect()
+    try:
+        cursor = conn.cursor() if storage.name == "sqlserver" else conn
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + timedelta(days=days_per_chunk), end)
+            hours = []
+            h = chunk_start
+            while h < chunk_end:
+                hours.append(h)
+                h += timedelta(hours=1)
+            total += refresh_sketches(cursor, hours)
+            conn.commit()
+            console.print(f"[cyan]sketches up to {chunk_end:%Y-%m-%d}: {total} rows[/]")
+            chunk_start = chunk_end
+    finally:
+        conn.close()
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("rebuild", "query"))
+    parser.add_argument("--start", type=datetime.fromisoformat, required=True, help="local time")
+    parser.add_argument("--end", type=datetime.fromisoformat, required=True, help="local time, exclusive")
+    parser.add_argument("--server-id", type=int, default=0)
+    parser.add_argument("-q", "--quantiles", type=float, nargs="+", default=[0.05, 0.5, 0.95])
+    parser.add_argument("--freq", help='one row per period, e.g. "D" or "W"')
+    args = parser.parse_args()
+
+    from storage import get_storage
+
+    backend = get_storage()
+    if args.command == "rebuild":
+        console.print(f"{rebuild(backend, args.start, args.end)} hourly sketches written")
+    else:
+        console.print(range_quantiles(backend, args.start, args.end, args.quantiles, args.server_id, args.freq))
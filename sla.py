@@ -0,0 +1,437 @@
+"""
+Streaming SLA and degradation detector, fed by ingest.
+
+Every newly inserted row updates a few numbers per server and per ISP (a
+robust EWMA of each metric and its mean absolute deviation, plus run
+counters), so detection is O(1) per sample and never re-reads history.
+It is off until a process calls enable(): the collectors (collector.py,
+push.py) and the ingest service do, while backfills, synthetic loads and
+benchmarks leave the state and the sinks alone.
+
+- sla_breach / sla_resolved: SLA_SUSTAIN_SAMPLES tests in a row below
+  SLA_TOLERANCE x the promised download (or upload), or above the latency
+  ceiling, and as many back within it to resolve
+- latency_spike: a test far above the recent latency level
+  (SLA_SPIKE_K deviations), once per spike
+
+Promised speeds default to SLA_PROMISED_DOWNLOAD_MBPS / SLA_MAX_LATENCY_MS
+and can be set per ISP in config/sla.json:
+
+    {"default": {"download_mbps": 35, "latency_ms": 150},
+     "isps": {"Vodacom Lesotho": {"download_mbps": 20, "upload_mbps": 5}}}
+
+Alerts go to the sinks in SLA_ALERT_SINKS (comma separated):
+
+    file       JSON lines in SLA_ALERT_PATH (default logs/sla_alerts.jsonl)
+    webhook    POST {"alerts": [...]} to SLA_WEBHOOK_URL, from a background
+               thread so a slow endpoint never holds up ingest
+    table      rows in sla_alerts on the STORAGE_BACKEND database
+               (sql/16_sla_alerts.sql)
+
+The detector state is kept in SLA_STATE_PATH so a restart carries on where
+it left off. Standard library only; it runs inside the collector.
+
+    python sla.py status            # current level and open breaches per key
+    python sla.py tail -n 20        # latest alerts from the file sink
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from rich.console import Console
+
+import metrics
+
+console = Console()
+
+PROJECT_DIR = Path.cwd()
+
+load_dotenv(PROJECT_DIR / ".env")
+
+SLA_CONFIG_PATH = Path(os.getenv("SLA_CONFIG_PATH", PROJECT_DIR / "config" / "sla.json"))
+SLA_STATE_PATH = Path(os.getenv("SLA_STATE_PATH", PROJECT_DIR / "cache" / "sla_state.json"))
+SLA_ALERT_PATH = Path(os.getenv("SLA_ALERT_PATH", PROJECT_DIR / "logs" / "sla_alerts.jsonl"))
+SLA_ALERT_SINKS = [s.strip() for s in os.getenv("SLA_ALERT_SINKS", "file").split(",") if s.strip()]
+SLA_WEBHOOK_URL = os.getenv("SLA_WEBHOOK_URL", "")
+SLA_WEBHOOK_TIMEOUT_SEC = float(os.getenv("SLA_WEBHOOK_TIMEOUT_SEC", "5"))
+# alert batches waiting for the webhook thread; more are dropped, not queued
+SLA_WEBHOOK_QUEUE = int(os.getenv("SLA_WEBHOOK_QUEUE", "100"))
+
+# what the ISP promises when config/sla.json does not say (the dashboard's line)
+SLA_PROMISED_DOWNLOAD_MBPS = float(os.getenv("SLA_PROMISED_DOWNLOAD_MBPS", "35"))
+SLA_MAX_LATENCY_MS = float(os.getenv("SLA_MAX_LATENCY_MS", "150"))
+
+# a breach is a test below this share of the promise...
+SLA_TOLERANCE = float(os.getenv("SLA_TOLERANCE", "0.8"))
+# ...this many tests in a row (one bad test is noise, three is a pattern)
+SLA_SUSTAIN_SAMPLES = int(os.getenv("SLA_SUSTAIN_SAMPLES", "3"))
+
+# EWMA weight of a new test: 0.2 remembers roughly the last ten
+SLA_EWMA_ALPHA = float(os.getenv("SLA_EWMA_ALPHA", "0.2"))
+# a latency this many deviations above the level is a spike; updates are
+# clipped to the same band so one outlier does not drag the level
+SLA_SPIKE_K = float(os.getenv("SLA_SPIKE_K", "4"))
+# tests seen before a key's spikes are judged
+SLA_WARMUP_SAMPLES = int(os.getenv("SLA_WARMUP_SAMPLES", "10"))
+
+# replayed or backfilled rows older than this update the state but do not alert
+SLA_ALERT_MAX_AGE_MIN = float(os.getenv("SLA_ALERT_MAX_AGE_MIN", "180"))
+
+# floor on the deviation, as a share of the level, so a flat series does not
+# turn every wobble into a spike
+MIN_DEV_RATIO = 0.05
+
+LIMIT_METRICS = {
+    # metric: (config key, True when lower values breach)
+    "download_mbps": ("download_mbps", True),
+    "upload_mbps": ("upload_mbps", True),
+    "latency_ms": ("latency_ms", False),
+}
+
+
+#==========================================================================
+#               per-key state
+#==========================================================================
+class Tracker:
+    """ rolling level and deviation of one metric for one key, plus the breach
+    runs and the time of the latest test folded in (ISO text, for the state file) """
+    __slots__ = ("level", "dev", "n", "bad_run", "good_run", "breached", "spiking", "last_at")
+
+    def __init__(self, level=None, dev=0.0, n=0, bad_run=0, good_run=0, breached=False, spiking=False,
+                 last_at=None):
+        self.level = level
+        self.dev = dev
+        self.n = n
+        self.bad_run = bad_run
+        self.good_run = good_run
+        self.breached = breached
+        self.spiking = spiking
+        self.last_at = last_at
+
+    def band(self) -> float:
+        return SLA_SPIKE_K * max(self.dev, MIN_DEV_RATIO * abs(self.level or 0.0))
+
+    def update(self, x: float):
+        """ robust EWMA: past the warm-up, a residual counts at most one band """
+        if self.level is None:
+            self.level = x
+        else:
+            r = x - self.level
+            if self.n >= SLA_WARMUP_SAMPLES:
+                bound = self.band()
+                r = max(-bound, min(bound, r))
+            self.level += SLA_EWMA_ALPHA * r
+            self.dev += SLA_EWMA_ALPHA * (abs(r) - self.dev)
+        self.n += 1
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def read_config(path: Path = SLA_CONFIG_PATH) -> dict:
+    """ {"default": {...}, "isps": {isp: {...}}}; missing file = env defaults only """
+    config = {"default": {}, "isps": {}}
+    if path.exists():
+        config.update(json.loads(path.read_text()))
+    default = {"download_mbps": SLA_PROMISED_DOWNLOAD_MBPS, "latency_ms": SLA_MAX_LATENCY_MS}
+    config["default"] = {**default, **config["default"]}
+    return config
+
+
+def _utc(value) -> datetime | None:
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+#==========================================================================
+#               the detector
+#==========================================================================
+class Detector:
+    """
+    Keys are "server:<id>" and "isp:<name>". A server is held to the
+    promise of the ISP of the probe that tested it.
+    """
+    def __init__(self, config: dict | None = None, state: dict | None = None):
+        self.config = config or read_config()
+        self.trackers: dict[str, dict[str, Tracker]] = {
+            key: {m: Tracker(**t) for m, t in per_metric.items()}
+            for key, per_metric in (state or {}).items()
+        }
+
+    @classmethod
+    def load(cls, path: Path = SLA_STATE_PATH) -> "Detector":
+        state = json.loads(path.read_text()) if path.exists() else None
+        return cls(state=state)
+
+    def save(self, path: Path = SLA_STATE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({k: {m: t.to_dict() for m, t in v.items()} for k, v in self.trackers.items()}))
+        os.replace(tmp, path)
+
+    def limits(self, isp: str | None) -> dict:
+        return {**self.config["default"], **self.config["isps"].get(isp or "", {})}
+
+    def observe(self, rows: list[dict], now: datetime | None = None) -> list[dict]:
+        """_summary_
+        Fold newly inserted rows into the state, oldest first. A row older
+        than the latest one a tracker has seen (a late replay, or a
+        backfill behind live data) is skipped by that tracker, so runs and
+        levels only ever move forward in time.
+
+        Args:
+            rows (list[dict]): rows as loaded (speedtest.transform output)
+            now (datetime | None): for the age cut-off; the current time by default
+
+        Returns:
+            list[dict]: alerts raised by these rows
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(minutes=SLA_ALERT_MAX_AGE_MIN)
+        alerts = []
+        for row in sorted(rows, key=lambda r: _utc(r.get("measured_at_utc")) or now):
+            measured = _utc(row.get("measured_at_utc"))
+            alerting = measured is not None and measured >= cutoff
+            limits = self.limits(row.get("isp"))
+            keys = [f"server:{row.get('server_id')}"]
+            if row.get("isp"):
+                keys.append(f"isp:{row['isp']}")
+            for key in keys:
+                for metric, (limit_key, low_is_bad) in LIMIT_METRICS.items():
+                    x = row.get(metric)
+                    if x is None:
+                        continue
+                    tracker = self.trackers.setdefault(key, {}).setdefault(metric, Tracker())
+                    if measured is not None:
+                        if tracker.last_at is not None and measured < _utc(tracker.last_at):
+                            continue
+                        tracker.last_at = measured.isoformat()
+                    for alert in self._check(tracker, float(x), limits.get(limit_key), low_is_bad):
+                        if alerting:
+                            alerts.append({
+                                "raised_at_utc": now.isoformat(timespec="seconds"),
+                                "measured_at_utc": measured.isoformat(timespec="seconds"),
+                                "scope": key.split(":", 1)[0], "key": key.split(":", 1)[1],
+                                "metric": metric, "value": round(float(x), 3),
+                                "level": round(tracker.level, 3),
+                                "result_id": row.get("result_id"), **alert,
+                            })
+        return alerts
+
+    def _check(self, t: Tracker, x: float, limit, low_is_bad: bool) -> list[dict]:
+        out = []
+
+        # latency spike against the level before this test moves it
+        if not low_is_bad and t.n >= SLA_WARMUP_SAMPLES:
+            spike = x > t.level + t.band()
+            if spike and not t.spiking:
+                out.append({"kind": "latency_spike", "threshold": round(t.level + t.band(), 3)})
+            t.spiking = spike
+        t.update(x)
+
+        # sustained breach of the promise, with the same run length to resolve
+        if limit is not None:
+            threshold = float(limit) * SLA_TOLERANCE if low_is_bad else float(limit)
+            bad = x < threshold if low_is_bad else x > threshold
+            t.bad_run, t.good_run = (t.bad_run + 1, 0) if bad else (0, t.good_run + 1)
+            if not t.breached and t.bad_run >= SLA_SUSTAIN_SAMPLES:
+                t.breached = True
+                out.append({"kind": "sla_breach", "threshold": round(threshold, 3), "run": t.bad_run})
+            elif t.breached and t.good_run >= SLA_SUSTAIN_SAMPLES:
+                t.breached = False
+                out.append({"kind": "sla_resolved", "threshold": round(threshold, 3), "run": t.good_run})
+        return out
+
+    def status(self) -> list[dict]:
+        return [
+            {"key": key, "metric": m, "level": round(t.level, 3) if t.level is not None else None,
+             "dev": round(t.dev, 3), "samples": t.n, "breached": t.breached}
+            for key, per_metric in sorted(self.trackers.items()) for m, t in per_metric.items()
+        ]
+
+
+#==========================================================================
+#               sinks
+#==========================================================================
+class FileSink:
+    def __init__(self, path: Path = SLA_ALERT_PATH):
+        self.path = Path(path)
+
+    def emit(self, alerts: list[dict]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.writelines(json.dumps(a) + "\n" for a in alerts)
+
+
+class WebhookSink:
+    """
+    emit() only queues the batch; a daemon thread POSTs it, so the commit
+    path (and the ingest service's single writer) never waits on the
+    endpoint. Batches still queued at exit get up to one timeout to go out.
+    """
+    def __init__(self, url: str = SLA_WEBHOOK_URL, timeout: float = SLA_WEBHOOK_TIMEOUT_SEC,
+                 max_queued: int = SLA_WEBHOOK_QUEUE):
+        if not url:
+            raise ValueError("SLA_WEBHOOK_URL is not set")
+        self.url = url
+        self.timeout = timeout
+        self.queue: queue.Queue[list[dict]] = queue.Queue(maxsize=max_queued)
+        threading.Thread(target=self._run, name="sla-webhook", daemon=True).start()
+        atexit.register(self.flush)
+
+    def emit(self, alerts: list[dict]):
+        try:
+            self.queue.put_nowait(alerts)
+        except queue.Full:
+            console.print(f"[bold red]SLA webhook queue full - dropped {len(alerts)} alerts[/]")
+
+    def flush(self, timeout: float | None = None):
+        """ wait until the queued batches are sent, or timeout seconds """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _run(self):
+        while True:
+            alerts = self.queue.get()
+            try:
+                self._post(alerts)
+            except Exception as e:
+                console.print(f"[bold red]SLA webhook failed: {e}[/]")
+            finally:
+                self.queue.task_done()
+
+    def _post(self, alerts: list[dict]):
+        import urllib.request
+
+        request = urllib.request.Request(self.url, data=json.dumps({"alerts": alerts}).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        with metrics.timed("sla_webhook"), urllib.request.urlopen(request, timeout=self.timeout) as resp:
+            resp.read()
+
+
+class TableSink:
+    """ sla_alerts on a storage backend, one short transaction per emit """
+    INSERT = """
+        INSERT INTO sla_alerts (raised_at_utc, measured_at_utc, kind, scope, alert_key, metric,
+                                value, level, threshold, result_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    def __init__(self, storage=None):
+        if storage is None:
+            from storage import get_storage
+            storage = get_storage()
+        self.storage = storage
+
+    def emit(self, alerts: list[dict]):
+        conn = self.storage.connect()
+        try:
+            cursor = conn.cursor() if self.storage.name == "sqlserver" else conn
+            cursor.executemany(self.INSERT, [(
+                datetime.fromisoformat(a["raised_at_utc"]), datetime.fromisoformat(a["measured_at_utc"]),
+                a["kind"], a["scope"], a["key"], a["metric"], a["value"], a["level"], a["threshold"], a["result_id"],
+            ) for a in alerts])
+            conn.commit()
+        finally:
+            conn.close()
+
+
+SINKS = {"file": FileSink, "webhook": WebhookSink, "table": TableSink}
+
+
+def make_sinks(names: list[str] = SLA_ALERT_SINKS) -> list:
+    unknown = set(names) - set(SINKS)
+    if unknown:
+        raise ValueError(f"unknown SLA_ALERT_SINKS {sorted(unknown)}; expected {sorted(SINKS)}")
+    return [SINKS[name]() for name in names]
+
+
+#==========================================================================
+#               the ingest hook
+#==========================================================================
+_enabled = False
+_detector: Detector | None = None
+_sinks: list | None = None
+
+
+def enable(on: bool = True):
+    """ turn observe() on for this process (the collectors and the ingest service) """
+    global _enabled
+    _enabled = on
+
+
+def open_breaches() -> int:
+    """ sustained breaches currently open in this process's detector """
+    if _detector is None:
+        return 0
+    return sum(t.breached for per_metric in _detector.trackers.values() for t in per_metric.values())
+
+
+def observe(rows: list[dict]) -> list[dict]:
+    """_summary_
+    Called by ingest after a commit, with only the rows it inserted. Does
+    nothing unless enable() was called. Never raises: a detector or sink
+    failure is reported and the rows stay loaded.
+
+    Returns:
+        list[dict]: the alerts raised
+    """
+    global _detector, _sinks
+    if not _enabled or not rows:
+        return []
+    try:
+        with metrics.timed("sla_detect"):
+            if _detector is None:
+                _detector = Detector.load()
+                _sinks = make_sinks()
+            alerts = _detector.observe(rows)
+            _detector.save()
+            for key, per_metric in _detector.trackers.items():
+                scope, name = key.split(":", 1)
+                for metric, t in per_metric.items():
+                    metrics.set_gauge("sla_breached", int(t.breached), "1 while a sustained SLA breach is open",
+                                      scope=scope, key=name, metric=metric)
+    except Exception as e:
+        console.print(f"[bold red]SLA detector failed: {e}[/]")
+        return []
+
+    for alert in alerts:
+        console.print(f"[yellow bold]SLA {alert['kind']}: {alert['scope']} {alert['key']} "
+                      f"{alert['metric']} {alert['value']} (threshold {alert['threshold']})[/]")
+    for sink in _sinks:
+        if not alerts:
+            break
+        try:
+            sink.emit(alerts)
+        except Exception as e:
+            console.print(f"[bold red]SLA alert sink {type(sink).__name__} failed: {e}[/]")
+    return alerts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="level, deviation and breach state per key")
+    tail = sub.add_parser("tail", help="latest alerts from the file sink")
+    tail.add_argument("-n", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for row in Detector.load().status():
+            console.print(row)
+    elif SLA_ALERT_PATH.exists():
+        for line in SLA_ALERT_PATH.read_text().splitlines()[-args.n:]:
+            console.print(json.loads(line))
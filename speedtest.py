@@ -1,34 +1,39 @@
-from copy import Error
 import json
+import os
 import subprocess
+import threading
+import time
+from collections import deque
 from datetime import datetime, timezone
 import sys
 
 
 import re
 
-from pandas.io.gbq import import_optional_dependency
-from requests import get, RequestException
-
-from rich import console
 from rich.console import Console
 #from helpers import extract_int
 
+import metrics
+
 console = Console()
 
+# the Ookla CLI on PATH by default; benchmarks point this at a recorded stand-in
+SPEEDTEST_BIN = os.getenv("SPEEDTEST_BIN", "speedtest")
 
 
-def run_speedtest(server_id=None) -> dict:
+
+def run_speedtest(server_id=None, timeout: float = 60) -> dict:
     """_summary_
     Run a speedtest and return the results as a dictionary
     
     Args:
         server_id: The ID of the server to test
+        timeout (float): seconds before the CLI is abandoned
 
     Returns:
         A dictionary containing the speedtest results
     """
-    cmd = ["speedtest", "--format", "json-pretty", "--progress", "no"]
+    cmd = [SPEEDTEST_BIN, "--format", "json-pretty", "--progress", "no"]
     
     if server_id:
         cmd.extend(["--server-id", str(server_id)])
@@ -39,60 +44,236 @@ def run_speedtest(server_id=None) -> dict:
             capture_output=True,
             text=True,
             check=True,
-            timeout=60,
+            timeout=timeout,
         )
         return json.loads(p.stdout)
     except subprocess.CalledProcessError as subprocess_error:
         console.print(f"[bold red]Speedtest CLI failed: {subprocess_error.stderr.strip()}[/]")
         return None
     except json.JSONDecodeError as json_error:
-        console.print(f"[bold red]Failed to parse JSON from speedtest after 60 seconds: {json_error}[/]")
+        console.print(f"[bold red]Failed to parse JSON from speedtest: {json_error}[/]")
+        return None
+    except subprocess.TimeoutExpired:
+        console.print(f"[bold red]Speedtest did not finish within {timeout:.0f} seconds[/]")
         return None
     except Exception as e:
         console.print(f"[bold red]Unexpected error running speedtest: {e}[/]")
         return None
 
 
-def get_server_info(ip_address: str) -> dict | None:
+#==========================================================================
+#       streaming mode: per-interval samples from the progress output
+#==========================================================================
+SAMPLE_PHASES = ("ping", "download", "upload")
+
+
+def parse_progress_line(line: str, elapsed_ms: float) -> tuple[str, float, float] | dict | None:
     """_summary_
+    Parse one line of `speedtest --format jsonl --progress yes` output
 
     Args:
-        ip_address (str): _description_
+        line (str): a single JSON line from the CLI
+        elapsed_ms (float): client-side milliseconds since the test started,
+            used for ping lines which carry no elapsed time of their own
 
     Returns:
-        dict | None: _description_
+        (phase, elapsed_ms, value) for a progress line, where value is latency
+        in ms for ping and Mbps for download/upload; the summary dict for the
+        final "result" line; None for anything else
     """
-    if not ip_address:
-        console.print(f"[bold yellow]No valid IP address provided[/]")
+    try:
+        msg = json.loads(line)
+    except json.JSONDecodeError:
         return None
     
-    ip_address = ip_address.strip()
-    url = f"https://ipapi.co/{ip_address}/json/"
-    cmd = ["curl", url]
+    kind = msg.get("type")
+    if kind == "result":
+        return msg
+    if kind == "ping" and "latency" in msg.get("ping", {}):
+        return "ping", elapsed_ms, float(msg["ping"]["latency"])
+    if kind in ("download", "upload") and "bandwidth" in msg.get(kind, {}):
+        phase = msg[kind]
+        return kind, float(phase.get("elapsed", elapsed_ms)), phase["bandwidth"] * 8 / 1_000_000
+    return None
+
+
+# last stderr lines kept for the failure message
+STDERR_TAIL_LINES = 50
+
+
+def run_speedtest_stream(server_id=None, timeout: float = 60) -> tuple[dict | None, dict]:
+    """_summary_
+    Run a speedtest reading the CLI's line-delimited progress output as it
+    arrives, keeping the per-interval throughput and latency samples that
+    the plain run_speedtest throws away
+
+    Args:
+        server_id: The ID of the server to test
+        timeout (float): seconds before the CLI is killed
+
+    Returns:
+        (summary, samples): the same summary dict run_speedtest returns (None
+        on failure) and {phase: {"elapsed_ms": [...], "value": [...]}}
+    """
+    cmd = [SPEEDTEST_BIN, "--format", "jsonl", "--progress", "yes"]
+    if server_id:
+        cmd.extend(["--server-id", str(server_id)])
+    
+    samples = {phase: {"elapsed_ms": [], "value": []} for phase in SAMPLE_PHASES}
+    summary = None
+    
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+    except OSError as e:
+        console.print(f"[bold red]Unexpected error running speedtest: {e}[/]")
+        return None, samples
+    
+    # drained on its own thread: a CLI that writes more than a pipe buffer of
+    # warnings would otherwise block before stdout reaches EOF
+    errors = deque(maxlen=STDERR_TAIL_LINES)
+    drain = threading.Thread(target=errors.extend, args=(proc.stderr,), daemon=True)
+    drain.start()
+    
+    # readline blocks, so the deadline is enforced by a timer that kills the CLI
+    watchdog = threading.Timer(timeout, proc.kill)
+    watchdog.start()
+    started = time.monotonic()
+    try:
+        for line in proc.stdout:
+            parsed = parse_progress_line(line, (time.monotonic() - started) * 1000)
+            if isinstance(parsed, dict):
+                summary = parsed
+            elif parsed is not None:
+                phase, elapsed_ms, value = parsed
+                samples[phase]["elapsed_ms"].append(elapsed_ms)
+                samples[phase]["value"].append(value)
+        proc.wait()
+    finally:
+        watchdog.cancel()
+    drain.join(timeout=1)
     
+    if proc.returncode != 0:
+        console.print(f"[bold red]Speedtest CLI failed ({proc.returncode}): {''.join(errors).strip()}[/]")
+        return None, samples
+    if summary is None:
+        console.print(f"[bold red]Speedtest stream ended without a result line[/]")
+    return summary, samples
+
+
+# SPEEDTEST_PROGRESS_SAMPLES=1 switches the collectors to the streaming mode
+CAPTURE_SAMPLES = os.getenv("SPEEDTEST_PROGRESS_SAMPLES", "0") == "1"
+
+
+def measure(server_id=None, timeout: float = 60) -> tuple[dict | None, dict | None]:
+    """_summary_
+    Run one test in whichever mode is configured
+
+    Returns:
+        (summary, samples): samples is None unless CAPTURE_SAMPLES is on
+    """
+    started = time.perf_counter()
+    if CAPTURE_SAMPLES:
+        raw, samples = run_speedtest_stream(server_id, timeout=timeout)
+    else:
+        raw, samples = run_speedtest(server_id, timeout=timeout), None
+    metrics.observe("speedtest", time.perf_counter() - started, error=raw is None,
+                    mode="stream" if CAPTURE_SAMPLES else "json")
+    if raw is not None:
+        metrics.add_bytes("speedtest", "download", raw.get("download", {}).get("bytes"))
+        metrics.add_bytes("speedtest", "upload", raw.get("upload", {}).get("bytes"))
+    return raw, samples
+
+
+def list_servers(timeout: float = 30) -> list[dict]:
+    """_summary_
+    Nearby servers as reported by `speedtest --servers`
+
+    Returns:
+        list[dict]: entries with id, host, port, name, location and country;
+        empty when the CLI fails
+    """
     try:
-        response = get(url, timeout=8)
+        p = subprocess.run(
+            [SPEEDTEST_BIN, "--servers", "--format", "json"],
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=timeout,
+        )
+        return json.loads(p.stdout).get("servers", [])
+    except (subprocess.SubprocessError, json.JSONDecodeError, OSError) as e:
+        console.print(f"[bold yellow]Could not list speedtest servers: {e}[/]")
+        return []
+
+
+# ipapi.co by default; point it at a local stand-in server for tests and benchmarks
+IPAPI_BASE_URL = os.getenv("IPAPI_BASE_URL", "https://ipapi.co").rstrip("/")
+
+
+def fetch_server_info(ip_address: str, base_url: str | None = None, timeout: float = 8) -> tuple[int | None, dict | None, float | None]:
+    """_summary_
+    Query the geolocation API once, without caching or retries
+
+    Args:
+        ip_address (str): server IP to look up
+        base_url (str | None): API root, IPAPI_BASE_URL when None
+        timeout (float): seconds before the request is abandoned
+
+    Returns:
+        tuple: (HTTP status or None on a network error, parsed payload or None,
+        Retry-After seconds when the API sent one)
+    """
+    # requests costs a noticeable share of start-up and most runs hit the
+    # enrichment cache instead, so it is imported only for a real lookup
+    from requests import get, RequestException
+
+    url = f"{base_url or IPAPI_BASE_URL}/{ip_address.strip()}/json/"
+    
+    try:
+        with metrics.timed("enrichment_http"):
+            response = get(url, timeout=timeout)
+        metrics.add_bytes("enrichment_http", "download", len(response.content))
+        retry_after = response.headers.get("Retry-After")
+        retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
         
         if response.status_code != 200:
             console.print(f"[bold yellow]ipapi.co -> {response.status_code} for {ip_address}[/]")
             if response.status_code == 429:
                 console.print(f"[bold yellow]Rate limit hit - try again later[/]")
-            return None
+            return response.status_code, None, retry_after
         # parse data only if the status code = 200
         data = response.json()
         
         # API level errors
         if data.get("error"):
             console.print(f"[bold yellow]ipapi.co error :{data.get('message') or data.get('reason')}[/]")
-            return None
+            return response.status_code, None, retry_after
         console.print(f"[dim]Enriched {ip_address} with meta data from ipapi.co[/]")
-        return data
+        return response.status_code, data, retry_after
     except RequestException as e:
         console.print(f"[bold red]Network error fetching information for {ip_address}: {e}[/]")
-        return None
+        return None, None, None
     except ValueError as e:
         console.print(f"[red bold]Invalid json response from ipapi.co: {e}[/]")
+        return 200, None, None
+
+
+def get_server_info(ip_address: str) -> dict | None:
+    """_summary_
+
+    Args:
+        ip_address (str): _description_
+
+    Returns:
+        dict | None: _description_
+    """
+    if not ip_address:
+        console.print(f"[bold yellow]No valid IP address provided[/]")
         return None
+    
+    try:
+        _, data, _ = fetch_server_info(ip_address)
+        return data
     except Exception as e:
         console.print(f"[bold red]Unexpected error in getting server information: {e}[/]")
         return None
@@ -165,4 +346,144 @@ def transform(raw_results: dict) -> dict | None:
     except Exception as e:
         console.print(f"[bold red]Error transforming results: {e}[/]")
         return None
-        
\ No newline at end of file
+        
+
+#==========================================================================
+#               many raw results at once, as a typed DataFrame
+#==========================================================================
+# (column, path into the CLI result, required)
+BATCH_FIELDS = (
+    ("timestamp", ("timestamp",), True),
+    ("download_bandwidth", ("download", "bandwidth"), True),
+    ("upload_bandwidth", ("upload", "bandwidth"), True),
+    ("latency_ms", ("ping", "latency"), True),
+    ("jitter_ms", ("ping", "jitter"), False),
+    ("packet_loss_pct", ("packetLoss",), False),
+    ("isp", ("isp",), False),
+    ("server_id", ("server", "id"), True),
+    ("server_name", ("server", "name"), True),
+    ("server_location", ("server", "location"), True),
+    ("server_host", ("server", "host"), True),
+    ("server_country", ("server", "country"), True),
+    ("server_ip", ("server", "ip"), True),
+    ("server_port", ("server", "port"), True),
+    ("result_id", ("result", "id"), True),
+    ("result_url", ("result", "url"), False),
+    ("result_persisted", ("result", "persisted"), True),
+)
+
+# repeated text, stored once per distinct value
+BATCH_CATEGORIES = ("isp", "server_name", "server_location", "server_host", "server_country", "server_ip")
+
+
+def _persisted(value) -> bool:
+    """ the CLI's result.persisted, which may arrive as text from saved output """
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+def _pluck(raw: dict, path: tuple, required: bool):
+    value = raw
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            if required:
+                raise KeyError(".".join(path))
+            return None
+        value = value[key]
+    return value
+
+
+def transform_batch(raws: list[dict]):
+    """_summary_
+    transform for many results at once. Fields are gathered into columns in
+    one pass, then timestamps are parsed and bandwidths converted to Mbps
+    over whole columns. A record with a missing field or a bad timestamp is
+    left out and reported instead of failing the batch.
+
+    Args:
+        raws (list[dict]): CLI results as returned by run_speedtest
+
+    Returns:
+        tuple[pd.DataFrame, list[dict]]: the transform columns (float32
+        metrics, categorical server/ISP text), and one
+        {"index", "result_id", "error"} entry per record that was dropped
+    """
+    import numpy as np
+    import pandas as pd
+
+    columns = {name: [] for name, _, _ in BATCH_FIELDS}
+    kept, errors = [], []
+    for i, raw in enumerate(raws):
+        try:
+            values = [_pluck(raw, path, required) for _, path, required in BATCH_FIELDS]
+        except KeyError as e:
+            result_id = raw.get("result", {}).get("id") if isinstance(raw, dict) and isinstance(raw.get("result"), dict) else None
+            errors.append({"index": i, "result_id": result_id, "error": f"missing field {e.args[0]}"})
+            continue
+        for (name, _, _), value in zip(BATCH_FIELDS, values):
+            columns[name].append(value)
+        kept.append(i)
+
+    df = pd.DataFrame(columns, index=pd.Index(kept, name="index"))
+    measured = pd.to_datetime(df.pop("timestamp"), utc=True, errors="coerce", format="ISO8601")
+    down = pd.to_numeric(df.pop("download_bandwidth"), errors="coerce")
+    up = pd.to_numeric(df.pop("upload_bandwidth"), errors="coerce")
+
+    latency = pd.to_numeric(df.pop("latency_ms"), errors="coerce")
+    server_id = pd.to_numeric(df["server_id"], errors="coerce")
+    server_port = pd.to_numeric(df["server_port"], errors="coerce")
+
+    # ids and ports must be whole numbers for the Int32 casts below
+    bad = (
+        measured.isna() | down.isna() | up.isna() | latency.isna()
+        | server_id.isna() | (server_id % 1 != 0)
+        | (server_port.notna() & ((server_port % 1 != 0) | (server_port < 0) | (server_port > 65535)))
+    )
+    for i in df.index[bad]:
+        errors.append({"index": int(i), "result_id": df.at[i, "result_id"],
+                       "error": "unparseable timestamp, bandwidth, latency, server id or port"})
+    keep = ~bad
+    df = df[keep].copy()
+
+    # bytes/sec -> Mbps
+    df.insert(0, "measured_at_utc", measured[keep])
+    df.insert(1, "download_mbps", (down[keep] * 8 / 1_000_000).astype(np.float32))
+    df.insert(2, "upload_mbps", (up[keep] * 8 / 1_000_000).astype(np.float32))
+    df.insert(3, "latency_ms", latency[keep].astype(np.float32))
+    for col in ("jitter_ms", "packet_loss_pct"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+    df["server_id"] = server_id[keep].astype("Int32")
+    df["server_port"] = server_port[keep].astype("Int32")
+    df["server_ip"] = df["server_ip"].astype(str).str.strip().str.strip("'\"")
+    df["server_name"] = df["server_name"].astype(str)
+    df["result_url"] = df["result_url"].astype(str)
+    df["result_persisted"] = df["result_persisted"].map(_persisted).astype(bool)
+    df["server_latitude"] = np.float32(np.nan)
+    df["server_longitude"] = np.float32(np.nan)
+    for col in BATCH_CATEGORIES:
+        df[col] = df[col].astype("category")
+
+    errors.sort(key=lambda e: e["index"])
+    return df, errors
+
+
+def batch_rows(df) -> list[dict]:
+    """_summary_
+    transform_batch output back to the row dicts the loaders take: plain
+    Python values, with NaN/NA as None and metrics rounded to the database's
+    three decimals (undoing float32 noise)
+    """
+    import pandas as pd
+
+    out = df.astype(object).where(df.notna(), None)
+    rows = out.to_dict("records")
+    for row in rows:
+        row["measured_at_utc"] = pd.Timestamp(row["measured_at_utc"]).to_pydatetime()
+        for col in ("server_id", "server_port"):
+            if row[col] is not None:
+                row[col] = int(row[col])
+        for col in ("download_mbps", "upload_mbps", "latency_ms", "jitter_ms", "packet_loss_pct"):
+            if row[col] is not None:
+                row[col] = round(float(row[col]), 3)
+    return rows
@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from rich.console import Console
+
+import metrics
+
+console = Console()
+
+PROJECT_DIR = Path.cwd()
+
+load_dotenv(PROJECT_DIR / ".env")
+
+# the spool lives next to the project by default; probes with a read-only
+# checkout can point it somewhere writable
+SPOOL_PATH = Path(os.getenv("SPOOL_PATH", PROJECT_DIR / "spool" / "results.db"))
+
+# rows that keep failing on their own (bad data rather than a dead database)
+# are parked after this many attempts instead of blocking every replay
+MAX_ATTEMPTS = 5
+
+# datetime fields in a transformed row, restored from ISO strings on replay
+DATETIME_FIELDS = ("measured_at_utc",)
+
+
+#==========================================================================
+#               append-only on-disk spool for transformed rows
+#==========================================================================
+def open_spool(path: Path = SPOOL_PATH) -> sqlite3.Connection:
+    """_summary_
+    Open (and create if needed) the spool database
+
+    Args:
+        path (Path): location of the SQLite file
+
+    Returns:
+        sqlite3.Connection: connection with WAL journaling and FULL sync, so a
+        row is on disk before spool_row returns
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    spool = sqlite3.connect(path)
+    spool.execute("PRAGMA journal_mode=WAL")
+    spool.execute("PRAGMA synchronous=FULL")
+    spool.execute("""
+        CREATE TABLE IF NOT EXISTS spool (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,
+            result_id       TEXT    NOT NULL UNIQUE,
+            payload         TEXT    NOT NULL,
+            spooled_at_utc  TEXT    NOT NULL,
+            attempts        INTEGER NOT NULL DEFAULT 0,
+            last_error      TEXT
+        )
+    """)
+    spool.commit()
+    return spool
+
+
+def encode_row(row: dict) -> str:
+    return json.dumps(row, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+
+
+def decode_row(payload: str) -> dict:
+    row = json.loads(payload)
+    for field in DATETIME_FIELDS:
+        if row.get(field):
+            row[field] = datetime.fromisoformat(row[field])
+    return row
+
+
+def spool_row(row: dict, path: Path = SPOOL_PATH) -> bool:
+    """_summary_
+    Durably append one transformed row. A result that is already spooled is
+    ignored, so a retried cycle cannot queue the same measurement twice.
+
+    Args:
+        row (dict): a row produced by speedtest.transform
+
+    Returns:
+        bool: True when the row was newly spooled
+    """
+    spool = open_spool(path)
+    try:
+        cur = spool.execute(
+            "INSERT OR IGNORE INTO spool (result_id, payload, spooled_at_utc) VALUES (?, ?, ?)",
+            (str(row["result_id"]), encode_row(row), datetime.now(timezone.utc).isoformat()),
+        )
+        spool.commit()
+        return cur.rowcount == 1
+    finally:
+        spool.close()
+
+
+def pending_count(path: Path = SPOOL_PATH) -> int:
+    spool = open_spool(path)
+    try:
+        return spool.execute(
+            "SELECT COUNT(*) FROM spool WHERE attempts < ?", (MAX_ATTEMPTS,)
+        ).fetchone()[0]
+    finally:
+        spool.close()
+
+
+#==========================================================================
+#               drain the spool into the storage backend in batches
+#==========================================================================
+def _load_one_by_one(storage, conn, spool: sqlite3.Connection, batch: list[tuple[int, dict]]) -> int:
+    """_summary_
+    Fallback after a failed batch: load rows individually so one bad row does
+    not hold back the others, and count an attempt against the ones that fail.
+    """
+    loaded = 0
+    for spool_id, row in batch:
+        if storage.load_one(row, conn):
+            spool.execute("DELETE FROM spool WHERE id = ?", (spool_id,))
+            loaded += 1
+        else:
+            spool.execute(
+                "UPDATE spool SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                ("row failed to load on its own", spool_id),
+            )
+        spool.commit()
+    return loaded
+
+
+def replay(conn=None, batch_size: int = 500, path: Path = SPOOL_PATH, storage=None) -> int:
+    """_summary_
+    Drain pending rows into the storage backend, batch_size rows per transaction.
+    Rows are deleted from the spool only after their batch has committed, and
+    the fact insert is idempotent on result_id, so a crash in between at worst
+    replays rows that are then skipped.
+
+    Args:
+        conn: an open connection to reuse (left open); otherwise one is opened
+            for this replay and closed afterwards
+        batch_size (int): rows per transaction
+        storage: backend to load into, storage.get_storage() by default
+
+    Returns:
+        int: number of rows loaded. 0 when the database is unreachable, in
+        which case everything stays spooled for the next replay
+    """
+    # the storage backend (and with it pandas/pyodbc) is loaded only when
+    # there is something to replay, not when a row is spooled
+    from storage import get_storage
+
+    storage = storage or get_storage()
+    spool = open_spool(path)
+    owns_conn = conn is None
+    loaded = 0
+
+    try:
+        if owns_conn:
+            with metrics.timed("db_connect", backend=storage.name):
+                conn = storage.connect()
+
+        last_id = 0
+        while True:
+            records = spool.execute(
+                "SELECT id, payload FROM spool WHERE id > ? AND attempts < ? ORDER BY id LIMIT ?",
+                (last_id, MAX_ATTEMPTS, batch_size),
+            ).fetchall()
+            if not records:
+                break
+            last_id = records[-1][0]
+            batch = [(spool_id, decode_row(payload)) for spool_id, payload in records]
+
+            try:
+                with metrics.timed("load_batch", backend=storage.name):
+                    loaded += storage.load_batch([row for _, row in batch], conn)
+                spool.executemany("DELETE FROM spool WHERE id = ?", [(spool_id,) for spool_id, _ in batch])
+                spool.commit()
+            except storage.disconnect_errors as e:
+                # the server went away mid-replay - keep everything for next time
+                console.print(f"[bold yellow]Lost the database during replay: {e}[/]")
+                break
+            except Exception as e:
+                console.print(f"[bold yellow]Batch of {len(batch)} failed ({e}) - retrying row by row[/]")
+                loaded += _load_one_by_one(storage, conn, spool, batch)
+
+    except storage.errors as e:
+        console.print(f"[bold yellow]Database unreachable - results stay spooled: {e}[/]")
+    finally:
+        if owns_conn and conn is not None:
+            conn.close()
+        remaining = spool.execute(
+            "SELECT COUNT(*) FROM spool WHERE attempts < ?", (MAX_ATTEMPTS,)
+        ).fetchone()[0]
+        spool.close()
+        metrics.set_gauge("spool_pending", remaining, "Results waiting in the local spool.")
+
+    if loaded or remaining:
+        console.print(f"[cyan]Replayed {loaded} spooled results, {remaining} still pending[/]")
+    return loaded
+
+
+if __name__ == "__main__":
+    replay()
@@ -80,11 +80,16 @@ CREATE TABLE dbo.time_metadata (
 PRINT 'Table dbo.time_metadata created.';
 GO
 
+-- dashboard ranges are in local time
+CREATE NONCLUSTERED INDEX IX_time_metadata_local_tz ON dbo.time_metadata (local_tz);
+GO
+
 ------------------------------------------------------
 -- 4. Internet Speeds (fact table)
 ------------------------------------------------------
 CREATE TABLE dbo.internet_speeds (
-    id                     BIGINT          IDENTITY(1,1)   PRIMARY KEY,
+    id                     BIGINT          IDENTITY(1,1)
+        CONSTRAINT PK_internet_speeds PRIMARY KEY,
     result_id              NVARCHAR(50)    NOT NULL,
     server_id              INT             NOT NULL,
     measured_at_utc        DATETIME2(3)    NOT NULL,
@@ -110,5 +115,19 @@ CREATE TABLE dbo.internet_speeds (
 PRINT 'Table dbo.internet_speeds created.';
 GO
 
+------------------------------------------------------
+-- 5. Fact indexes (see 12_fact_indexes.sql for existing databases)
+------------------------------------------------------
+-- covering: range queries join on measured_at_utc and read only these columns
+CREATE NONCLUSTERED INDEX IX_internet_speeds_measured_at_utc
+    ON dbo.internet_speeds (measured_at_utc)
+    INCLUDE (server_id, download_mbps, upload_mbps, latency_ms, jitter_ms, packet_loss_pct)
+    WITH (DATA_COMPRESSION = ROW);
+
+-- the ingest's idempotency check on result_id
+CREATE UNIQUE NONCLUSTERED INDEX UX_internet_speeds_result_id ON dbo.internet_speeds (result_id);
+PRINT 'Fact indexes created.';
+GO
+
 PRINT '=== DATABASE SETUP COMPLETE ===';
 GO
\ No newline at end of file
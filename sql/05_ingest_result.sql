@@ -0,0 +1,120 @@
+-- =============================================
+-- Single round-trip ingest of one speedtest result
+--   time_metadata, servers, result_metadata and the internet_speeds fact are
+--   written in one call. Every step is keyed, so calling it twice with the
+--   same result_id is a no-op for the fact and result tables.
+-- =============================================
+USE InternetSpeed_DB;
+GO
+
+CREATE OR ALTER PROCEDURE dbo.usp_ingest_result
+    -- fact + result
+    @result_id              NVARCHAR(50),
+    @result_url             NVARCHAR(500),
+    @result_persisted       BIT,
+    @measured_at_utc        DATETIME2(3),
+    @download_mbps          DECIMAL(12,3),
+    @upload_mbps            DECIMAL(12,3),
+    @latency_ms             DECIMAL(8,3),
+    @jitter_ms              DECIMAL(8,3),
+    @packet_loss_pct        DECIMAL(5,2),
+    -- server
+    @server_id              INT,
+    @server_name            NVARCHAR(100),
+    @server_host            NVARCHAR(150),
+    @server_location        NVARCHAR(100),
+    @server_country         NVARCHAR(100),
+    @server_ip              NVARCHAR(45),
+    @server_port            INT,
+    @server_latitude        DECIMAL(9,6),
+    @server_longitude       DECIMAL(9,6),
+    @isp                    NVARCHAR(150),
+    -- time dimension (computed client side, see helpers.time_dim_values)
+    @local_tz               DATETIME2(3),
+    @date_key               INT,
+    @year                   SMALLINT,
+    @month                  TINYINT,
+    @month_name             NVARCHAR(10),
+    @day                    TINYINT,
+    @day_of_week            TINYINT,
+    @day_of_week_name       NVARCHAR(10),
+    @week_of_year           TINYINT,
+    @quarter                TINYINT,
+    @hour                   TINYINT,
+    @is_weekend             BIT,
+    @is_holiday             BIT,
+    -- 1 when the caller already knows this time_id is committed, which skips
+    -- the locking existence check on time_metadata
+    @time_known             BIT = 0
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    -- 1. time dimension
+    IF @time_known = 0 AND NOT EXISTS (SELECT 1 FROM dbo.time_metadata WITH (UPDLOCK, HOLDLOCK) WHERE time_id = @measured_at_utc)
+        INSERT INTO dbo.time_metadata (
+            time_id, local_tz, date_key, year, month, month_name, day,
+            day_of_week, day_of_week_name, week_of_year, quarter, hour,
+            is_weekend, is_holiday
+        ) VALUES (
+            @measured_at_utc, @local_tz, @date_key, @year, @month, @month_name, @day,
+            @day_of_week, @day_of_week_name, @week_of_year, @quarter, @hour,
+            @is_weekend, @is_holiday
+        );
+
+    -- 2. server upsert. Coordinates are only looked up for new servers, so a
+    --    NULL here must not wipe the cached ones
+    MERGE dbo.servers WITH (HOLDLOCK) AS t
+    USING (SELECT @server_id AS server_id) AS s
+        ON t.server_id = s.server_id
+    WHEN MATCHED THEN UPDATE SET
+        server_name      = @server_name,
+        server_host      = @server_host,
+        server_location  = @server_location,
+        server_country   = @server_country,
+        server_ip        = @server_ip,
+        server_port      = @server_port,
+        server_latitude  = COALESCE(@server_latitude, t.server_latitude),
+        server_longitude = COALESCE(@server_longitude, t.server_longitude),
+        isp              = @isp,
+        last_seen_utc    = GETUTCDATE()
+    WHEN NOT MATCHED THEN INSERT (
+        server_id, server_name, server_host, server_location, server_country,
+        server_ip, server_port, server_latitude, server_longitude,
+        isp, first_seen_utc, last_seen_utc
+    ) VALUES (
+        @server_id, @server_name, @server_host, @server_location, @server_country,
+        @server_ip, @server_port, @server_latitude, @server_longitude,
+        @isp, GETUTCDATE(), GETUTCDATE()
+    );
+
+    -- 3. result metadata
+    IF NOT EXISTS (SELECT 1 FROM dbo.result_metadata WITH (UPDLOCK, HOLDLOCK) WHERE result_id = @result_id)
+        INSERT INTO dbo.result_metadata (
+            result_id, result_url, result_persisted, measured_at_utc
+        ) VALUES (
+            @result_id, @result_url, @result_persisted, @measured_at_utc
+        );
+
+    -- 4. speed fact
+    IF NOT EXISTS (SELECT 1 FROM dbo.internet_speeds WITH (UPDLOCK, HOLDLOCK) WHERE result_id = @result_id)
+    BEGIN
+        INSERT INTO dbo.internet_speeds (
+            result_id, server_id, measured_at_utc,
+            download_mbps, upload_mbps, latency_ms, jitter_ms, packet_loss_pct
+        ) VALUES (
+            @result_id, @server_id, @measured_at_utc,
+            @download_mbps, @upload_mbps, @latency_ms, @jitter_ms, @packet_loss_pct
+        );
+
+        -- 5. mark the local hour for the rollup refresh (sql/06_hourly_rollup.sql)
+        DECLARE @hour_bucket DATETIME2(0) = DATEADD(hour, DATEDIFF(hour, 0, @local_tz), 0);
+        IF NOT EXISTS (SELECT 1 FROM dbo.hourly_speeds_dirty WITH (UPDLOCK, HOLDLOCK) WHERE hour_bucket = @hour_bucket)
+            INSERT INTO dbo.hourly_speeds_dirty (hour_bucket) VALUES (@hour_bucket);
+    END
+END
+GO
+
+PRINT 'Procedure dbo.usp_ingest_result created.';
+GO
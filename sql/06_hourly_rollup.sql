@@ -0,0 +1,120 @@
+-- =============================================
+-- Hourly rollup of median speeds
+--   dbo.hourly_speeds holds one row per local hour and server, plus a
+--   server_id = 0 row per hour across all servers (what the dashboard shows).
+--   usp_ingest_result marks the hour of every new fact in
+--   dbo.hourly_speeds_dirty, and usp_refresh_hourly_speeds recomputes only
+--   those hours, so the cost of a refresh does not grow with history.
+--
+--   First build over existing history:
+--       EXEC dbo.usp_refresh_hourly_speeds '1900-01-01', '9999-01-01';
+-- =============================================
+USE InternetSpeed_DB;
+GO
+
+IF OBJECT_ID(N'dbo.hourly_speeds', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.hourly_speeds (
+        hour_bucket            DATETIME2(0)    NOT NULL,   -- local (Africa/Maseru) hour
+        server_id              INT             NOT NULL,   -- 0 = all servers
+        samples                INT             NOT NULL,
+        median_download_mbps   FLOAT           NOT NULL,
+        median_upload_mbps     FLOAT           NOT NULL,
+        median_latency_ms      FLOAT,
+        refreshed_at_utc       DATETIME2(3)    NOT NULL    DEFAULT SYSUTCDATETIME(),
+
+        CONSTRAINT PK_hourly_speeds PRIMARY KEY (hour_bucket, server_id)
+    );
+    PRINT 'Table dbo.hourly_speeds created.';
+END
+GO
+
+IF OBJECT_ID(N'dbo.hourly_speeds_dirty', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.hourly_speeds_dirty (
+        hour_bucket            DATETIME2(0)    NOT NULL
+            CONSTRAINT PK_hourly_speeds_dirty PRIMARY KEY
+    );
+    PRINT 'Table dbo.hourly_speeds_dirty created.';
+END
+GO
+
+-- the refresh looks hours up by local time
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_time_metadata_local_tz')
+    CREATE NONCLUSTERED INDEX IX_time_metadata_local_tz ON dbo.time_metadata (local_tz);
+GO
+
+------------------------------------------------------
+-- Recompute hours: the dirty ones by default, or every hour in
+-- [@from_local, @to_local) when a range is given
+------------------------------------------------------
+CREATE OR ALTER PROCEDURE dbo.usp_refresh_hourly_speeds
+    @from_local     DATETIME2(0) = NULL,
+    @to_local       DATETIME2(0) = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @hours TABLE (hour_bucket DATETIME2(0) PRIMARY KEY);
+
+    IF @from_local IS NULL
+        DELETE FROM dbo.hourly_speeds_dirty
+        OUTPUT deleted.hour_bucket INTO @hours;
+    ELSE
+        INSERT INTO @hours (hour_bucket)
+        SELECT DISTINCT DATEADD(hour, DATEDIFF(hour, 0, t.local_tz), 0)
+        FROM dbo.time_metadata t
+        WHERE t.local_tz >= @from_local AND t.local_tz < @to_local;
+
+    IF NOT EXISTS (SELECT 1 FROM @hours)
+        RETURN;
+
+    DECLARE @lo DATETIME2(0) = (SELECT MIN(hour_bucket) FROM @hours);
+    DECLARE @hi DATETIME2(0) = DATEADD(hour, 1, (SELECT MAX(hour_bucket) FROM @hours));
+
+    SELECT
+        CAST(DATEADD(hour, DATEDIFF(hour, 0, t.local_tz), 0) AS DATETIME2(0)) AS hour_bucket,
+        i.server_id,
+        i.download_mbps,
+        i.upload_mbps,
+        i.latency_ms
+    INTO #raw
+    FROM dbo.internet_speeds i
+    JOIN dbo.time_metadata t ON i.measured_at_utc = t.time_id
+    WHERE t.local_tz >= @lo AND t.local_tz < @hi;
+
+    DELETE r FROM #raw r WHERE NOT EXISTS (SELECT 1 FROM @hours h WHERE h.hour_bucket = r.hour_bucket);
+
+    DELETE s FROM dbo.hourly_speeds s JOIN @hours h ON s.hour_bucket = h.hour_bucket;
+
+    INSERT INTO dbo.hourly_speeds (
+        hour_bucket, server_id, samples,
+        median_download_mbps, median_upload_mbps, median_latency_ms
+    )
+    -- per server
+    SELECT DISTINCT
+        hour_bucket,
+        server_id,
+        COUNT(*) OVER (PARTITION BY hour_bucket, server_id),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY download_mbps) OVER (PARTITION BY hour_bucket, server_id),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY upload_mbps)   OVER (PARTITION BY hour_bucket, server_id),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY latency_ms)    OVER (PARTITION BY hour_bucket, server_id)
+    FROM #raw
+    UNION ALL
+    -- all servers
+    SELECT DISTINCT
+        hour_bucket,
+        0,
+        COUNT(*) OVER (PARTITION BY hour_bucket),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY download_mbps) OVER (PARTITION BY hour_bucket),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY upload_mbps)   OVER (PARTITION BY hour_bucket),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY latency_ms)    OVER (PARTITION BY hour_bucket)
+    FROM #raw;
+
+    DROP TABLE #raw;
+END
+GO
+
+PRINT 'Procedure dbo.usp_refresh_hourly_speeds created.';
+GO
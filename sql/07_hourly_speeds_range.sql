@@ -0,0 +1,10 @@
+-- SQLBook: Code
+SELECT
+    hour_bucket,
+    median_download_mbps,
+    median_upload_mbps,
+    median_latency_ms
+FROM dbo.hourly_speeds
+WHERE server_id = 0
+    AND hour_bucket >= :start_dt AND hour_bucket < :end_dt
+ORDER BY hour_bucket;
@@ -0,0 +1,27 @@
+-- =============================================
+-- Per-interval samples from the speedtest progress stream
+--   One row per result and phase (ping, download, upload). The series are
+--   stored as little-endian float32 arrays (see samples.py), so a test adds
+--   three rows however many samples the CLI reported.
+--   value_f32 is latency in ms for ping and Mbps for download/upload.
+-- =============================================
+USE InternetSpeed_DB;
+GO
+
+IF OBJECT_ID(N'dbo.result_samples', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.result_samples (
+        result_id              NVARCHAR(50)    NOT NULL,
+        phase                  VARCHAR(10)     NOT NULL,
+        samples                INT             NOT NULL,
+        elapsed_ms_f32         VARBINARY(MAX)  NOT NULL,
+        value_f32              VARBINARY(MAX)  NOT NULL,
+
+        CONSTRAINT PK_result_samples PRIMARY KEY (result_id, phase),
+        CONSTRAINT FK_result_samples_result
+            FOREIGN KEY (result_id)
+            REFERENCES dbo.result_metadata(result_id)
+    );
+    PRINT 'Table dbo.result_samples created.';
+END
+GO
@@ -0,0 +1,14 @@
+-- SQLBook: Code
+-- id is the IDENTITY clustered key, so both parts are seeks. Unlike
+-- MAX(measured_at_utc) the watermark also moves when older results are
+-- backfilled. IDENTITY values are handed out before commit, so a slower
+-- writer can commit an id below one already seen: the count of ids in the
+-- trailing :overlap window changes when it does, even if MAX(id) does not
+WITH top_id AS (
+    SELECT MAX(i.id) AS watermark
+    FROM dbo.internet_speeds i
+)
+SELECT
+    t.watermark,
+    (SELECT COUNT_BIG(*) FROM dbo.internet_speeds i WHERE i.id > t.watermark - :overlap) AS recent
+FROM top_id t;
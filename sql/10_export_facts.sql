@@ -0,0 +1,33 @@
+-- Facts joined with their server and calendar rows for the Parquet archive,
+-- the next :batch_size rows after the last exported id
+SELECT TOP (:batch_size)
+    i.id,
+    i.result_id,
+    i.server_id,
+    i.measured_at_utc,
+    t.local_tz,
+    t.date_key,
+    t.year,
+    t.month,
+    t.day_of_week,
+    t.hour,
+    t.is_weekend,
+    t.is_holiday,
+    CAST(i.download_mbps AS FLOAT)      AS download_mbps,
+    CAST(i.upload_mbps AS FLOAT)        AS upload_mbps,
+    CAST(i.latency_ms AS FLOAT)         AS latency_ms,
+    CAST(i.jitter_ms AS FLOAT)          AS jitter_ms,
+    CAST(i.packet_loss_pct AS FLOAT)    AS packet_loss_pct,
+    s.server_name,
+    s.server_location,
+    s.server_country,
+    s.isp,
+    CAST(s.server_latitude AS FLOAT)    AS server_latitude,
+    CAST(s.server_longitude AS FLOAT)   AS server_longitude
+FROM dbo.internet_speeds i
+JOIN dbo.time_metadata t
+    ON i.measured_at_utc = t.time_id
+JOIN dbo.servers s
+    ON i.server_id = s.server_id
+WHERE i.id > :after_id
+ORDER BY i.id;
@@ -0,0 +1,15 @@
+-- Facts in a local time range that landed after a watermark: the dashboard
+-- loads a range once with :after_id = 0, then asks only for newer ids
+SELECT
+    i.id,
+    t.local_tz,
+    i.download_mbps,
+    i.upload_mbps,
+    i.latency_ms,
+    i.jitter_ms
+FROM dbo.internet_speeds i
+JOIN dbo.time_metadata t
+    ON i.measured_at_utc = t.time_id
+WHERE i.id > :after_id AND i.id <= :upto_id
+    AND t.local_tz >= :start_dt AND t.local_tz < :end_dt
+ORDER BY t.local_tz;
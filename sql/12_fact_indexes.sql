@@ -0,0 +1,115 @@
+-- =============================================
+-- Indexes for the fact table's range queries
+--   Every dashboard query (02_raw_range, 03_median_speeds, 07 via the
+--   rollup refresh, 11_raw_since) filters time_metadata on local_tz and
+--   joins the facts on measured_at_utc = time_id. Without these the join
+--   side is a full scan of dbo.internet_speeds on every refresh.
+--
+--   IX_time_metadata_local_tz            seek the local range (time_id rides along
+--                                        as the clustered key)
+--   IX_internet_speeds_measured_at_utc   seek the facts for those time_ids; INCLUDE
+--                                        makes it covering, id comes with the
+--                                        clustered key, so no key lookups
+--   UX_internet_speeds_result_id         the idempotency check in usp_ingest_result
+--                                        (and the IF NOT EXISTS in the statement
+--                                        ingest) becomes a seek instead of a scan.
+--                                        While duplicate result_ids from before the
+--                                        ingest was idempotent remain, a plain
+--                                        IX_internet_speeds_result_id stands in;
+--                                        remove them and run again to make it unique:
+--
+--       WITH d AS (SELECT id, ROW_NUMBER() OVER (PARTITION BY result_id ORDER BY id) AS n
+--                  FROM dbo.internet_speeds)
+--       DELETE FROM d WHERE n > 1;
+--
+--   Safe to run more than once; new installs get the same indexes from 00_DDL.sql.
+--   sql/13_fact_columnstore.sql is the optional next step for large histories.
+--   Timings: python -m benchmarks.range_queries
+-- =============================================
+USE InternetSpeed_DB;
+GO
+
+SET NOCOUNT ON;
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID(N'dbo.time_metadata') AND name = N'IX_time_metadata_local_tz'
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_time_metadata_local_tz ON dbo.time_metadata (local_tz);
+    PRINT 'Index IX_time_metadata_local_tz created.';
+END
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID(N'dbo.internet_speeds') AND name = N'IX_internet_speeds_measured_at_utc'
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_internet_speeds_measured_at_utc
+        ON dbo.internet_speeds (measured_at_utc)
+        INCLUDE (server_id, download_mbps, upload_mbps, latency_ms, jitter_ms, packet_loss_pct)
+        WITH (DATA_COMPRESSION = ROW);
+    PRINT 'Index IX_internet_speeds_measured_at_utc created.';
+END
+GO
+
+-- earlier versions of this script named the non-unique fallback UX_...:
+-- give it its IX_ name so the block below can still create the unique index
+IF EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID(N'dbo.internet_speeds') AND name = N'UX_internet_speeds_result_id' AND is_unique = 0
+)
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM sys.indexes
+        WHERE object_id = OBJECT_ID(N'dbo.internet_speeds') AND name = N'IX_internet_speeds_result_id'
+    )
+        DROP INDEX UX_internet_speeds_result_id ON dbo.internet_speeds;
+    ELSE
+        EXEC sp_rename N'dbo.internet_speeds.UX_internet_speeds_result_id', N'IX_internet_speeds_result_id', N'INDEX';
+    PRINT 'Non-unique UX_internet_speeds_result_id renamed to IX_internet_speeds_result_id.';
+END
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID(N'dbo.internet_speeds') AND name = N'UX_internet_speeds_result_id'
+)
+BEGIN
+    IF EXISTS (SELECT result_id FROM dbo.internet_speeds GROUP BY result_id HAVING COUNT(*) > 1)
+        -- duplicates from before the ingest was idempotent: a plain index under
+        -- its own name for the seek, so a later run still makes the unique one
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM sys.indexes
+                WHERE object_id = OBJECT_ID(N'dbo.internet_speeds') AND name = N'IX_internet_speeds_result_id'
+            )
+                CREATE NONCLUSTERED INDEX IX_internet_speeds_result_id ON dbo.internet_speeds (result_id);
+            PRINT 'UX_internet_speeds_result_id NOT created: duplicate result_ids exist. '
+                + 'IX_internet_speeds_result_id serves the seek; dedupe (see the header) and run again.';
+        END
+    ELSE
+        BEGIN
+            CREATE UNIQUE NONCLUSTERED INDEX UX_internet_speeds_result_id ON dbo.internet_speeds (result_id);
+            PRINT 'Index UX_internet_speeds_result_id created.';
+            IF EXISTS (
+                SELECT 1 FROM sys.indexes
+                WHERE object_id = OBJECT_ID(N'dbo.internet_speeds') AND name = N'IX_internet_speeds_result_id'
+            )
+            BEGIN
+                DROP INDEX IX_internet_speeds_result_id ON dbo.internet_speeds;
+                PRINT 'Index IX_internet_speeds_result_id dropped (replaced by the unique index).';
+            END
+        END
+END
+GO
+
+-- fresh statistics so the first plans after the migration use the new indexes
+UPDATE STATISTICS dbo.internet_speeds;
+UPDATE STATISTICS dbo.time_metadata;
+GO
+
+PRINT '=== FACT INDEXES COMPLETE ===';
+GO
@@ -0,0 +1,66 @@
+-- =============================================
+-- OPTIONAL: clustered columnstore for the fact table
+--   For years of history across many probes. The facts are stored column
+--   by column in compressed rowgroups of about a million rows, so
+--   long-range aggregates (rollup rebuilds, the Parquet export, ad-hoc
+--   analysis) read a fraction of the pages. Facts arrive roughly in time
+--   order, so a rowgroup's min/max measured_at_utc lets range filters
+--   skip whole rowgroups.
+--
+--   The IDENTITY primary key moves to a nonclustered index. The watermark
+--   (09_watermark.sql) and the delta query (11_raw_since.sql) keep their seek
+--   on id, and the rowstore indexes from 12_fact_indexes.sql stay for short
+--   ranges and single-result lookups.
+--
+--   Run 12_fact_indexes.sql first. The conversion rewrites the table, so
+--   run it in a quiet window; the collectors spool while it holds its lock.
+--   Compare before and after with: python -m benchmarks.range_queries
+-- =============================================
+USE InternetSpeed_DB;
+GO
+
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID(N'dbo.internet_speeds') AND type = 5   -- clustered columnstore
+)
+BEGIN
+    BEGIN TRANSACTION;
+
+    -- the primary key from 00_DDL.sql may carry a generated name
+    DECLARE @pk SYSNAME = (
+        SELECT kc.name
+        FROM sys.key_constraints kc
+        JOIN sys.indexes ix ON ix.object_id = kc.parent_object_id AND ix.index_id = kc.unique_index_id
+        WHERE kc.parent_object_id = OBJECT_ID(N'dbo.internet_speeds')
+            AND kc.type = 'PK' AND ix.type = 1                            -- clustered
+    );
+    IF @pk IS NOT NULL
+        EXEC (N'ALTER TABLE dbo.internet_speeds DROP CONSTRAINT ' + QUOTENAME(@pk));
+
+    CREATE CLUSTERED COLUMNSTORE INDEX CCI_internet_speeds ON dbo.internet_speeds;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM sys.key_constraints
+        WHERE parent_object_id = OBJECT_ID(N'dbo.internet_speeds') AND type = 'PK'
+    )
+        ALTER TABLE dbo.internet_speeds
+            ADD CONSTRAINT PK_internet_speeds PRIMARY KEY NONCLUSTERED (id);
+
+    COMMIT TRANSACTION;
+    PRINT 'dbo.internet_speeds converted to a clustered columnstore.';
+END
+ELSE
+    PRINT 'dbo.internet_speeds is already a clustered columnstore.';
+GO
+
+-- compress the open delta rowgroups left by the conversion and trickle inserts;
+-- worth scheduling weekly alongside index maintenance
+ALTER INDEX CCI_internet_speeds ON dbo.internet_speeds REORGANIZE WITH (COMPRESS_ALL_ROW_GROUPS = ON);
+GO
+
+PRINT '=== COLUMNSTORE COMPLETE ===';
+GO
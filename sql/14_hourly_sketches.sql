@@ -0,0 +1,30 @@
+-- =============================================
+-- Hourly quantile sketches
+--   dbo.hourly_sketches holds one t-digest per metric for every local hour
+--   and server, plus a server_id = 0 row per hour across all servers.
+--   Unlike the medians in dbo.hourly_speeds they merge: any percentile over
+--   any range is the merge of the digests of its hours (sketches.py).
+--   Ingest merges the facts it inserts into the digests of their hours.
+--
+--   First build over existing history:
+--       python sketches.py rebuild --start 2015-01-01 --end 2030-01-01
+-- =============================================
+USE InternetSpeed_DB;
+GO
+
+IF OBJECT_ID(N'dbo.hourly_sketches', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.hourly_sketches (
+        hour_bucket            DATETIME2(0)    NOT NULL,   -- local (Africa/Maseru) hour
+        server_id              INT             NOT NULL,   -- 0 = all servers
+        samples                INT             NOT NULL,
+        download_digest        VARBINARY(MAX)  NOT NULL,
+        upload_digest          VARBINARY(MAX)  NOT NULL,
+        latency_digest         VARBINARY(MAX)  NOT NULL,
+        refreshed_at_utc       DATETIME2(3)    NOT NULL    DEFAULT SYSUTCDATETIME(),
+
+        CONSTRAINT PK_hourly_sketches PRIMARY KEY (hour_bucket, server_id)
+    );
+    PRINT 'Table dbo.hourly_sketches created.';
+END
+GO
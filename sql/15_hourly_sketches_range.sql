@@ -0,0 +1,11 @@
+-- SQLBook: Code
+SELECT
+    hour_bucket,
+    samples,
+    download_digest,
+    upload_digest,
+    latency_digest
+FROM dbo.hourly_sketches
+WHERE server_id = :server_id
+    AND hour_bucket >= :start_dt AND hour_bucket < :end_dt
+ORDER BY hour_bucket;
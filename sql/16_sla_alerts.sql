@@ -0,0 +1,29 @@
+-- =============================================
+-- SLA alerts
+--   Written by the table sink of sla.py (SLA_ALERT_SINKS=table): one row
+--   per sla_breach, sla_resolved or latency_spike raised on ingest.
+-- =============================================
+USE InternetSpeed_DB;
+GO
+
+IF OBJECT_ID(N'dbo.sla_alerts', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.sla_alerts (
+        alert_id               BIGINT          IDENTITY(1,1)   NOT NULL,
+        raised_at_utc          DATETIME2(0)    NOT NULL,
+        measured_at_utc        DATETIME2(0)    NOT NULL,
+        kind                   VARCHAR(20)     NOT NULL,   -- sla_breach, sla_resolved, latency_spike
+        scope                  VARCHAR(10)     NOT NULL,   -- server or isp
+        alert_key              NVARCHAR(200)   NOT NULL,   -- server id or ISP name
+        metric                 VARCHAR(20)     NOT NULL,
+        value                  FLOAT           NOT NULL,
+        level                  FLOAT           NOT NULL,   -- EWMA level after this test
+        threshold              FLOAT           NOT NULL,
+        result_id              NVARCHAR(50)    NULL,
+
+        CONSTRAINT PK_sla_alerts PRIMARY KEY (alert_id)
+    );
+    CREATE NONCLUSTERED INDEX IX_sla_alerts_measured_at_utc ON dbo.sla_alerts (measured_at_utc);
+    PRINT 'Table dbo.sla_alerts created.';
+END
+GO
@@ -0,0 +1,14 @@
+-- SQLBook: Code
+-- download mean and mean square per local hour of the week, for the
+-- adaptive scheduler's time-of-day variability (scheduler.py)
+SELECT
+    t.day_of_week,
+    t.hour,
+    COUNT(*) AS tests,
+    AVG(i.download_mbps) AS mean_download_mbps,
+    AVG(i.download_mbps * i.download_mbps) AS mean_sq_download_mbps
+FROM dbo.internet_speeds i
+JOIN dbo.time_metadata t
+    ON i.measured_at_utc = t.time_id
+WHERE t.local_tz >= :since_dt
+GROUP BY t.day_of_week, t.hour;
@@ -0,0 +1,8 @@
+-- SQLBook: Code
+-- Fact ids in the overlap window below the watermark, a seek on the
+-- clustered key. A live range that did not read raw facts (the hourly
+-- frame) seeds the ids it has already accounted for from this
+SELECT
+    i.id
+FROM dbo.internet_speeds i
+WHERE i.id > :after_id AND i.id <= :upto_id;
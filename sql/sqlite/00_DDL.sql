@@ -0,0 +1,113 @@
+-- =============================================
+-- Internet Speed Monitoring Database - embedded (SQLite) edition
+--   Same tables and columns as sql/00_DDL.sql plus the rollup and samples
+--   tables, for edge probes that run without SQL Server. Datetimes are
+--   stored as 'YYYY-MM-DD HH:MM:SS.fff' text, so ranges compare as strings.
+-- =============================================
+PRAGMA journal_mode = WAL;
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS servers (
+    server_id              INTEGER         PRIMARY KEY,
+    server_name            TEXT            NOT NULL,
+    server_host            TEXT            NOT NULL,
+    server_location        TEXT,
+    server_country         TEXT,
+    server_ip              TEXT,
+    server_port            INTEGER,
+    server_latitude        REAL,
+    server_longitude       REAL,
+    first_seen_utc         TEXT            DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    last_seen_utc          TEXT            DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    isp                    TEXT
+);
+
+CREATE TABLE IF NOT EXISTS result_metadata (
+    result_id              TEXT            PRIMARY KEY,
+    result_url             TEXT,
+    result_persisted       INTEGER         DEFAULT 0,
+    measured_at_utc        TEXT            NOT NULL,
+    created_at_utc         TEXT            DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS time_metadata (
+    time_id                TEXT            PRIMARY KEY,
+    local_tz               TEXT            NOT NULL,
+    date_key               INTEGER         NOT NULL,
+    year                   INTEGER         NOT NULL,
+    month                  INTEGER         NOT NULL,
+    month_name             TEXT            NOT NULL,
+    day                    INTEGER         NOT NULL,
+    day_of_week            INTEGER         NOT NULL,
+    day_of_week_name       TEXT            NOT NULL,
+    week_of_year           INTEGER         NOT NULL,
+    quarter                INTEGER         NOT NULL,
+    hour                   INTEGER         NOT NULL,
+    is_weekend             INTEGER         NOT NULL,
+    is_holiday             INTEGER         NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_time_metadata_local_tz ON time_metadata (local_tz);
+
+CREATE TABLE IF NOT EXISTS internet_speeds (
+    id                     INTEGER         PRIMARY KEY AUTOINCREMENT,
+    result_id              TEXT            NOT NULL UNIQUE REFERENCES result_metadata(result_id),
+    server_id              INTEGER         NOT NULL REFERENCES servers(server_id),
+    measured_at_utc        TEXT            NOT NULL REFERENCES time_metadata(time_id),
+    download_mbps          REAL            NOT NULL,
+    upload_mbps            REAL            NOT NULL,
+    latency_ms             REAL,
+    jitter_ms              REAL,
+    packet_loss_pct        REAL
+);
+-- covering for the range queries: SQLite has no INCLUDE, so the columns
+-- they read are trailing key columns (see sql/12_fact_indexes.sql)
+CREATE INDEX IF NOT EXISTS IX_internet_speeds_measured_at_utc
+    ON internet_speeds (measured_at_utc, server_id, download_mbps, upload_mbps, latency_ms, jitter_ms);
+
+CREATE TABLE IF NOT EXISTS hourly_speeds (
+    hour_bucket            TEXT            NOT NULL,
+    server_id              INTEGER         NOT NULL,   -- 0 = all servers
+    samples                INTEGER         NOT NULL,
+    median_download_mbps   REAL            NOT NULL,
+    median_upload_mbps     REAL            NOT NULL,
+    median_latency_ms      REAL,
+    refreshed_at_utc       TEXT            DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    PRIMARY KEY (hour_bucket, server_id)
+);
+
+-- t-digests per hour and server (sketches.py, sql/14_hourly_sketches.sql)
+CREATE TABLE IF NOT EXISTS hourly_sketches (
+    hour_bucket            TEXT            NOT NULL,
+    server_id              INTEGER         NOT NULL,   -- 0 = all servers
+    samples                INTEGER         NOT NULL,
+    download_digest        BLOB            NOT NULL,
+    upload_digest          BLOB            NOT NULL,
+    latency_digest         BLOB            NOT NULL,
+    refreshed_at_utc       TEXT            DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    PRIMARY KEY (hour_bucket, server_id)
+);
+
+-- written by sla.py's table sink (sql/16_sla_alerts.sql)
+CREATE TABLE IF NOT EXISTS sla_alerts (
+    alert_id               INTEGER         PRIMARY KEY AUTOINCREMENT,
+    raised_at_utc          TEXT            NOT NULL,
+    measured_at_utc        TEXT            NOT NULL,
+    kind                   TEXT            NOT NULL,   -- sla_breach, sla_resolved, latency_spike
+    scope                  TEXT            NOT NULL,   -- server or isp
+    alert_key              TEXT            NOT NULL,   -- server id or ISP name
+    metric                 TEXT            NOT NULL,
+    value                  REAL            NOT NULL,
+    level                  REAL            NOT NULL,
+    threshold              REAL            NOT NULL,
+    result_id              TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_sla_alerts_measured_at_utc ON sla_alerts (measured_at_utc);
+
+CREATE TABLE IF NOT EXISTS result_samples (
+    result_id              TEXT            NOT NULL REFERENCES result_metadata(result_id),
+    phase                  TEXT            NOT NULL,
+    samples                INTEGER         NOT NULL,
+    elapsed_ms_f32         BLOB            NOT NULL,
+    value_f32              BLOB            NOT NULL,
+    PRIMARY KEY (result_id, phase)
+);
@@ -0,0 +1,10 @@
+SELECT
+    t.local_tz,
+    i.download_mbps,
+    i.upload_mbps,
+    i.latency_ms
+FROM internet_speeds i
+JOIN time_metadata t
+    ON i.measured_at_utc = t.time_id
+ORDER BY t.local_tz DESC
+LIMIT 1;
@@ -0,0 +1,5 @@
+SELECT
+    MIN(t.local_tz) AS min_dt,
+    MAX(t.local_tz) AS max_dt
+FROM
+    time_metadata t;
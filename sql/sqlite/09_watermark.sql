@@ -0,0 +1,8 @@
+WITH top_id AS (
+    SELECT MAX(i.id) AS watermark
+    FROM internet_speeds i
+)
+SELECT
+    t.watermark,
+    (SELECT COUNT(*) FROM internet_speeds i WHERE i.id > t.watermark - :overlap) AS recent
+FROM top_id t;
@@ -0,0 +1,32 @@
+SELECT
+    i.id,
+    i.result_id,
+    i.server_id,
+    i.measured_at_utc,
+    t.local_tz,
+    t.date_key,
+    t.year,
+    t.month,
+    t.day_of_week,
+    t.hour,
+    t.is_weekend,
+    t.is_holiday,
+    i.download_mbps,
+    i.upload_mbps,
+    i.latency_ms,
+    i.jitter_ms,
+    i.packet_loss_pct,
+    s.server_name,
+    s.server_location,
+    s.server_country,
+    s.isp,
+    s.server_latitude,
+    s.server_longitude
+FROM internet_speeds i
+JOIN time_metadata t
+    ON i.measured_at_utc = t.time_id
+JOIN servers s
+    ON i.server_id = s.server_id
+WHERE i.id > :after_id
+ORDER BY i.id
+LIMIT :batch_size;
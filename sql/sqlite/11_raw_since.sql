@@ -0,0 +1,13 @@
+SELECT
+    i.id,
+    t.local_tz,
+    i.download_mbps,
+    i.upload_mbps,
+    i.latency_ms,
+    i.jitter_ms
+FROM internet_speeds i
+JOIN time_metadata t
+    ON i.measured_at_utc = t.time_id
+WHERE i.id > :after_id AND i.id <= :upto_id
+    AND t.local_tz >= :start_dt AND t.local_tz < :end_dt
+ORDER BY t.local_tz;
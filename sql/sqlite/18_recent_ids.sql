@@ -0,0 +1,4 @@
+SELECT
+    i.id
+FROM internet_speeds i
+WHERE i.id > :after_id AND i.id <= :upto_id;
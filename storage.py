@@ -0,0 +1,408 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from rich.console import Console
+
+from samples import sample_rows
+from sketches import merge_sketches
+import sla
+from helpers import run_sql, load_sql_files, time_dim_frame, time_dim_rows, TIME_DIM_COLUMNS
+
+console = Console()
+
+PROJECT_DIR = Path.cwd()
+
+load_dotenv(PROJECT_DIR / ".env")
+
+# "sqlserver" (central database, the default) or "sqlite" (embedded, for edge probes)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlserver").lower()
+SQLITE_PATH = Path(os.getenv("STORAGE_SQLITE_PATH", PROJECT_DIR / "data" / "internet_speed.db"))
+
+# STORAGE_BACKEND=http: a probe without database credentials posts to ingest_service.py
+INGEST_URL = os.getenv("INGEST_URL", "http://127.0.0.1:8470").rstrip("/")
+INGEST_PROBE_ID = os.getenv("INGEST_PROBE_ID", "")
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")
+
+
+#==========================================================================
+#               SQL Server: the central database
+#==========================================================================
+class SqlServerStorage:
+    """
+    The original backend. Ingest goes through ingest.py (the
+    usp_ingest_result procedure) and dashboard queries through run_sql;
+    both use connections from the shared pool in db.py, which is imported
+    on first use so an edge probe on SQLite never loads pyodbc.
+    """
+    name = "sqlserver"
+    dialect = None
+
+    @property
+    def errors(self) -> tuple:
+        import pyodbc
+        from sqlalchemy.exc import SQLAlchemyError
+        # SQLAlchemyError covers a pool checkout that timed out
+        return (pyodbc.Error, SQLAlchemyError)
+
+    @property
+    def disconnect_errors(self) -> tuple:
+        import pyodbc
+        return (pyodbc.OperationalError,)
+
+    def connect(self):
+        from db import get_db_connection
+        return get_db_connection(exit_on_failure=False)
+
+    def warmup(self) -> int:
+        from db import warmup
+        return warmup()
+
+    def pool_stats(self) -> dict:
+        from db import pool_stats
+        return pool_stats()
+
+    def ping(self, conn):
+        conn.cursor().execute("SELECT 1").fetchone()
+
+    def load_batch(self, rows: list[dict], conn) -> int:
+        from ingest import load_batch_to_sql
+        return load_batch_to_sql(rows, conn)
+
+    def load_one(self, row: dict, conn) -> bool:
+        from ingest import load_to_sql
+        return load_to_sql(row, conn=conn)
+
+    @property
+    def engine(self):
+        from db import ENGINE
+        return ENGINE
+
+    def read_sql(self, filename: str, params: dict | None = None) -> pd.DataFrame:
+        return run_sql(self.engine, filename, params=params)
+
+
+#==========================================================================
+#               SQLite: embedded, no server and no network round trips
+#==========================================================================
+def _sqlite_datetime(value: datetime) -> str:
+    # keep the wall time and drop the offset, as pyodbc does for DATETIME2
+    return value.replace(tzinfo=None).isoformat(sep=" ", timespec="milliseconds")
+
+
+sqlite3.register_adapter(datetime, _sqlite_datetime)
+
+# the facts a batch inserted: SQLite has one writer, so with AUTOINCREMENT
+# they are exactly the ids above the highest one before the insert
+SQLITE_NEW_FACTS = """
+    SELECT i.result_id, t.local_tz, i.server_id, i.download_mbps, i.upload_mbps, i.latency_ms
+    FROM internet_speeds i JOIN time_metadata t ON i.measured_at_utc = t.time_id
+    WHERE i.id > ?
+"""
+
+
+def _register_timestamp_adapter():
+    # adapters match the exact type, so pd.Timestamp needs its own; pandas
+    # is only imported once the SQLite backend is actually used
+    import pandas as pd
+    sqlite3.register_adapter(pd.Timestamp, lambda ts: _sqlite_datetime(ts.to_pydatetime()))
+
+
+class SqliteStorage:
+    """
+    Same schema (sql/sqlite/00_DDL.sql) and the same dashboard queries
+    (ported under sql/sqlite/) in a single local file. The T-SQL procedures
+    are replaced by INSERT OR IGNORE / ON CONFLICT statements; the hourly
+    rollup is recomputed for the hours each batch touched and the new facts
+    are merged into the sketches.
+    """
+    name = "sqlite"
+    dialect = "sqlite"
+    errors = (sqlite3.Error,)
+    disconnect_errors = (sqlite3.OperationalError,)
+
+    def __init__(self, path: Path = SQLITE_PATH):
+        self.path = Path(path)
+        self._engine = None
+
+    def connect(self) -> sqlite3.Connection:
+        _register_timestamp_adapter()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.executescript(load_sql_files("00_DDL.sql", self.dialect))
+        return conn
+
+    def warmup(self) -> int:
+        self.connect().close()
+        return 1
+
+    def pool_stats(self) -> dict:
+        # a file, not a server: nothing is pooled
+        return {}
+
+    def ping(self, conn):
+        conn.execute("SELECT 1").fetchone()
+
+    def load_one(self, row: dict, conn) -> bool:
+        try:
+            # 0 means the result_id was already stored: loaded all the same
+            self.load_batch([row], conn)
+            return True
+        except sqlite3.Error as e:
+            console.print(f"[bold red]Database Error: {e}[/]")
+            return False
+
+    def load_batch(self, rows: list[dict], conn: sqlite3.Connection) -> int:
+        """_summary_
+        Insert transformed rows in one transaction, idempotent on result_id
+
+        Raises:
+            sqlite3.Error: after rolling back, like ingest.load_batch_to_sql
+
+        Returns:
+            int: number of rows inserted; result_ids already stored are not counted
+        """
+        if not rows:
+            return 0
+
+        frame = time_dim_frame(r["measured_at_utc"] for r in rows)
+        # the connection context manager commits, or rolls back and re-raises
+        with conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO time_metadata ({', '.join(TIME_DIM_COLUMNS)}) "
+                f"VALUES ({', '.join(['?'] * len(TIME_DIM_COLUMNS))})",
+                time_dim_rows(frame),
+            )
+            conn.executemany("""
+                INSERT INTO servers (
+                    server_id, server_name, server_host, server_location, server_country,
+                    server_ip, server_port, server_latitude, server_longitude, isp
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (server_id) DO UPDATE SET
+                    server_name      = excluded.server_name,
+                    server_host      = excluded.server_host,
+                    server_location  = excluded.server_location,
+                    server_country   = excluded.server_country,
+                    server_ip        = excluded.server_ip,
+                    server_port      = excluded.server_port,
+                    server_latitude  = COALESCE(excluded.server_latitude, servers.server_latitude),
+                    server_longitude = COALESCE(excluded.server_longitude, servers.server_longitude),
+                    isp              = excluded.isp,
+                    last_seen_utc    = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            """, [(
+                r["server_id"], r["server_name"], r["server_host"], r["server_location"],
+                r["server_country"], r["server_ip"], r["server_port"],
+                r["server_latitude"], r["server_longitude"], r["isp"],
+            ) for r in rows])
+            conn.executemany("""
+                INSERT OR IGNORE INTO result_metadata (result_id, result_url, result_persisted, measured_at_utc)
+                VALUES (?, ?, ?, ?)
+            """, [(r["result_id"], r["result_url"], r["result_persisted"], r["measured_at_utc"]) for r in rows])
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM internet_speeds").fetchone()[0]
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT OR IGNORE INTO internet_speeds (
+                    result_id, server_id, measured_at_utc,
+                    download_mbps, upload_mbps, latency_ms, jitter_ms, packet_loss_pct
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(
+                r["result_id"], r["server_id"], r["measured_at_utc"],
+                r["download_mbps"], r["upload_mbps"], r["latency_ms"], r["jitter_ms"], r["packet_loss_pct"],
+            ) for r in rows])
+            inserted = conn.total_changes - before
+
+            sample_params = [p[2:] for r in rows for p in sample_rows(r["result_id"], r.get("samples"))]
+            if sample_params:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO result_samples (result_id, phase, samples, elapsed_ms_f32, value_f32) VALUES (?, ?, ?, ?, ?)",
+                    sample_params,
+                )
+
+            self.refresh_hours(conn, frame["local_tz"])
+            new = conn.execute(SQLITE_NEW_FACTS, (last_id,)).fetchall()
+            merge_sketches(conn, [fact[1:] for fact in new], dialect=self.dialect)
+
+        console.print(f"[green bold]Saved {inserted} new of a batch of {len(rows)} speed test results to SQLite[/]")
+        # the first row of each new result_id is the one INSERT OR IGNORE kept
+        new_ids, new_rows = {fact[0] for fact in new}, []
+        for r in rows:
+            if r["result_id"] in new_ids:
+                new_ids.discard(r["result_id"])
+                new_rows.append(r)
+        sla.observe(new_rows)
+        return inserted
+
+    def refresh_hours(self, conn: sqlite3.Connection, local_times) -> None:
+        """ recompute hourly_speeds for the local hours in local_times """
+        import pandas as pd
+
+        hours = pd.Series(pd.to_datetime(list(local_times))).dt.tz_localize(None).dt.floor("h").drop_duplicates()
+        if hours.empty:
+            return
+        lo, hi = hours.min(), hours.max() + pd.Timedelta(hours=1)
+
+        raw = pd.read_sql("""
+            SELECT t.local_tz, i.server_id, i.download_mbps, i.upload_mbps, i.latency_ms
+            FROM internet_speeds i JOIN time_metadata t ON i.measured_at_utc = t.time_id
+            WHERE t.local_tz >= ? AND t.local_tz < ?
+        """, conn, params=(_sqlite_datetime(lo.to_pydatetime()), _sqlite_datetime(hi.to_pydatetime())))
+        raw["hour_bucket"] = pd.to_datetime(raw["local_tz"]).dt.floor("h")
+        raw = raw[raw["hour_bucket"].isin(hours)]
+
+        metrics = ["download_mbps", "upload_mbps", "latency_ms"]
+        per_server = raw.groupby(["hour_bucket", "server_id"])[metrics].agg(["median", "size"])
+        overall = raw.assign(server_id=0).groupby(["hour_bucket", "server_id"])[metrics].agg(["median", "size"])
+        rollup = pd.concat([per_server, overall])
+
+        conn.executemany(
+            "DELETE FROM hourly_speeds WHERE hour_bucket = ?",
+            [(_sqlite_datetime(h.to_pydatetime()),) for h in hours],
+        )
+        conn.executemany("""
+            INSERT INTO hourly_speeds (
+                hour_bucket, server_id, samples,
+                median_download_mbps, median_upload_mbps, median_latency_ms
+            ) VALUES (?, ?, ?, ?, ?, ?)
+        """, [(
+            _sqlite_datetime(hour.to_pydatetime()), int(server_id),
+            int(r[("download_mbps", "size")]),
+            float(r[("download_mbps", "median")]), float(r[("upload_mbps", "median")]),
+            None if pd.isna(r[("latency_ms", "median")]) else float(r[("latency_ms", "median")]),
+        ) for (hour, server_id), r in rollup.iterrows()])
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from sqlalchemy import create_engine
+            _register_timestamp_adapter()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._engine = create_engine(f"sqlite:///{self.path}", future=True)
+        return self._engine
+
+    def read_sql(self, filename: str, params: dict | None = None) -> pd.DataFrame:
+        return run_sql(self.engine, filename, params=params, dialect=self.dialect)
+
+
+#==========================================================================
+#               HTTP: a remote ingest service (ingest_service.py)
+#==========================================================================
+class ReadUnsupported(RuntimeError):
+    """ the backend cannot run dashboard queries (http only ingests) """
+
+
+class IngestRejected(Exception):
+    """ the service refused the rows themselves (bad data or credentials); retrying will not help """
+
+
+class IngestUnavailable(ConnectionError):
+    """ the service is down or shedding load (503/429); keep the rows and retry later """
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class IngestClient:
+    """ one probe's authenticated session with the ingest service; stdlib only """
+    def __init__(self, url: str, probe_id: str, token: str, timeout: float):
+        self.url = url
+        self.headers = {"X-Probe-Id": probe_id, "Authorization": f"Bearer {token}"}
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, body: bytes | None = None) -> dict:
+        from urllib.error import HTTPError
+        from urllib.request import Request, urlopen
+
+        headers = dict(self.headers)
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        try:
+            with urlopen(Request(self.url + path, data=body, headers=headers, method=method), timeout=self.timeout) as r:
+                return json.loads(r.read() or b"{}")
+        except HTTPError as e:
+            detail = e.read().decode(errors="replace")[:200]
+            if e.code in (429, 502, 503, 504):
+                retry_after = e.headers.get("Retry-After")
+                raise IngestUnavailable(f"{e.code} {detail}", float(retry_after) if retry_after else None) from e
+            raise IngestRejected(f"{e.code} {detail}") from e
+
+    def close(self):
+        pass
+
+
+class HttpStorage:
+    """
+    Ingest-only backend for a probe in a fleet. Rows go to ingest_service.py
+    as JSON, in the same encoding the spool uses. The service acknowledges
+    only after its group commit, so the spool deletes nothing that is not
+    in the database. A busy or unreachable service counts as a disconnect,
+    so the rows stay spooled until the next replay.
+    """
+    name = "http"
+    dialect = None
+    errors = (OSError, IngestRejected)
+    # URLError, timeouts and IngestUnavailable are all OSErrors
+    disconnect_errors = (OSError,)
+
+    def __init__(self, url: str = INGEST_URL, probe_id: str = INGEST_PROBE_ID, token: str = INGEST_TOKEN,
+                 timeout: float = 30):
+        self.url = url.rstrip("/")
+        self.probe_id = probe_id
+        self.token = token
+        self.timeout = timeout
+
+    def connect(self) -> IngestClient:
+        return IngestClient(self.url, self.probe_id, self.token, self.timeout)
+
+    def warmup(self) -> int:
+        self.ping(self.connect())
+        return 1
+
+    def pool_stats(self) -> dict:
+        return {}
+
+    def ping(self, conn: IngestClient):
+        conn.request("GET", "/healthz")
+
+    def load_batch(self, rows: list[dict], conn: IngestClient) -> int:
+        from spool import encode_row
+
+        if not rows:
+            return 0
+        body = ('{"rows": [' + ", ".join(encode_row(r) for r in rows) + "]}").encode()
+        # rows the service has committed or already had; it does not say which
+        return int(conn.request("POST", "/v1/results", body)["accepted"])
+
+    def load_one(self, row: dict, conn: IngestClient) -> bool:
+        try:
+            self.load_batch([row], conn)
+            return True
+        except IngestRejected as e:
+            console.print(f"[bold red]Ingest service rejected {row.get('result_id')}: {e}[/]")
+            return False
+
+    def read_sql(self, filename: str, params: dict | None = None):
+        raise ReadUnsupported("the http backend only ingests; dashboards read the central database")
+
+
+def get_storage(name: str = STORAGE_BACKEND):
+    """_summary_
+    The configured storage backend
+
+    Args:
+        name (str): "sqlserver", "sqlite" or "http"; STORAGE_BACKEND by default
+
+    Raises:
+        ValueError: for an unknown backend name
+    """
+    if name == "sqlserver":
+        return SqlServerStorage()
+    if name == "sqlite":
+        return SqliteStorage()
+    if name == "http":
+        return HttpStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {name!r} - use 'sqlserver', 'sqlite' or 'http'")
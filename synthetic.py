@@ -0,0 +1,320 @@
+"""
+Synthetic multi-probe history for load and dashboard testing.
+
+    python synthetic.py --rows 10000000 --probes 40 --backend sqlite
+    python synthetic.py --years 3 --probes 5 --every-min 15 --backend sqlserver
+    python synthetic.py --rows 200000 --no-load        # just print what would be loaded
+
+Rows have the shape speedtest.transform produces and go through the
+backend's own load_batch, so the time, server, result, fact and rollup
+tables are all filled exactly as by real ingest. The same --seed always
+produces the same rows, so query and rendering timings can be repeated.
+
+The model:
+    - each probe is on one ISP plan (promised down/up Mbps, contention) and
+      tests its own set of servers in turn every --every-min minutes
+    - diurnal congestion: an evening peak around 20:30 local time, a smaller
+      lunchtime one, and busier weekend daytimes
+    - promise violations: days-long degraded episodes per ISP where capacity
+      drops to 20-60% of the plan, on top of the congestion
+    - outages: ISP-wide and per-probe windows in which tests fail, which leaves
+      gaps, as a real failed speedtest does
+    - latency from server distance plus bufferbloat under load; jitter and
+      packet loss rise with congestion
+
+The schema has no probe column, so a probe shows up as its ISP and servers:
+every probe gets its own synthetic server ids (from SYNTHETIC_SERVER_BASE).
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+from rich.console import Console
+
+console = Console()
+load_dotenv()
+
+SYNTHETIC_BATCH_SIZE = int(os.getenv("SYNTHETIC_BATCH_SIZE", "20000"))
+
+# well above Ookla's server ids, so synthetic servers never collide with real ones
+SYNTHETIC_SERVER_BASE = 9_000_000
+
+# Africa/Maseru has no DST
+LOCAL_UTC_OFFSET_H = 2
+
+# (isp, promised down Mbps, promised up Mbps, contention 0..1)
+ISP_PLANS = (
+    ("Econet Telecom Lesotho", 20.0, 5.0, 0.55),
+    ("Vodacom Lesotho", 30.0, 10.0, 0.45),
+    ("Lesotho Fibre", 100.0, 50.0, 0.20),
+    ("Budget LTE", 10.0, 2.0, 0.70),
+)
+
+# (city, country, latitude, longitude, base latency ms from Maseru)
+SERVER_CITIES = (
+    ("Maseru", "Lesotho", -29.3151, 27.4869, 6.0),
+    ("Bloemfontein", "South Africa", -29.0852, 26.1596, 11.0),
+    ("Johannesburg", "South Africa", -26.2041, 28.0473, 16.0),
+    ("Durban", "South Africa", -29.8587, 31.0218, 19.0),
+    ("Cape Town", "South Africa", -33.9249, 18.4241, 28.0),
+    ("Gaborone", "Botswana", -24.6282, 25.9231, 34.0),
+)
+
+# expected episodes per 30 days and their typical length in hours
+ISP_OUTAGES_PER_MONTH, ISP_OUTAGE_HOURS = 0.6, 3.0
+PROBE_OUTAGES_PER_MONTH, PROBE_OUTAGE_HOURS = 1.5, 1.0
+DEGRADED_PER_MONTH, DEGRADED_HOURS = 0.8, 40.0
+
+
+#==========================================================================
+#               the fleet: probes, their plans and servers
+#==========================================================================
+def fleet(probes: int, servers_per_probe: int, seed: int) -> list[dict]:
+    """ one dict per probe: its plan and the server rows it tests against """
+    rng = np.random.default_rng([seed, 0])
+    out = []
+    for p in range(probes):
+        isp, down, up, contention = ISP_PLANS[p % len(ISP_PLANS)]
+        servers = []
+        for j in range(servers_per_probe):
+            city, country, lat, lon, base_ms = SERVER_CITIES[rng.integers(len(SERVER_CITIES))]
+            server_id = SYNTHETIC_SERVER_BASE + p * 100 + j
+            servers.append({
+                "server_id": server_id,
+                "server_name": f"Synthetic {city} {j + 1}",
+                "server_host": f"syn{server_id}.speedtest.invalid",
+                "server_location": city,
+                "server_country": country,
+                "server_ip": f"10.{p // 256 % 256}.{p % 256}.{j + 1}",
+                "server_port": 8080,
+                "server_latitude": round(lat + rng.normal(0, 0.05), 6),
+                "server_longitude": round(lon + rng.normal(0, 0.05), 6),
+                "isp": isp,
+                "base_latency_ms": base_ms * rng.uniform(0.8, 1.3),
+            })
+        out.append({
+            "probe": p, "isp_index": p % len(ISP_PLANS), "isp": isp,
+            "plan_down": down, "plan_up": up, "contention": contention,
+            # this line's share of the plan on a quiet night
+            "efficiency": rng.uniform(0.75, 0.98),
+            # seconds added to every slot, so no two probes share a timestamp
+            # (time_id is the time dimension's key)
+            "offset_sec": (p * 7) % (60 * 60),
+            "servers": servers,
+        })
+    return out
+
+
+def episodes(rng: np.random.Generator, span_min: float, per_month: float, mean_hours: float) -> np.ndarray:
+    """ random [start, end) windows in minutes from the start of the history, sorted """
+    n = rng.poisson(per_month * span_min / (30 * 24 * 60))
+    starts = np.sort(rng.uniform(0, span_min, n))
+    lengths = rng.lognormal(np.log(mean_hours * 60), 0.8, n)
+    return np.column_stack([starts, starts + lengths]) if n else np.empty((0, 2))
+
+
+def in_episode(t_min: np.ndarray, windows: np.ndarray) -> np.ndarray:
+    """ mask of the times that fall inside any window """
+    if not len(windows):
+        return np.zeros(len(t_min), dtype=bool)
+    # windows may overlap, so compare against the latest end of any window started so far
+    ends = np.maximum.accumulate(windows[:, 1])
+    i = np.searchsorted(windows[:, 0], t_min, side="right") - 1
+    ok = i >= 0
+    return ok & (t_min < np.where(ok, ends[np.clip(i, 0, None)], -np.inf))
+
+
+def congestion(local_hour: np.ndarray, weekend: np.ndarray) -> np.ndarray:
+    """ 0 (idle network) .. about 1 (evening peak) """
+    evening = np.exp(-(((local_hour - 20.5) / 2.2) ** 2))
+    lunch = 0.35 * np.exp(-(((local_hour - 13.0) / 1.5) ** 2))
+    daytime = np.where(weekend & (local_hour >= 9) & (local_hour <= 18), 0.25, 0.0)
+    return np.clip(evening + lunch + daytime, 0, 1)
+
+
+#==========================================================================
+#               rows, one time window at a time
+#==========================================================================
+def probe_rows(probe: dict, slots: np.ndarray, start: datetime, every_min: int,
+               isp_windows: dict, probe_windows: dict, seed: int, chunk: int) -> list[dict]:
+    """ transform-shaped rows for one probe's test slots, minus the ones inside an outage """
+    rng = np.random.default_rng([seed, 1, probe["probe"], chunk])
+    t_min = slots * every_min + probe["offset_sec"] / 60
+    ms = np.round(t_min * 60_000 + rng.integers(0, 1000, len(slots))).astype(np.int64)
+
+    outage_isp, degraded = isp_windows[probe["isp_index"]]
+    up_mask = ~(in_episode(t_min, outage_isp) | in_episode(t_min, probe_windows[probe["probe"]]))
+    if not up_mask.any():
+        return []
+    slots, t_min, ms = slots[up_mask], t_min[up_mask], ms[up_mask]
+    n = len(slots)
+
+    local = start + timedelta(hours=LOCAL_UTC_OFFSET_H)
+    local_min = t_min + local.hour * 60 + local.minute
+    local_hour = (local_min / 60) % 24
+    weekend = ((local.weekday() + (local_min // (24 * 60)).astype(int)) % 7) >= 5
+    load = congestion(local_hour, weekend) * probe["contention"]
+    capacity = np.where(in_episode(t_min, degraded), rng.uniform(0.2, 0.6, n), 1.0)
+
+    down = probe["plan_down"] * probe["efficiency"] * capacity * (1 - 0.9 * load) * rng.lognormal(0, 0.12, n)
+    up = probe["plan_up"] * probe["efficiency"] * capacity * (1 - 0.5 * load) * rng.lognormal(0, 0.10, n)
+    down = np.clip(down, 0.1, probe["plan_down"] * 1.05)
+    up = np.clip(up, 0.05, probe["plan_up"] * 1.05)
+
+    servers = probe["servers"]
+    which = slots % len(servers)
+    base = np.array([s["base_latency_ms"] for s in servers])[which]
+    latency = base + rng.gamma(2.0, 1.5, n) + load * rng.gamma(2.0, 25.0, n) + (capacity < 1) * rng.gamma(2.0, 10.0, n)
+    jitter = rng.gamma(2.0, 0.4 + 3.0 * load)
+    loss = np.where(rng.random(n) < 0.02 + 0.15 * load + 0.1 * (capacity < 1), rng.exponential(0.8, n), 0.0)
+
+    rows = []
+    for i in range(n):
+        server = servers[which[i]]
+        rows.append({
+            "measured_at_utc": start + timedelta(milliseconds=int(ms[i])),
+            "download_mbps": round(float(down[i]), 3),
+            "upload_mbps": round(float(up[i]), 3),
+            "latency_ms": round(float(latency[i]), 3),
+            "jitter_ms": round(float(jitter[i]), 3),
+            "packet_loss_pct": round(float(min(loss[i], 100.0)), 2),
+            "isp": server["isp"],
+            "server_id": server["server_id"],
+            "server_name": server["server_name"],
+            "server_location": server["server_location"],
+            "server_host": server["server_host"],
+            "server_country": server["server_country"],
+            "server_ip": server["server_ip"],
+            "server_port": server["server_port"],
+            "result_id": f"syn-{seed}-{probe['probe']:04d}-{int(slots[i]):09d}",
+            "result_url": None,
+            "result_persisted": False,
+            "server_latitude": server["server_latitude"],
+            "server_longitude": server["server_longitude"],
+        })
+    return rows
+
+
+def generate(rows: int | None = None, years: float = 1.0, probes: int = 10, servers_per_probe: int = 4,
+             every_min: int = 15, start: datetime | None = None, seed: int = 42,
+             batch_size: int = SYNTHETIC_BATCH_SIZE):
+    """_summary_
+    Yield batches of synthetic rows in time order across the whole fleet
+
+    Args:
+        rows (int | None): approximate total to generate (outages remove a few
+            percent); overrides years when given
+        years (float): history length when rows is not given
+        probes (int): independent probes
+        servers_per_probe (int): servers each probe rotates through
+        every_min (int): minutes between a probe's tests
+        start (datetime | None): first test slot, UTC; by default the history
+            ends now
+        seed (int): the same seed gives the same rows
+        batch_size (int): rows per yielded batch, roughly
+
+    Yields:
+        list[dict]: rows shaped like speedtest.transform output
+    """
+    if rows is not None:
+        slots_total = -(-rows // probes)
+    else:
+        slots_total = int(years * 365.25 * 24 * 60 / every_min)
+    span_min = slots_total * every_min
+    if start is None:
+        start = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(minutes=span_min)
+
+    probes_ = fleet(probes, servers_per_probe, seed)
+    rng = np.random.default_rng([seed, 2])
+    isp_windows = {
+        i: (episodes(rng, span_min, ISP_OUTAGES_PER_MONTH, ISP_OUTAGE_HOURS),
+            episodes(rng, span_min, DEGRADED_PER_MONTH, DEGRADED_HOURS))
+        for i in range(len(ISP_PLANS))
+    }
+    probe_windows = {p["probe"]: episodes(rng, span_min, PROBE_OUTAGES_PER_MONTH, PROBE_OUTAGE_HOURS) for p in probes_}
+
+    slots_per_chunk = max(1, batch_size // probes)
+    for chunk, first in enumerate(range(0, slots_total, slots_per_chunk)):
+        slots = np.arange(first, min(first + slots_per_chunk, slots_total))
+        batch = []
+        for probe in probes_:
+            batch.extend(probe_rows(probe, slots, start, every_min, isp_windows, probe_windows, seed, chunk))
+        batch.sort(key=lambda r: r["measured_at_utc"])
+        yield batch
+
+
+def summarise(batch: list[dict], stats: dict, plans: dict):
+    """ running totals for the report: volume and how often each ISP fell short of its plan """
+    for row in batch:
+        isp = stats.setdefault(row["isp"], {"rows": 0, "below_half_plan": 0})
+        isp["rows"] += 1
+        if row["download_mbps"] < 0.5 * plans[row["isp"]]:
+            isp["below_half_plan"] += 1
+
+
+def load(storage=None, **kwargs) -> dict:
+    """_summary_
+    Generate and bulk-load into a storage backend, one transaction per batch
+
+    Args:
+        storage: backend to load into, storage.get_storage() by default
+        **kwargs: passed on to generate()
+
+    Returns:
+        dict: rows loaded, elapsed seconds and rows/sec, per-ISP counts
+    """
+    from storage import get_storage
+
+    storage = storage or get_storage()
+    plans = {isp: down for isp, down, _, _ in ISP_PLANS}
+    per_isp: dict = {}
+    loaded = 0
+
+    started = time.perf_counter()
+    conn = storage.connect()
+    try:
+        for batch in generate(**kwargs):
+            if batch:
+                loaded += storage.load_batch(batch, conn)
+            summarise(batch, per_isp, plans)
+            elapsed = time.perf_counter() - started
+            console.print(f"[cyan]{loaded:,} rows, {loaded / elapsed:,.0f} rows/sec[/]")
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    return {"backend": storage.name, "rows": loaded, "seconds": round(elapsed, 1),
+            "rows_per_sec": round(loaded / elapsed) if elapsed else 0, "isps": per_isp}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, help="approximate total rows (overrides --years)")
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--probes", type=int, default=10)
+    parser.add_argument("--servers-per-probe", type=int, default=4)
+    parser.add_argument("--every-min", type=int, default=15)
+    parser.add_argument("--start", type=lambda s: datetime.fromisoformat(s).replace(tzinfo=timezone.utc),
+                        help="first test, UTC (default: the history ends now)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=SYNTHETIC_BATCH_SIZE)
+    parser.add_argument("--backend", help="sqlserver or sqlite (default: STORAGE_BACKEND)")
+    parser.add_argument("--no-load", action="store_true", help="generate and summarise only")
+    args = parser.parse_args()
+
+    options = dict(rows=args.rows, years=args.years, probes=args.probes, servers_per_probe=args.servers_per_probe,
+                   every_min=args.every_min, start=args.start, seed=args.seed, batch_size=args.batch_size)
+    if args.no_load:
+        plans = {isp: down for isp, down, _, _ in ISP_PLANS}
+        per_isp: dict = {}
+        total = 0
+        for batch in generate(**options):
+            total += len(batch)
+            summarise(batch, per_isp, plans)
+        console.print({"rows": total, "isps": per_isp})
+    else:
+        from storage import get_storage
+        console.print(load(get_storage(args.backend) if args.backend else None, **options))
@@ -0,0 +1,85 @@
+"""
+backfill.py checkpointing when the backend fails part-way through a chunk:
+files whose rows did not all commit must be read again on resume.
+"""
+import copy
+import json
+from pathlib import Path
+
+import pytest
+
+import backfill
+
+FIXTURE = Path(__file__).resolve().parents[1] / "benchmarks" / "fixtures" / "speedtest_result.json"
+
+
+class FlakyStorage:
+    """ loads one row at a time (a multi-row batch always fails, forcing the
+    row-by-row fallback) and raises for the result_ids in fail_ids """
+    name = "flaky"
+    disconnect_errors = (ConnectionError,)
+
+    def __init__(self, fail_ids=(), disconnect_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.disconnect_ids = set(disconnect_ids)
+        self.loaded: list[str] = []
+
+    def connect(self):
+        return self
+
+    def close(self):
+        pass
+
+    def load_batch(self, rows, conn):
+        if len(rows) > 1:
+            raise RuntimeError("batch rejected")
+        result_id = rows[0]["result_id"]
+        if result_id in self.disconnect_ids:
+            raise ConnectionError("server went away")
+        if result_id in self.fail_ids:
+            raise RuntimeError("row rejected")
+        self.loaded.append(result_id)
+        return 1
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "pre_enrich", lambda rows, network=True: 0)
+    raw = json.loads(FIXTURE.read_text())
+    results = tmp_path / "results"
+    results.mkdir()
+    for i in range(4):
+        doc = copy.deepcopy(raw)
+        doc["result"]["id"] = f"result-{i}"
+        (results / f"{i}.json").write_text(json.dumps(doc))
+    return results
+
+
+def run(source, storage, checkpoint):
+    return backfill.backfill(source, workers=1, files_per_batch=2, checkpoint=checkpoint, network=False,
+                             storage=storage)
+
+
+def test_disconnect_mid_chunk_is_not_checkpointed(source, tmp_path):
+    checkpoint = tmp_path / "backfill.json"
+    with pytest.raises(ConnectionError):
+        run(source, FlakyStorage(disconnect_ids={"result-3"}), checkpoint)
+
+    assert backfill.read_checkpoint(checkpoint) == {str(source / "0.json"), str(source / "1.json")}
+
+    resumed = FlakyStorage()
+    stats = run(source, resumed, checkpoint)
+    assert stats["files"] == 2
+    assert resumed.loaded == ["result-2", "result-3"]
+
+
+def test_file_with_a_failed_row_is_read_again(source, tmp_path):
+    checkpoint = tmp_path / "backfill.json"
+    stats = run(source, FlakyStorage(fail_ids={"result-1"}), checkpoint)
+
+    assert stats["failed_rows"] == 1
+    assert str(source / "1.json") not in backfill.read_checkpoint(checkpoint)
+
+    resumed = FlakyStorage()
+    run(source, resumed, checkpoint)
+    assert resumed.loaded == ["result-1"]